@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ICC', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='icc',
+            name='usage_synced_date',
+            field=models.CharField(blank=True, max_length=8, null=True, validators=[django.core.validators.RegexValidator(message='用量同步日期格式：yyyyMMdd', regex='^\\d{8}$')], verbose_name='用量同步日期'),
+        ),
+    ]
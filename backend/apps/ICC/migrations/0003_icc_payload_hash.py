@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ICC', '0002_icc_usage_synced_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='icc',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='BSS数据指纹'),
+        ),
+    ]
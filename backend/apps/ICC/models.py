@@ -212,6 +212,26 @@ class ICC(models.Model):
         verbose_name='创建时间'
     )
     
+    # 用量同步水位：各订阅已入库的最新用量日期中的最小值，增量拉取用量时从该日期（减去重叠窗口）开始
+    usage_synced_date = models.CharField(
+        max_length=8,
+        blank=True,
+        null=True,
+        validators=[RegexValidator(
+            regex=r'^\d{8}$',
+            message='用量同步日期格式：yyyyMMdd'
+        )],
+        verbose_name='用量同步日期'
+    )
+    
+    # BSS数据指纹：最近一次按BSS数据写入的字段的MD5，数据未变化时跳过写入；手工修改后清空
+    payload_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        null=True,
+        verbose_name='BSS数据指纹'
+    )
+    
     # Django时间戳
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
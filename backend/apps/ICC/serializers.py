@@ -123,3 +123,8 @@ class ICCUpdateSerializer(serializers.ModelSerializer):
         ]
         # ICCID不允许更新
         read_only_fields = ['iccid']
+    
+    def update(self, instance, validated_data):
+        """手工修改后清空BSS数据指纹，下次同步时按BSS数据重新写入"""
+        instance.payload_hash = None
+        return super().update(instance, validated_data)
@@ -176,6 +176,14 @@ class Subscription(models.Model):
         verbose_name='订阅变更原因'
     )
     
+    # BSS数据指纹：最近一次按BSS数据写入的字段的MD5，数据未变化时跳过写入；手工修改后清空
+    payload_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        null=True,
+        verbose_name='BSS数据指纹'
+    )
+    
     # Django时间戳
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
@@ -128,8 +128,11 @@ class Usage(models.Model):
         ]
     
     def save(self, *args, **kwargs):
-        """保存时自动填充subscriptionId"""
-        if self.subscription:
+        """保存时自动填充subscriptionId（只有外键ID且已填写subscriptionId时不再查询订阅）"""
+        if self._meta.get_field('subscription').is_cached(self):
+            if self.subscription:
+                self.subscriptionId = self.subscription.subscriptionId
+        elif self.subscription_id and not self.subscriptionId:
             self.subscriptionId = self.subscription.subscriptionId
         super().save(*args, **kwargs)
     
@@ -0,0 +1,78 @@
+"""
+本地BSS模拟服务管理命令
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from services.bss_stub import BSSStubServer, BSSDataGenerator, LatencyModel, STATS_PATH
+
+
+class Command(BaseCommand):
+    """
+    启动本地BSS模拟服务
+    
+    压测时将BSS_API_BASE_URL指向模拟服务，例如：
+        python manage.py bss_stub_server --port 8089 --latency lognormal:80,0.6 --error-rate 0.01 --rate-limit 500
+        BSS_API_BASE_URL=http://127.0.0.1:8089 python manage.py process_documents --process <DOCUMENT_ID>
+    """
+    help = '启动本地BSS模拟服务（签名校验、确定性数据、延迟/错误/限流注入）'
+    
+    def add_arguments(self, parser):
+        """添加命令参数"""
+        parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+        parser.add_argument('--port', type=int, default=8089, help='监听端口')
+        parser.add_argument(
+            '--latency',
+            default='fixed:0',
+            help='延迟分布（毫秒）：fixed:50 / uniform:20,200 / normal:100,30 / lognormal:80,0.6',
+        )
+        parser.add_argument('--error-rate', type=float, default=0.0, help='返回HTTP 503的比例（0~1）')
+        parser.add_argument(
+            '--business-error-rate',
+            type=float,
+            default=0.0,
+            help='返回业务错误码的比例（0~1，不可重试）',
+        )
+        parser.add_argument('--rate-limit', type=float, default=0.0, help='每秒最大请求数，超出返回HTTP 429，0表示不限流')
+        parser.add_argument('--usage-days', type=int, default=30, help='每个订阅生成的用量天数（截止到当天）')
+        parser.add_argument('--max-subscriptions', type=int, default=3, help='每个ICCID的最大订阅数')
+        parser.add_argument('--seed', type=int, default=None, help='延迟和错误注入的随机种子')
+    
+    def handle(self, *args, **options):
+        """启动服务"""
+        try:
+            latency = LatencyModel(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name in ('error_rate', 'business_error_rate'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} 必须在0~1之间")
+        
+        server = BSSStubServer(
+            (options['host'], options['port']),
+            app_id=getattr(settings, 'BSS_API_APP_ID', 'A10000000013'),
+            app_secret=getattr(settings, 'BSS_API_APP_SECRET', '0D13F9A39A024BBF930945221BDF5668'),
+            latency=latency,
+            error_rate=options['error_rate'],
+            business_error_rate=options['business_error_rate'],
+            rate_limit=options['rate_limit'],
+            generator=BSSDataGenerator(
+                usage_days=options['usage_days'],
+                max_subscriptions=options['max_subscriptions'],
+            ),
+            seed=options['seed'],
+        )
+        
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f"BSS模拟服务已启动: http://{host}:{port}"))
+        self.stdout.write(f"延迟分布: {latency.spec}，错误率: {options['error_rate']}，"
+                          f"业务错误率: {options['business_error_rate']}，限流: {options['rate_limit'] or '不限'}")
+        self.stdout.write(f"请求统计: http://{host}:{port}{STATS_PATH}")
+        
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"请求统计: {server.get_stats()}")
@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
 from apps.document.models import Document
+from services.circuit_breaker import BSSUnavailableError
 from services.document_handler import document_handler
 from tasks.document_scan import scan_and_process_documents, process_document
 
@@ -149,6 +150,10 @@ class Command(BaseCommand):
                     
         except Document.DoesNotExist:
             raise CommandError(f'文档不存在: {document_id}')
+        except BSSUnavailableError as e:
+            self.stdout.write(
+                self.style.WARNING(f'BSS接口熔断，文档已暂停，请稍后重试: {str(e)}')
+            )
     
     def handle_retry_failed(self, async_mode=False):
         """重试失败的文档"""
@@ -218,6 +223,7 @@ class Command(BaseCommand):
             status_color = {
                 'pending': 'yellow',
                 'processing': 'blue',
+                'paused': 'yellow',
                 'success': 'green',
                 'failed': 'red'
             }.get(doc.status, 'white')
@@ -236,6 +242,7 @@ class Command(BaseCommand):
         total = documents.count()
         pending = documents.filter(status='pending').count()
         processing = documents.filter(status='processing').count()
+        paused = documents.filter(status='paused').count()
         success = documents.filter(status='success').count()
         failed = documents.filter(status='failed').count()
         
@@ -243,5 +250,6 @@ class Command(BaseCommand):
         self.stdout.write(f'总计: {total}')
         self.stdout.write(f'待处理: {pending}')
         self.stdout.write(f'处理中: {processing}')
+        self.stdout.write(f'已暂停: {paused}')
         self.stdout.write(f'成功: {success}')
         self.stdout.write(f'失败: {failed}')
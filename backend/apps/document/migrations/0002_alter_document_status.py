@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('pending', '待处理'), ('processing', '处理中'), ('paused', '已暂停'), ('success', '处理成功'), ('failed', '处理失败')], default='pending', max_length=20, verbose_name='处理状态'),
+        ),
+    ]
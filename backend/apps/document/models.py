@@ -15,6 +15,7 @@ class Document(models.Model):
     STATUS_CHOICES = [
         ('pending', '待处理'),
         ('processing', '处理中'),
+        ('paused', '已暂停'),
         ('success', '处理成功'),
         ('failed', '处理失败'),
     ]
@@ -186,6 +187,18 @@ class Document(models.Model):
         if error_message:
             self.error_message = error_message
         self.save(update_fields=['status', 'processed_at', 'error_message', 'updated_at'])
+    
+    def mark_as_paused(self, error_message):
+        """暂停处理（BSS不可用）并重置进度，等待重新排队"""
+        self.status = 'paused'
+        self.error_message = error_message
+        self.processed_iccid_count = 0
+        self.success_iccid_count = 0
+        self.failed_iccid_count = 0
+        self.save(update_fields=[
+            'status', 'error_message', 'processed_iccid_count',
+            'success_iccid_count', 'failed_iccid_count', 'updated_at'
+        ])
 
 
 class BadCase(models.Model):
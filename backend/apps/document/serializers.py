@@ -114,6 +114,7 @@ class DocumentStatisticsSerializer(serializers.Serializer):
     total_documents = serializers.IntegerField()
     pending_documents = serializers.IntegerField()
     processing_documents = serializers.IntegerField()
+    paused_documents = serializers.IntegerField()
     success_documents = serializers.IntegerField()
     failed_documents = serializers.IntegerField()
     total_iccid_processed = serializers.IntegerField()
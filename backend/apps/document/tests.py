@@ -1,3 +1,69 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from apps.document.models import Document
+from services.api_clients import LANE_INTERACTIVE
+from services.circuit_breaker import BSSUnavailableError
+from tasks.document_scan import process_document, retry_failed_document
+
+
+class PausedDocumentTests(TestCase):
+    """BSS熔断时暂停与重新排队"""
+    
+    def setUp(self):
+        self.document = Document.objects.create(filename='cdr.csv', file_path='/tmp/missing/cdr.csv', file_size=1)
+    
+    def pause(self, document_id, lane=None):
+        """模拟处理过程中BSS熔断"""
+        error = BSSUnavailableError('BSS接口熔断中', retry_after=0)
+        Document.objects.get(id=document_id).mark_as_paused(str(error))
+        raise error
+    
+    def test_paused_document_is_distinct_from_pending(self):
+        self.document.processed_iccid_count = 5
+        self.document.mark_as_paused('BSS接口熔断中')
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'paused')
+        self.assertEqual(self.document.processed_iccid_count, 0)
+        self.assertEqual(self.document.error_message, 'BSS接口熔断中')
+    
+    @override_settings(BSS_CIRCUIT_MAX_REQUEUES=2)
+    def test_document_fails_when_requeues_are_exhausted(self):
+        with mock.patch('tasks.document_scan.document_handler.process_document', side_effect=self.pause) as handler:
+            result = process_document.apply(args=(self.document.id,))
+        
+        # 首次处理 + 2次重新排队
+        self.assertEqual(handler.call_count, 3)
+        self.assertIn('BSS持续不可用', result.get())
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'failed')
+        self.assertIn('重新排队2次后放弃', self.document.error_message)
+        self.assertIsNotNone(self.document.processed_at)
+
+
+class RetryFailedDocumentTests(TestCase):
+    """管理员重试失败文档"""
+    
+    def setUp(self):
+        self.document = Document.objects.create(filename='cdr.csv', file_path='/tmp/missing/cdr.csv', file_size=1,
+                                                status='failed', error_message='BSS接口熔断中')
+    
+    @override_settings(BSS_INTERACTIVE_QUEUE='interactive')
+    def test_retry_goes_to_interactive_queue_and_lane(self):
+        with mock.patch('tasks.document_scan.process_document.apply_async') as apply_async:
+            retry_failed_document.apply(args=(self.document.id,))
+        
+        apply_async.assert_called_once_with(
+            args=(self.document.id,), kwargs={'lane': LANE_INTERACTIVE}, queue='interactive'
+        )
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'pending')
+        self.assertIsNone(self.document.error_message)
+    
+    @override_settings(BSS_API_ASYNC_ENABLED=True)
+    def test_interactive_document_uses_sync_lane(self):
+        with mock.patch('tasks.document_scan.document_handler.process_document', return_value=True) as handler:
+            process_document.apply(args=(self.document.id,), kwargs={'lane': LANE_INTERACTIVE})
+        
+        handler.assert_called_once_with(self.document.id, LANE_INTERACTIVE)
@@ -128,6 +128,7 @@ def document_statistics(request):
     total_documents = Document.objects.count()
     pending_documents = Document.objects.filter(status='pending').count()
     processing_documents = Document.objects.filter(status='processing').count()
+    paused_documents = Document.objects.filter(status='paused').count()
     success_documents = Document.objects.filter(status='success').count()
     failed_documents = Document.objects.filter(status='failed').count()
     
@@ -170,6 +171,7 @@ def document_statistics(request):
         'total_documents': total_documents,
         'pending_documents': pending_documents,
         'processing_documents': processing_documents,
+        'paused_documents': paused_documents,
         'success_documents': success_documents,
         'failed_documents': failed_documents,
         'total_iccid_processed': total_iccid_processed,
@@ -236,17 +238,12 @@ def retry_failed_document(request, document_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 重置文档状态
-        document.status = 'pending'
-        document.error_message = None
-        document.processed_at = None
-        document.save()
+        from tasks.document_scan import retry_failed_document as retry_document_task
         
-        # 这里可以触发异步任务重新处理文档
-        # from .tasks import process_document_task
-        # process_document_task.delay(document.id)
+        # 由重试任务重置文档状态并重新提交处理（任务路由到交互队列，不排在批量导入之后）
+        task = retry_document_task.delay(document.id)
         
-        return Response({'message': '文档已加入重试队列'})
+        return Response({'message': '文档已加入重试队列', 'task_id': task.id})
         
     except Document.DoesNotExist:
         return Response(
@@ -270,14 +267,12 @@ def retry_badcase(request, badcase_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 增加重试次数
-        badcase.increment_retry()
+        from tasks.document_scan import retry_badcase as retry_badcase_task
         
-        # 这里可以触发异步任务重新处理该ICCID
-        # from .tasks import process_iccid_task
-        # process_iccid_task.delay(badcase.document.id, badcase.iccid, badcase.api_type)
+        # 由重试任务增加重试次数并重新处理该ICCID（任务路由到交互队列，BSS查询使用交互通道）
+        task = retry_badcase_task.delay(badcase.id)
         
-        return Response({'message': '错误案例已加入重试队列'})
+        return Response({'message': '错误案例已加入重试队列', 'task_id': task.id})
         
     except BadCase.DoesNotExist:
         return Response(
@@ -0,0 +1,52 @@
+"""
+监控指标视图
+"""
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt
+
+from services.bss_metrics import bss_metrics
+from services.concurrency_limiter import bss_concurrency_limiter
+
+
+def _allowed_networks():
+    """允许访问指标的内网地址段"""
+    networks = []
+    for value in getattr(settings, 'BSS_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1']):
+        try:
+            networks.append(ipaddress.ip_network(value, strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+def _is_internal_request(request) -> bool:
+    """请求是否来自允许的内网地址（只看直连地址，不信任X-Forwarded-For）"""
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in network for network in _allowed_networks())
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def bss_metrics_view(request):
+    """
+    BSS API调用指标（Prometheus文本格式），汇总所有worker的数据，并附各worker当前的自适应并发上限
+    
+    只允许BSS_METRICS_ALLOWED_IPS中的内网地址访问（Prometheus直连抓取）
+    """
+    if not _is_internal_request(request):
+        return HttpResponse("# 禁止访问\n", status=403, content_type='text/plain; charset=utf-8')
+    
+    try:
+        content = bss_metrics.render_prometheus() + bss_concurrency_limiter.render_prometheus()
+    except Exception as e:
+        return HttpResponse(f"# BSS指标读取失败: {str(e)}\n", status=503,
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
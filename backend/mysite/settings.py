@@ -258,6 +258,14 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# 管理员触发的重试任务（及其重新处理的文档）路由到独立的交互队列，不排在批量文档处理任务之后；
+# 需启动消费该队列的worker（如 celery -A mysite worker -Q interactive，批量worker消费默认的celery队列，
+# 或单个worker同时消费：-Q celery,interactive），设为空时重试任务仍进入默认队列
+BSS_INTERACTIVE_QUEUE = os.getenv('BSS_INTERACTIVE_QUEUE', 'interactive')
+CELERY_TASK_ROUTES = {
+    'tasks.document_scan.retry_badcase': {'queue': BSS_INTERACTIVE_QUEUE},
+    'tasks.document_scan.retry_failed_document': {'queue': BSS_INTERACTIVE_QUEUE},
+} if BSS_INTERACTIVE_QUEUE else {}
 
 # 邮件配置
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
@@ -275,8 +283,133 @@ SITE_URL = os.getenv('SITE_URL', 'http://localhost:3001')
 
 # BSS API配置
 BSS_API_BASE_URL = os.getenv('BSS_API_BASE_URL', 'https://202.77.19.198')
+# 多个BSS网关（逗号分隔，未配置时只使用BSS_API_BASE_URL）：按延迟EWMA和在途请求数选择网关，连接失败时切换到其他网关，
+# 连续失败（连接错误、超时、5xx）GATEWAY_FAILURE_THRESHOLD次的网关冷却GATEWAY_COOLDOWN秒
+BSS_API_BASE_URLS = [url.strip() for url in os.getenv('BSS_API_BASE_URLS', BSS_API_BASE_URL).split(',') if url.strip()]
+BSS_API_GATEWAY_FAILURE_THRESHOLD = int(os.getenv('BSS_API_GATEWAY_FAILURE_THRESHOLD', '3'))
+BSS_API_GATEWAY_COOLDOWN = float(os.getenv('BSS_API_GATEWAY_COOLDOWN', '30'))
+BSS_API_GATEWAY_PROBE_RATIO = float(os.getenv('BSS_API_GATEWAY_PROBE_RATIO', '0.02'))
 BSS_API_APP_ID = os.getenv('BSS_API_APP_ID', 'A10000000013')
 BSS_API_APP_SECRET = os.getenv('BSS_API_APP_SECRET', '0D13F9A39A024BBF930945221BDF5668')
+BSS_API_TIMEOUT = int(os.getenv('BSS_API_TIMEOUT', '30'))
+# BSS API连接池配置（每个进程一个keep-alive连接池，POOL_MAXSIZE应不小于BSS_API_MAX_CONCURRENT*3及BSS_API_CONCURRENCY_MAX_LIMIT，
+# 再加BSS_API_INTERACTIVE_MAX_CONCURRENT*3）
+BSS_API_POOL_CONNECTIONS = int(os.getenv('BSS_API_POOL_CONNECTIONS', '4'))
+BSS_API_POOL_MAXSIZE = int(os.getenv('BSS_API_POOL_MAXSIZE', '20'))
+BSS_API_POOL_BLOCK = os.getenv('BSS_API_POOL_BLOCK', 'False').lower() == 'true'
+# 同时在途的ICCID数（每个ICCID并行发起用户、订阅、用量三个查询）
+BSS_API_MAX_CONCURRENT = int(os.getenv('BSS_API_MAX_CONCURRENT', '5'))
+# 交互通道（错误案例重试）同时在途的ICCID数：使用独立线程池，并在自适应并发上限中预留对应名额，批量导入只使用剩余名额
+BSS_API_INTERACTIVE_MAX_CONCURRENT = int(os.getenv('BSS_API_INTERACTIVE_MAX_CONCURRENT', '2'))
+# 自适应并发上限中为交互通道预留的比例（预留名额最多BSS_API_INTERACTIVE_MAX_CONCURRENT*3，需不大于0.5）
+BSS_API_INTERACTIVE_RESERVE_RATIO = float(os.getenv('BSS_API_INTERACTIVE_RESERVE_RATIO', '0.25'))
+# 自适应并发控制：按延迟梯度和可重试失败（AIMD）调整每个进程同时在途的BSS请求数，
+# 启用后在途ICCID数随上限伸缩，BSS_API_MAX_CONCURRENT*3只作为初始上限；默认关闭，按BSS实际延迟和错误率调好阈值后再启用
+BSS_API_ADAPTIVE_CONCURRENCY_ENABLED = os.getenv('BSS_API_ADAPTIVE_CONCURRENCY_ENABLED', 'False').lower() == 'true'
+BSS_API_CONCURRENCY_INITIAL_LIMIT = int(os.getenv('BSS_API_CONCURRENCY_INITIAL_LIMIT', str(BSS_API_MAX_CONCURRENT * 3)))
+BSS_API_CONCURRENCY_MIN_LIMIT = int(os.getenv('BSS_API_CONCURRENCY_MIN_LIMIT', '3'))
+BSS_API_CONCURRENCY_MAX_LIMIT = int(os.getenv('BSS_API_CONCURRENCY_MAX_LIMIT', str(max(BSS_API_POOL_MAXSIZE, BSS_API_CONCURRENCY_INITIAL_LIMIT))))
+# 短期延迟超过长期基线该倍数时收缩上限；每个采样窗口（至少WINDOW_SAMPLES个样本）的可重试失败占比
+# 平滑后超过ERROR_THRESHOLD时上限乘以BACKOFF_RATIO
+BSS_API_CONCURRENCY_LATENCY_TOLERANCE = float(os.getenv('BSS_API_CONCURRENCY_LATENCY_TOLERANCE', '2.0'))
+BSS_API_CONCURRENCY_BACKOFF_RATIO = float(os.getenv('BSS_API_CONCURRENCY_BACKOFF_RATIO', '0.75'))
+BSS_API_CONCURRENCY_ERROR_THRESHOLD = float(os.getenv('BSS_API_CONCURRENCY_ERROR_THRESHOLD', '0.15'))
+BSS_API_CONCURRENCY_WINDOW_SAMPLES = int(os.getenv('BSS_API_CONCURRENCY_WINDOW_SAMPLES', '20'))
+# 重试策略：超时/连接错误/5xx/429及下列BSS响应码按指数退避加抖动重试，其余失败不重试
+BSS_API_MAX_RETRIES = int(os.getenv('BSS_API_MAX_RETRIES', '2'))
+BSS_API_RETRY_BASE_DELAY = float(os.getenv('BSS_API_RETRY_BASE_DELAY', '1'))
+BSS_API_RETRY_MAX_DELAY = float(os.getenv('BSS_API_RETRY_MAX_DELAY', '30'))
+BSS_API_RETRYABLE_CODES = [code.strip() for code in os.getenv('BSS_API_RETRYABLE_CODES', '').split(',') if code.strip()]
+# 集群限流（Redis令牌桶，所有worker共享额度；rate为每秒请求数，0表示不限）
+BSS_API_RATE_LIMIT_ENABLED = os.getenv('BSS_API_RATE_LIMIT_ENABLED', 'False').lower() == 'true'
+BSS_API_RATE_LIMITS = {
+    'user': {
+        'rate': float(os.getenv('BSS_API_RATE_LIMIT_USER', '50')),
+        'burst': float(os.getenv('BSS_API_RATE_LIMIT_USER_BURST', '50')),
+    },
+    'subscription': {
+        'rate': float(os.getenv('BSS_API_RATE_LIMIT_SUBSCRIPTION', '50')),
+        'burst': float(os.getenv('BSS_API_RATE_LIMIT_SUBSCRIPTION_BURST', '50')),
+    },
+    'usage': {
+        'rate': float(os.getenv('BSS_API_RATE_LIMIT_USAGE', '50')),
+        'burst': float(os.getenv('BSS_API_RATE_LIMIT_USAGE_BURST', '50')),
+    },
+}
+BSS_API_RATE_LIMIT_ACQUIRE_TIMEOUT = float(os.getenv('BSS_API_RATE_LIMIT_ACQUIRE_TIMEOUT', '30'))
+# 响应超过该耗时视为BSS变慢，触发自适应降速
+BSS_API_RATE_LIMIT_SLOW_SECONDS = float(os.getenv('BSS_API_RATE_LIMIT_SLOW_SECONDS', '5'))
+# 熔断器（状态保存在Redis，所有worker共享）：窗口期内请求数达到BSS_CIRCUIT_MIN_REQUESTS且
+# 可重试失败占比达到BSS_CIRCUIT_FAILURE_RATIO后打开，冷却后放行探测请求
+BSS_CIRCUIT_BREAKER_ENABLED = os.getenv('BSS_CIRCUIT_BREAKER_ENABLED', 'True').lower() == 'true'
+BSS_CIRCUIT_FAILURE_RATIO = float(os.getenv('BSS_CIRCUIT_FAILURE_RATIO', '0.5'))
+BSS_CIRCUIT_MIN_REQUESTS = int(os.getenv('BSS_CIRCUIT_MIN_REQUESTS', '20'))
+BSS_CIRCUIT_FAILURE_WINDOW = float(os.getenv('BSS_CIRCUIT_FAILURE_WINDOW', '60'))
+BSS_CIRCUIT_COOLDOWN = float(os.getenv('BSS_CIRCUIT_COOLDOWN', '60'))
+# 熔断期间文档重新排队的最大次数
+BSS_CIRCUIT_MAX_REQUEUES = int(os.getenv('BSS_CIRCUIT_MAX_REQUEUES', '20'))
+# 增量用量拉取：从ICC的用量同步日期前BSS_USAGE_OVERLAP_DAYS天开始查询，补录迟到的用量记录
+BSS_USAGE_INCREMENTAL_ENABLED = os.getenv('BSS_USAGE_INCREMENTAL_ENABLED', 'True').lower() == 'true'
+BSS_USAGE_OVERLAP_DAYS = int(os.getenv('BSS_USAGE_OVERLAP_DAYS', '3'))
+# 同步水位取各订阅最新用量日期的最小值；比最新订阅落后超过该天数的订阅视为已停用，不拖住水位
+BSS_USAGE_MAX_LAG_DAYS = int(os.getenv('BSS_USAGE_MAX_LAG_DAYS', '30'))
+# 响应缓存：用户、订阅查询结果缓存时间（秒），0表示不缓存；"未找到"响应按负缓存时间缓存
+BSS_API_CACHE_ENABLED = os.getenv('BSS_API_CACHE_ENABLED', 'True').lower() == 'true'
+BSS_API_CACHE_TTLS = {
+    'user': int(os.getenv('BSS_API_CACHE_TTL_USER', '21600')),
+    'subscription': int(os.getenv('BSS_API_CACHE_TTL_SUBSCRIPTION', '3600')),
+}
+BSS_API_CACHE_NEGATIVE_TTL = int(os.getenv('BSS_API_CACHE_NEGATIVE_TTL', '600'))
+BSS_API_NOT_FOUND_CODES = [code.strip() for code in os.getenv('BSS_API_NOT_FOUND_CODES', '').split(',') if code.strip()]
+# 请求合并：相同（接口、ICCID、参数）的并发查询跨worker共享一次调用；租约时间应大于BSS_API_TIMEOUT
+BSS_SINGLEFLIGHT_ENABLED = os.getenv('BSS_SINGLEFLIGHT_ENABLED', 'True').lower() == 'true'
+BSS_SINGLEFLIGHT_LEASE_TIMEOUT = int(os.getenv('BSS_SINGLEFLIGHT_LEASE_TIMEOUT', str(BSS_API_TIMEOUT + 5)))
+BSS_SINGLEFLIGHT_RESULT_TTL = int(os.getenv('BSS_SINGLEFLIGHT_RESULT_TTL', '5'))
+# 等待其他worker结果的最长时间（秒，不超过BSS_API_TIMEOUT的1/4），超时后直接调用，避免查询线程长时间轮询
+BSS_SINGLEFLIGHT_MAX_WAIT = float(os.getenv('BSS_SINGLEFLIGHT_MAX_WAIT', '2'))
+# 跨worker合并的API类型（逗号分隔）：只对可缓存的用户、订阅查询获取Redis租约，用量查询参数各异，不跨worker合并
+BSS_SINGLEFLIGHT_REMOTE_API_TYPES = [
+    api_type.strip() for api_type in os.getenv('BSS_SINGLEFLIGHT_REMOTE_API_TYPES', 'user,subscription').split(',')
+    if api_type.strip()
+]
+# 调用指标：按接口统计延迟、状态码、响应码等，汇总到Redis，经 /api/metrics/bss/ 以Prometheus格式导出
+BSS_METRICS_ENABLED = os.getenv('BSS_METRICS_ENABLED', 'True').lower() == 'true'
+BSS_METRICS_FLUSH_INTERVAL = int(os.getenv('BSS_METRICS_FLUSH_INTERVAL', '5'))
+# 允许访问 /api/metrics/bss/ 的地址或网段（逗号分隔，按直连地址判断），默认本机及内网
+BSS_METRICS_ALLOWED_IPS = [
+    value.strip() for value in os.getenv(
+        'BSS_METRICS_ALLOWED_IPS', '127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+    ).split(',') if value.strip()
+]
+# 运行模式：live直连BSS，record直连并录制响应，replay只从录制文件回放（不访问网络，也不读写响应缓存、不经过熔断和限流）
+BSS_API_MODE = os.getenv('BSS_API_MODE', 'live').lower()
+BSS_API_RECORD_PATH = os.getenv('BSS_API_RECORD_PATH', str(BASE_DIR / 'bss_recordings.sqlite3'))
+# 请求对冲：请求超过接口近期延迟的分位数（默认p95）仍未返回时再发起一个相同请求，取先返回者；
+# 对冲请求数不超过总请求数的BSS_API_HEDGE_MAX_RATIO，启用后连接池需为对冲预留连接
+BSS_API_HEDGE_ENABLED = os.getenv('BSS_API_HEDGE_ENABLED', 'False').lower() == 'true'
+BSS_API_HEDGE_PERCENTILE = float(os.getenv('BSS_API_HEDGE_PERCENTILE', '95'))
+BSS_API_HEDGE_MIN_DELAY = float(os.getenv('BSS_API_HEDGE_MIN_DELAY', '0.05'))
+BSS_API_HEDGE_MAX_RATIO = float(os.getenv('BSS_API_HEDGE_MAX_RATIO', '0.05'))
+BSS_API_HEDGE_MIN_SAMPLES = int(os.getenv('BSS_API_HEDGE_MIN_SAMPLES', '50'))
+# 批量写库：同步处理时每BSS_DB_WRITE_BATCH_SIZE个ICCID的结果合并写入，ICC等记录以多行upsert写入，
+# 每条INSERT语句最多BSS_DB_UPSERT_BATCH_SIZE行
+BSS_DB_WRITE_BATCH_SIZE = int(os.getenv('BSS_DB_WRITE_BATCH_SIZE', '100'))
+BSS_DB_UPSERT_BATCH_SIZE = int(os.getenv('BSS_DB_UPSERT_BATCH_SIZE', '500'))
+# 文档处理期间身份映射最多缓存的ICC、订阅等实例数（超过后按LRU淘汰）
+BSS_IDENTITY_MAP_MAX_SIZE = int(os.getenv('BSS_IDENTITY_MAP_MAX_SIZE', '10000'))
+# 文档处理流水线：获取阶段的并发由BSS_API_MAX_CONCURRENT（及自适应并发上限）控制，
+# 转换阶段BSS_PIPELINE_TRANSFORM_WORKERS个线程，写入阶段单线程每BSS_DB_WRITE_BATCH_SIZE个ICCID写入一次；
+# 阶段之间的队列容量为BSS_PIPELINE_QUEUE_SIZE
+BSS_PIPELINE_TRANSFORM_WORKERS = int(os.getenv('BSS_PIPELINE_TRANSFORM_WORKERS', '2'))
+BSS_PIPELINE_QUEUE_SIZE = int(os.getenv('BSS_PIPELINE_QUEUE_SIZE', '1000'))
+# 错误案例写入缓冲：缓存BSS_BADCASE_FLUSH_SIZE条或BSS_BADCASE_FLUSH_INTERVAL秒后批量写入，
+# 文档处理结束、每个Celery任务结束及进程退出时写入剩余数据
+BSS_BADCASE_FLUSH_SIZE = int(os.getenv('BSS_BADCASE_FLUSH_SIZE', '500'))
+BSS_BADCASE_FLUSH_INTERVAL = float(os.getenv('BSS_BADCASE_FLUSH_INTERVAL', '5'))
+# 异步处理模式：process_document任务改用AsyncBSSAPIClient
+BSS_API_ASYNC_ENABLED = os.getenv('BSS_API_ASYNC_ENABLED', 'False').lower() == 'true'
+BSS_API_ASYNC_MAX_IN_FLIGHT = int(os.getenv('BSS_API_ASYNC_MAX_IN_FLIGHT', '1000'))
+BSS_API_ASYNC_BATCH_SIZE = int(os.getenv('BSS_API_ASYNC_BATCH_SIZE', '500'))
 
 
 LOGGING = {
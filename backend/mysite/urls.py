@@ -21,10 +21,12 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from .health_views import health_check
+from .metrics_views import bss_metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health/', health_check, name='health_check'),
+    path('api/metrics/bss/', bss_metrics_view, name='bss_metrics'),
     
     # JWT认证端点
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -2,34 +2,118 @@
 BSS API客户端
 基于提供的API脚本封装
 """
+import asyncio
 import hashlib
-import json
+import logging
 import time
 import uuid
 import requests
 import os
-from typing import Dict, Any, Optional
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Iterable, Iterator, Tuple
+import aiohttp
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from django.conf import settings
 
+from .bss_cache import bss_response_cache
+from .bss_gateways import bss_gateway_pool, BSSGateway
+from .bss_metrics import bss_metrics, ERROR_TIMEOUT, ERROR_CONNECTION
+from .bss_recorder import bss_response_store, get_bss_api_mode, MODE_RECORD, MODE_REPLAY, REPLAY_MISS_ERROR
+from .bss_response import BSSResponse, REQUEST_ERROR, UNKNOWN_ERROR, SOURCE_REPLAY, SOURCE_LOCAL
+from .circuit_breaker import bss_circuit_breaker
+from .concurrency_limiter import bss_concurrency_limiter
+from .hedging import bss_hedging_policy, HedgeRace, LEG_PRIMARY, LEG_HEDGE
+from .rate_limiter import bss_rate_limiter
+from .singleflight import bss_singleflight
+from .retry_policy import RetryPolicy, RetryScheduler, RESULT_RETRYABLE
+
+logger = logging.getLogger(__name__)
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-class BSSAPIClient:
-    """BSS API客户端"""
+# BSS API端点
+USER_QUERY_ENDPOINT = "/bossapi/v3/business/user/query"
+SUBSCRIPTION_QUERY_ENDPOINT = "/bossapi/v3/business/subscription/query"
+DAILY_USAGE_QUERY_ENDPOINT = "/bossapi/v3/business/usage/query/daily"
+
+# API类型到端点的映射
+API_ENDPOINTS = {
+    'user': USER_QUERY_ENDPOINT,
+    'subscription': SUBSCRIPTION_QUERY_ENDPOINT,
+    'usage': DAILY_USAGE_QUERY_ENDPOINT,
+}
+
+# 当前线程正在参与的对冲竞速（race, leg），连接池取出连接时登记，以便落败时中止
+_hedge_context = threading.local()
+
+
+def _abort_connection(conn):
+    """
+    中止连接：关闭socket读写，阻塞在读取响应上的请求随即以连接错误返回，urllib3不会复用该连接
+    """
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _HedgeTrackingMixin:
+    """取出连接时登记到当前线程的对冲竞速"""
+    
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        leg = getattr(_hedge_context, 'leg', None)
+        if leg is not None:
+            race, name = leg
+            race.attach(name, lambda: _abort_connection(conn))
+        return conn
+
+
+class _HedgeHTTPConnectionPool(_HedgeTrackingMixin, HTTPConnectionPool):
+    pass
+
+
+class _HedgeHTTPSConnectionPool(_HedgeTrackingMixin, HTTPSConnectionPool):
+    pass
+
+
+class BaseBSSAPIClient:
+    """
+    BSS API客户端基类
+    提供同步与异步客户端共用的配置、签名和请求体构造
+    """
     
     def __init__(self):
         """
         初始化API客户端
         从Django设置中获取配置
         """
-        self.base_url = getattr(settings, 'BSS_API_BASE_URL', 'https://202.77.19.198')
         self.app_id = getattr(settings, 'BSS_API_APP_ID', 'A10000000013')
         self.app_secret = getattr(settings, 'BSS_API_APP_SECRET', '0D13F9A39A024BBF930945221BDF5668')
+        self.timeout = getattr(settings, 'BSS_API_TIMEOUT', 30)
         
-        # 确保base_url不以斜杠结尾
-        self.base_url = self.base_url.rstrip('/')
+        # 运行模式：live直连，record直连并录制响应，replay从录制文件回放
+        self.mode = get_bss_api_mode()
+        self.store = bss_response_store
+        # 请求对冲：慢请求超过接口近期延迟高分位后发起重复请求（回放模式不对冲）
+        self.hedging = bss_hedging_policy
+        # BSS网关：按延迟和健康状态选择，连接失败时切换
+        self.gateways = bss_gateway_pool
+    
+    @property
+    def base_url(self) -> str:
+        """首个网关地址（兼容单地址配置）"""
+        return self.gateways.gateways[0].url
         
     def _generate_signature(self, trans_id: str, timestamp: str) -> str:
         """
@@ -54,179 +138,1049 @@ class BSSAPIClient:
             'Content-Type': 'application/json'
         }
     
-    def _make_request(self, endpoint: str, request_body: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _new_trans_info() -> Tuple[str, str]:
+        """
+        生成事务ID和毫秒时间戳
+        """
+        return str(uuid.uuid4()), str(int(time.time() * 1000))
+    
+    @staticmethod
+    def _build_request_body(iccid: str, begin_date: str = None, end_date: str = None,
+                            usage_type: str = None) -> Dict[str, Any]:
+        """
+        构造按ICCID查询的请求体
+        """
+        request_body = {
+            "userIdentity": {
+                "iccid": iccid
+            }
+        }
+        
+        # 添加可选参数
+        if begin_date:
+            request_body["beginDate"] = begin_date
+        if end_date:
+            request_body["endDate"] = end_date
+        if usage_type:
+            request_body["usageType"] = usage_type
+        
+        return request_body
+    
+    def _replay_response(self, endpoint: str, request_body: Dict[str, Any], trans_id: str) -> BSSResponse:
+        """
+        回放模式：从录制文件返回响应，未录制的请求返回不可重试的错误
+        """
+        replayed = self.store.replay(endpoint, request_body)
+        if replayed is None:
+            return BSSResponse.failure(endpoint, REPLAY_MISS_ERROR, f"未找到录制的响应: {endpoint}",
+                                       trans_id, source=SOURCE_REPLAY, request_body=request_body)
+        
+        status_code, content = replayed
+        return BSSResponse.parse(endpoint, content, status_code, trans_id, request_body, source=SOURCE_REPLAY)
+    
+    def _hedge_delay(self, endpoint: str) -> Optional[float]:
+        """
+        获取本次请求的对冲延迟，不对冲时返回None
+        """
+        if self.mode == MODE_REPLAY:
+            return None
+        return self.hedging.hedge_delay(endpoint)
+    
+    def _failover(self, result: BSSResponse, gateway: BSSGateway, tried: list) -> bool:
+        """
+        连接错误（请求未到达网关）且还有未尝试的网关时，切换网关重发
+        """
+        tried.append(gateway)
+        if result.error_type != ERROR_CONNECTION or len(tried) >= len(self.gateways):
+            return False
+        logger.warning(f"BSS网关连接失败，切换到其他网关: {gateway.url} - {result.message}")
+        return True
+    
+    @staticmethod
+    def _is_answered(result: BSSResponse) -> bool:
+        """
+        是否收到了BSS的HTTP响应（超时、连接错误等未收到响应时，对冲中的另一个请求仍可能成功）
+        """
+        return result.status_code is not None
+
+
+class BSSAPIClient(BaseBSSAPIClient):
+    """BSS API客户端"""
+    
+    def __init__(self):
+        """
+        初始化API客户端
+        从Django设置中获取配置
+        """
+        super().__init__()
+        
+        # 连接池配置
+        self.pool_connections = getattr(settings, 'BSS_API_POOL_CONNECTIONS', 4)
+        self.pool_maxsize = getattr(settings, 'BSS_API_POOL_MAXSIZE', 20)
+        self.pool_block = getattr(settings, 'BSS_API_POOL_BLOCK', False)
+        
+        # 会话按进程创建，避免Celery prefork子进程共享父进程的socket
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._request_count = 0
+        
+        # 对冲：原请求在调用线程中发送，对冲请求由调度线程到期后提交到按进程创建的对冲线程池；
+        # 每个在途请求最多一个对冲，线程池大小由APIClientManager按各通道查询线程数设置
+        self.hedge_max_workers = self.pool_maxsize
+        self._hedge_scheduler = RetryScheduler(name='bss-hedge-scheduler')
+        self._hedge_executor = None
+        self._hedge_executor_pid = None
+    
+    def _get_session(self) -> requests.Session:
+        """
+        获取当前进程的HTTP会话（带keep-alive连接池）
+        """
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                        max_retries=0  # 重试由APIClientManager负责
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    if self.hedging.enabled:
+                        # 登记对冲竞速中各请求使用的连接，落败的请求被中止而不是占用线程直到返回
+                        adapter.poolmanager.pool_classes_by_scheme = {
+                            'http': _HedgeHTTPConnectionPool,
+                            'https': _HedgeHTTPSConnectionPool,
+                        }
+                    session.headers['Connection'] = 'keep-alive'
+                    session.verify = False  # 如果使用自签名证书，设置为False
+                    self._session = session
+                    self._session_pid = pid
+                    self._request_count = 0
+        return self._session
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计信息
+        
+        Returns:
+            Dict[str, Any]: 请求数、新建连接数、复用连接数及连接池命中率
+        """
+        new_connections = 0
+        pool_requests = 0
+        session = self._session
+        if session is not None and self._session_pid == os.getpid():
+            # http与https挂载的是同一个适配器，需去重
+            adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    new_connections += pool.num_connections
+                    pool_requests += pool.num_requests
+        
+        reused_connections = max(pool_requests - new_connections, 0)
+        return {
+            'requests': self._request_count,
+            'pool_requests': pool_requests,
+            'new_connections': new_connections,
+            'reused_connections': reused_connections,
+            'pool_hit_rate': round(reused_connections / pool_requests, 4) if pool_requests else 0.0,
+        }
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        """
+        获取当前进程的对冲线程池
+        """
+        pid = os.getpid()
+        if self._hedge_executor is None or self._hedge_executor_pid != pid:
+            with self._session_lock:
+                if self._hedge_executor is None or self._hedge_executor_pid != pid:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=self.hedge_max_workers,
+                        thread_name_prefix='bss-hedge'
+                    )
+                    self._hedge_executor_pid = pid
+        return self._hedge_executor
+    
+    def _make_request(self, endpoint: str, request_body: Dict[str, Any]) -> BSSResponse:
         """
         通用请求方法
+        启用对冲时，原请求在调用线程中发送；超过对冲延迟仍未返回且预算允许，则在对冲线程池中
+        再发起一个相同请求，取先收到响应者，落败的请求被中止
+        """
+        delay = self._hedge_delay(endpoint)
+        if delay is None:
+            return self._send(endpoint, request_body)
+        
+        race = HedgeRace()
+        self._hedge_scheduler.schedule(delay, lambda: self._start_hedge(race, endpoint, request_body))
+        result = self._send(endpoint, request_body, race, LEG_PRIMARY)
+        race.finish(LEG_PRIMARY, result, self._is_answered(result))
+        result, winner = race.wait()
+        if winner == LEG_HEDGE:
+            self.hedging.record_win()
+        return result
+    
+    def _start_hedge(self, race: HedgeRace, endpoint: str, request_body: Dict[str, Any]):
+        """
+        对冲延迟到期：原请求仍未返回且预算允许时提交对冲请求（在调度线程中执行）
+        """
+        if race.done or not self.hedging.try_acquire() or not race.start_hedge():
+            return
+        try:
+            self._get_hedge_executor().submit(self._run_hedge, race, endpoint, request_body)
+        except RuntimeError as e:
+            # 进程退出时线程池已关闭
+            race.finish(LEG_HEDGE, None, False)
+            logger.warning(f"提交对冲请求失败: {str(e)}")
+    
+    def _run_hedge(self, race: HedgeRace, endpoint: str, request_body: Dict[str, Any]):
+        """发送对冲请求并登记结果"""
+        result = self._send(endpoint, request_body, race, LEG_HEDGE)
+        race.finish(LEG_HEDGE, result, self._is_answered(result))
+    
+    def _send(self, endpoint: str, request_body: Dict[str, Any], race: HedgeRace = None,
+              leg: str = None) -> BSSResponse:
+        """
+        发送单个请求（每次发送使用新的事务ID和签名），连接失败时切换网关
+        参与对冲竞速时，落败被中止的请求不再切换网关
         """
         # 生成请求参数
-        trans_id = str(uuid.uuid4())
-        timestamp = str(int(time.time() * 1000))  # 毫秒时间戳
+        trans_id, timestamp = self._new_trans_info()
+        
+        if self.mode == MODE_REPLAY:
+            return self._replay_response(endpoint, request_body, trans_id)
         
         # 请求头
         headers = self._get_headers(trans_id, timestamp)
         
+        tried = []
+        while True:
+            gateway = self.gateways.acquire(tried)
+            result = self._post(gateway, endpoint, request_body, headers, trans_id, race, leg)
+            if (race is not None and race.is_aborted(leg)) or not self._failover(result, gateway, tried):
+                return result
+    
+    def _post(self, gateway: BSSGateway, endpoint: str, request_body: Dict[str, Any],
+              headers: Dict[str, str], trans_id: str, race: HedgeRace = None, leg: str = None) -> BSSResponse:
+        """
+        向指定网关发送请求，并将延迟和结果反馈给网关池
+        """
         # API端点
-        url = f"{self.base_url}{endpoint}"
+        url = f"{gateway.url}{endpoint}"
+        latency, failed = None, True
+        if race is not None:
+            _hedge_context.leg = (race, leg)
         
         try:
-            # 发送POST请求
-            response = requests.post(
+            # 发送POST请求（复用进程内连接池）
+            session = self._get_session()
+            with self._session_lock:
+                self._request_count += 1
+            started = time.monotonic()
+            response = session.post(
                 url=url,
                 headers=headers,
                 json=request_body,
-                timeout=30,
-                verify=False  # 如果使用自签名证书，设置为False
+                timeout=self.timeout
             )
+            latency = time.monotonic() - started
+            failed = response.status_code >= 500
+            self.hedging.observe(endpoint, latency)
             
             # 解析响应
-            result = response.json()
-            result['_request_info'] = {
-                'url': url,
-                'headers': headers,
-                'request_body': request_body,
-                'status_code': response.status_code,
-                'trans_id': trans_id
-            }
-            
-            return result
+            content = response.content
+            if self.mode == MODE_RECORD:
+                self.store.record(endpoint, request_body, response.status_code, content)
+            return BSSResponse.parse(endpoint, content, response.status_code, trans_id, request_body)
             
         except requests.exceptions.RequestException as e:
-            return {
-                "error": "请求异常",
-                "message": str(e),
-                "transId": trans_id,
-                "status_code": getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
-            }
-        except json.JSONDecodeError as e:
-            return {
-                "error": "响应解析异常",
-                "message": str(e),
-                "transId": trans_id
-            }
+            if race is not None and race.is_aborted(leg):
+                # 对冲中落败被中止，不计为网关失败
+                failed = False
+            return BSSResponse.failure(
+                endpoint, REQUEST_ERROR, str(e), trans_id,
+                status_code=getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None,
+                error_type=self._error_type(e),
+                request_body=request_body
+            )
         except Exception as e:
-            return {
-                "error": "未知异常",
-                "message": str(e),
-                "transId": trans_id
-            }
+            failed = False
+            return BSSResponse.failure(endpoint, UNKNOWN_ERROR, str(e), trans_id, request_body=request_body)
+        finally:
+            if race is not None:
+                _hedge_context.leg = None
+                race.detach(leg)
+            self.gateways.release(gateway, latency, failed)
+    
+    @staticmethod
+    def _error_type(e: requests.exceptions.RequestException) -> Optional[str]:
+        """
+        请求异常类型：超时、连接错误，其他返回None
+        """
+        if isinstance(e, requests.exceptions.Timeout):
+            return ERROR_TIMEOUT
+        if isinstance(e, requests.exceptions.ConnectionError):
+            return ERROR_CONNECTION
+        return None
     
-    def query_user_by_iccid(self, iccid: str) -> Dict[str, Any]:
+    def query_user_by_iccid(self, iccid: str) -> BSSResponse:
         """
         根据ICCID查询用户信息
         """
-        request_body = {
-            "userIdentity": {
-                "iccid": iccid
-            }
-        }
-        
-        return self._make_request("/bossapi/v3/business/user/query", request_body)
+        return self._make_request(USER_QUERY_ENDPOINT, self._build_request_body(iccid))
     
-    def query_subscriptions_by_iccid(self, iccid: str) -> Dict[str, Any]:
+    def query_subscriptions_by_iccid(self, iccid: str) -> BSSResponse:
         """
         根据ICCID查询订阅信息
         """
-        request_body = {
-            "userIdentity": {
-                "iccid": iccid
-            }
-        }
-        
-        return self._make_request("/bossapi/v3/business/subscription/query", request_body)
+        return self._make_request(SUBSCRIPTION_QUERY_ENDPOINT, self._build_request_body(iccid))
     
-    def query_daily_usage_by_iccid(self, iccid: str, begin_date: str = None, end_date: str = None, usage_type: str = None) -> Dict[str, Any]:
+    def query_daily_usage_by_iccid(self, iccid: str, begin_date: str = None, end_date: str = None, usage_type: str = None) -> BSSResponse:
         """
         根据ICCID查询日用量信息
         """
-        request_body = {
-            "userIdentity": {
-                "iccid": iccid
-            }
-        }
+        request_body = self._build_request_body(iccid, begin_date, end_date, usage_type)
+        return self._make_request(DAILY_USAGE_QUERY_ENDPOINT, request_body)
+
+
+class AsyncBSSAPIClient(BaseBSSAPIClient):
+    """
+    异步BSS API客户端
+    基于aiohttp，单个事件循环内可同时发起数千个请求；
+    会话绑定创建它的事件循环，需在同一个循环内使用并关闭（推荐async with）
+    """
+    
+    def __init__(self, max_in_flight: int = None):
+        """
+        初始化异步API客户端
         
-        # 添加可选参数
-        if begin_date:
-            request_body["beginDate"] = begin_date
-        if end_date:
-            request_body["endDate"] = end_date
-        if usage_type:
-            request_body["usageType"] = usage_type
+        Args:
+            max_in_flight: 最大在途请求数（连接数上限）
+        """
+        super().__init__()
+        self.max_in_flight = max_in_flight or getattr(settings, 'BSS_API_ASYNC_MAX_IN_FLIGHT', 1000)
+        self._session = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取异步HTTP会话（keep-alive连接池）
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_in_flight,
+                limit_per_host=self.max_in_flight,
+                ssl=False  # 如果使用自签名证书，设置为False
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+    
+    async def close(self):
+        """关闭会话及连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _make_request(self, endpoint: str, request_body: Dict[str, Any]) -> BSSResponse:
+        """
+        通用异步请求方法，签名、请求头、返回结构及对冲策略与BSSAPIClient一致
+        对冲时先收到响应者胜出，另一个请求被取消
+        """
+        delay = self._hedge_delay(endpoint)
+        if delay is None:
+            return await self._send(endpoint, request_body)
+        
+        primary = asyncio.ensure_future(self._send(endpoint, request_body))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedging.try_acquire():
+            return await primary
+        
+        hedge = asyncio.ensure_future(self._send(endpoint, request_body))
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if self._is_answered(result) or not pending:
+                        if task is hedge:
+                            self.hedging.record_win()
+                        return result
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _send(self, endpoint: str, request_body: Dict[str, Any]) -> BSSResponse:
+        """
+        发送单个异步请求，连接失败时切换网关
+        """
+        trans_id, timestamp = self._new_trans_info()
+        if self.mode == MODE_REPLAY:
+            return self._replay_response(endpoint, request_body, trans_id)
+        
+        headers = self._get_headers(trans_id, timestamp)
+        tried = []
+        while True:
+            gateway = self.gateways.acquire(tried)
+            result = await self._post(gateway, endpoint, request_body, headers, trans_id)
+            if not self._failover(result, gateway, tried):
+                return result
+    
+    async def _post(self, gateway: BSSGateway, endpoint: str, request_body: Dict[str, Any],
+                    headers: Dict[str, str], trans_id: str) -> BSSResponse:
+        """
+        向指定网关发送异步请求，并将延迟和结果反馈给网关池
+        """
+        url = f"{gateway.url}{endpoint}"
+        latency, failed = None, True
         
-        return self._make_request("/bossapi/v3/business/usage/query/daily", request_body)
+        try:
+            started = time.monotonic()
+            async with self._get_session().post(url, headers=headers, json=request_body) as response:
+                # 解析响应
+                content = await response.read()
+                latency = time.monotonic() - started
+                failed = response.status >= 500
+                self.hedging.observe(endpoint, latency)
+                if self.mode == MODE_RECORD:
+                    await asyncio.to_thread(self.store.record, endpoint, request_body, response.status, content)
+                return BSSResponse.parse(endpoint, content, response.status, trans_id, request_body)
+                
+        except asyncio.CancelledError:
+            # 对冲中落败的请求被取消，不计为网关失败
+            failed = False
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                error_type = ERROR_TIMEOUT
+            elif isinstance(e, aiohttp.ClientConnectionError):
+                error_type = ERROR_CONNECTION
+            else:
+                error_type = None
+            return BSSResponse.failure(
+                endpoint, REQUEST_ERROR, str(e) or e.__class__.__name__, trans_id,
+                status_code=getattr(e, 'status', None),
+                error_type=error_type,
+                request_body=request_body
+            )
+        except Exception as e:
+            failed = False
+            return BSSResponse.failure(endpoint, UNKNOWN_ERROR, str(e), trans_id, request_body=request_body)
+        finally:
+            self.gateways.release(gateway, latency, failed)
+    
+    async def query_user_by_iccid(self, iccid: str) -> BSSResponse:
+        """
+        根据ICCID查询用户信息
+        """
+        return await self._make_request(USER_QUERY_ENDPOINT, self._build_request_body(iccid))
+    
+    async def query_subscriptions_by_iccid(self, iccid: str) -> BSSResponse:
+        """
+        根据ICCID查询订阅信息
+        """
+        return await self._make_request(SUBSCRIPTION_QUERY_ENDPOINT, self._build_request_body(iccid))
+    
+    async def query_daily_usage_by_iccid(self, iccid: str, begin_date: str = None, end_date: str = None,
+                                         usage_type: str = None) -> BSSResponse:
+        """
+        根据ICCID查询日用量信息
+        """
+        request_body = self._build_request_body(iccid, begin_date, end_date, usage_type)
+        return await self._make_request(DAILY_USAGE_QUERY_ENDPOINT, request_body)
+
+
+# 每个ICCID需要查询的API类型（与BadCase.API_TYPE_CHOICES一致）
+API_TYPES = ('user', 'subscription', 'usage')
+
+# 乱序完成结果的缓存倍数（相对于在途ICCID窗口）
+REORDER_BUFFER_FACTOR = 4
+
+# 请求通道：交互通道（管理员触发的重试）使用独立线程池和预留的在途名额，批量通道（文档导入）使用剩余容量
+LANE_BULK = 'bulk'
+LANE_INTERACTIVE = 'interactive'
+LANES = (LANE_BULK, LANE_INTERACTIVE)
+
+
+class BSSQuery:
+    """
+    单个BSS查询的状态（跨重试尝试共享）
+    """
+    
+    __slots__ = ('api_type', 'iccid', 'usage_params', 'force_refresh', 'lane', 'attempt', 'future')
+    
+    def __init__(self, api_type: str, iccid: str, usage_params: Optional[Dict[str, str]] = None,
+                 force_refresh: bool = False, future: Optional[Future] = None, lane: str = LANE_BULK):
+        self.api_type = api_type
+        self.iccid = iccid
+        self.usage_params = usage_params
+        self.force_refresh = force_refresh
+        self.lane = lane
+        self.attempt = 0
+        self.future = future or Future()
 
 
 class APIClientManager:
     """
     API客户端管理器
     提供并发控制和重试机制
+    
+    启用自适应并发控制时，同时在途的BSS请求数由AdaptiveConcurrencyLimiter按延迟和错误率调整，
+    在途ICCID窗口随之伸缩；未启用时固定为max_concurrent个ICCID。
+    失败请求按RetryPolicy分类：永久失败立即返回，可重试失败按指数退避加抖动
+    交给RetryScheduler延迟重新提交，查询线程不会sleep，可继续处理其他ICCID。
+    相同（接口、ICCID、参数）的并发查询通过BSSSingleFlight合并为一次上游调用。
+    查询分为两个通道：交互通道（管理员触发的重试）使用独立线程池，并在自适应并发上限中预留名额
+    （随上限缩放，最多interactive_concurrent个ICCID的查询数）；批量通道只使用剩余名额，大文档导入时交互查询无需排队。
+    回放模式（BSS_API_MODE=replay）不经过以上缓存、合并、熔断和流控，直接从录制文件返回。
     """
     
-    def __init__(self, max_concurrent=5, max_retries=2, retry_delay=5):
+    def __init__(self, max_concurrent=5, max_retries=2, retry_delay=1, retry_max_delay=30, retryable_codes=None,
+                 interactive_concurrent=2):
         """
         初始化管理器
         
         Args:
-            max_concurrent: 最大并发数
+            max_concurrent: 最大并发ICCID数（未启用自适应并发控制时）
+            interactive_concurrent: 交互通道的最大并发ICCID数（预留名额）
             max_retries: 最大重试次数
-            retry_delay: 重试延迟（秒）
+            retry_delay: 首次重试的基础延迟（秒），之后指数增长
+            retry_max_delay: 单次重试延迟上限（秒）
+            retryable_codes: 可重试的BSS响应码（如限流、系统繁忙）
         """
         self.max_concurrent = max_concurrent
+        self.interactive_concurrent = interactive_concurrent
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.client = BSSAPIClient()
+        self.retry_policy = RetryPolicy(
+            max_retries=max_retries,
+            base_delay=retry_delay,
+            max_delay=retry_max_delay,
+            retryable_codes=retryable_codes
+        )
+        self.retry_scheduler = RetryScheduler()
+        self.rate_limiter = bss_rate_limiter
+        self.circuit_breaker = bss_circuit_breaker
+        self.response_cache = bss_response_cache
+        self.singleflight = bss_singleflight
+        self.metrics = bss_metrics
+        self.concurrency_limiter = bss_concurrency_limiter
+        # 每个在途查询最多一个对冲请求，对冲线程池与各通道查询线程池合计大小一致
+        self.client.hedge_max_workers = sum(self._max_in_flight(lane) for lane in LANES)
+        # 正在等待延迟重试的查询（不计入在途并发）
+        self._deferred = set()
+        # 各通道的查询数及等待并发名额的次数、时长
+        self._lane_stats = {lane: {'queries': 0, 'waits': 0, 'wait_time': 0.0} for lane in LANES}
+        self._lane_stats_lock = threading.Lock()
+        
+        # 线程池按进程、通道创建，每个ICCID的三个查询并行执行
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
     
-    def query_user_info(self, iccid: str) -> Dict[str, Any]:
+    def _get_executor(self, lane: str = LANE_BULK) -> ThreadPoolExecutor:
         """
-        查询用户信息（带重试机制）
+        获取当前进程指定通道的查询线程池
         """
-        for attempt in range(self.max_retries + 1):
-            result = self.client.query_user_by_iccid(iccid)
+        pid = os.getpid()
+        executor = self._executors.get(lane) if self._executor_pid == pid else None
+        if executor is None:
+            with self._executor_lock:
+                if self._executor_pid != pid:
+                    self._executors = {}
+                    self._executor_pid = pid
+                executor = self._executors.get(lane)
+                if executor is None:
+                    executor = self._executors[lane] = ThreadPoolExecutor(
+                        max_workers=self._max_in_flight(lane),
+                        thread_name_prefix=f'bss-api-{lane}'
+                    )
+        return executor
+    
+    def _max_in_flight(self, lane: str = LANE_BULK) -> int:
+        """
+        通道在途BSS请求数的最大可能值（决定查询线程池大小）
+        """
+        if lane == LANE_INTERACTIVE:
+            return self.interactive_concurrent * len(API_TYPES)
+        if self.concurrency_limiter.enabled:
+            return self.concurrency_limiter.max_limit
+        return self.max_concurrent * len(API_TYPES)
+    
+    def _iccid_window(self) -> int:
+        """
+        当前允许同时在途的批量ICCID数：自适应上限扣除交互预留名额后对应的ICCID数再多一个，
+        保证有足够请求探测上限能否继续增大
+        """
+        if self.concurrency_limiter.enabled:
+            available = self.concurrency_limiter.capacity(reserve=True)
+            return -(-available // len(API_TYPES)) + 1
+        return self.max_concurrent
+    
+    @staticmethod
+    def _is_replay(client: BaseBSSAPIClient) -> bool:
+        """
+        客户端是否处于回放模式
+        
+        回放与线上系统隔离：不读写共享的响应缓存、不跨worker合并，也不经过熔断器、限流器和并发限制器
+        （结果不反馈给它们），直接从录制文件返回；同一请求的录制响应唯一，失败时不重试。
+        """
+        return client.mode == MODE_REPLAY
+    
+    @staticmethod
+    def _query_client(client: BSSAPIClient, api_type: str, iccid: str,
+                      usage_params: Optional[Dict[str, str]] = None) -> BSSResponse:
+        """按API类型调用客户端"""
+        if api_type == 'user':
+            return client.query_user_by_iccid(iccid)
+        if api_type == 'subscription':
+            return client.query_subscriptions_by_iccid(iccid)
+        return client.query_daily_usage_by_iccid(iccid, **(usage_params or {}))
+    
+    @staticmethod
+    async def _query_client_async(client: AsyncBSSAPIClient, api_type: str, iccid: str,
+                                  usage_params: Optional[Dict[str, str]] = None) -> BSSResponse:
+        """按API类型调用异步客户端"""
+        if api_type == 'user':
+            return await client.query_user_by_iccid(iccid)
+        if api_type == 'subscription':
+            return await client.query_subscriptions_by_iccid(iccid)
+        return await client.query_daily_usage_by_iccid(iccid, **(usage_params or {}))
+    
+    def _call(self, query: 'BSSQuery') -> BSSResponse:
+        """
+        执行单次查询（不重试）
+        首次尝试优先读取响应缓存；其他worker正在查询相同的用户、订阅数据时等待其结果；
+        熔断打开时快速失败，否则获取集群限流令牌后调用；回放模式直接从录制文件返回
+        """
+        api_type, iccid = query.api_type, query.iccid
+        if self._is_replay(self.client):
+            return self._query_client(self.client, api_type, iccid, query.usage_params)
+        
+        if query.attempt == 0 and not query.force_refresh:
+            cached = self.response_cache.get(api_type, iccid)
+            if cached is not None:
+                return cached
+        
+        # 只有可共享接口的首次尝试跨worker合并，其余直接调用，不增加Redis往返
+        if not self.singleflight.shares_remotely(api_type, query.attempt):
+            return self._call_upstream(api_type, iccid, query.usage_params, query.attempt, query.lane)
+        
+        key = self.singleflight.make_key(api_type, iccid, query.usage_params)
+        shared, lease = self.singleflight.acquire(key)
+        if shared is not None:
+            return shared
+        
+        result = None
+        try:
+            result = self._call_upstream(api_type, iccid, query.usage_params, query.attempt, query.lane)
+        finally:
+            self.singleflight.publish(key, lease, self._shareable(result))
+        return result
+    
+    def _call_upstream(self, api_type: str, iccid: str, usage_params: Optional[Dict[str, str]] = None,
+                       attempt: int = 0, lane: str = LANE_BULK) -> BSSResponse:
+        """
+        经熔断器、限流器、并发限制器后调用BSS接口，并记录结果、写入响应缓存
+        """
+        if not self.circuit_breaker.allow(api_type):
+            return self._circuit_open_response(api_type)
+        if not self.rate_limiter.acquire(api_type):
+            return self._throttled_response(api_type)
+        # 批量通道为交互通道留出预留名额，交互通道可使用全部名额
+        reserve = lane == LANE_BULK
+        if not self.concurrency_limiter.try_acquire(reserve):
+            waited = time.monotonic()
+            acquired = self.concurrency_limiter.acquire(self.client.timeout, reserve)
+            self._record_lane_wait(lane, time.monotonic() - waited)
+            if not acquired:
+                return self._throttled_response(api_type)
+        
+        try:
+            started = time.monotonic()
+            result = self._query_client(self.client, api_type, iccid, usage_params)
             
-            # 检查是否成功
-            if result.get("code") == "0000":
-                return result
+            self._record_outcome(api_type, result, time.monotonic() - started, attempt)
+            self.concurrency_limiter.record(time.monotonic() - started, self._is_retryable(result))
+        finally:
+            self.concurrency_limiter.release()
+        self.response_cache.set(api_type, iccid, result)
+        return result
+    
+    def _record_lane_wait(self, lane: str, waited: float):
+        """记录通道等待并发名额的时长"""
+        with self._lane_stats_lock:
+            self._lane_stats[lane]['waits'] += 1
+            self._lane_stats[lane]['wait_time'] += waited
+    
+    def get_lane_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取当前进程各通道的查询数及等待并发名额的次数、累计时长（秒）
+        """
+        with self._lane_stats_lock:
+            return {
+                lane: dict(stats, wait_time=round(stats['wait_time'], 3))
+                for lane, stats in self._lane_stats.items()
+            }
+    
+    def _shareable(self, result: Optional[BSSResponse]) -> Optional[BSSResponse]:
+        """
+        可共享给其他worker的结果：成功或永久失败；可重试失败和熔断响应由等待方自行处理
+        """
+        if result is None or result.circuit_open or self._is_retryable(result):
+            return None
+        return result
+    
+    def _is_retryable(self, result: BSSResponse) -> bool:
+        """是否为可重试失败（超时、5xx、限流等，视为BSS过载信号）"""
+        return self.retry_policy.classify(result) == RESULT_RETRYABLE
+    
+    def _record_outcome(self, api_type: str, result: BSSResponse, latency: float, attempt: int = 0):
+        """
+        记录调用指标，并将调用结果反馈给限流器和熔断器
+        """
+        self.metrics.observe(API_ENDPOINTS[api_type], latency, result, attempt)
+        failed = self._is_retryable(result)
+        self.rate_limiter.record(api_type, failed, latency)
+        if failed:
+            self.circuit_breaker.record_failure(api_type)
+        else:
+            self.circuit_breaker.record_success(api_type)
+    
+    @staticmethod
+    def _circuit_open_response(api_type: str) -> BSSResponse:
+        """
+        熔断打开时的快速失败响应（不重试）
+        """
+        return BSSResponse.failure(
+            API_ENDPOINTS[api_type], "熔断", f"BSS {api_type} 接口熔断中",
+            circuit_open=True, source=SOURCE_LOCAL
+        )
+    
+    @staticmethod
+    def _throttled_response(api_type: str) -> BSSResponse:
+        """
+        本地限流等待超时的响应（按HTTP 429处理，可重试）
+        """
+        return BSSResponse.failure(
+            API_ENDPOINTS[api_type], REQUEST_ERROR, f"BSS {api_type} 接口限流等待超时",
+            status_code=429, source=SOURCE_LOCAL
+        )
+    
+    def submit_query(self, api_type: str, iccid: str, usage_params: Optional[Dict[str, str]] = None,
+                     force_refresh: bool = False, lane: str = LANE_BULK) -> Future:
+        """
+        提交单个查询（带重试机制）
+        
+        Args:
+            api_type: API类型（user/subscription/usage）
+            iccid: ICCID
+            usage_params: 用量查询的可选参数（begin_date/end_date/usage_type）
+            force_refresh: 是否跳过响应缓存
+            lane: 请求通道（bulk/interactive）
             
-            # 如果不是最后一次尝试，等待后重试
-            if attempt < self.max_retries:
-                time.sleep(self.retry_delay)
+        Returns:
+            Future: 最终结果（成功、永久失败或重试耗尽后的最后一次响应）
+        """
+        key = self.singleflight.make_key(api_type, iccid, usage_params)
+        # 强制刷新的查询不复用可能来自缓存的在途查询
+        if force_refresh:
+            key = f"{key}:refresh"
+        # 交互查询不加入批量通道的在途查询，避免排在批量线程池的队列之后
+        if lane != LANE_BULK:
+            key = f"{key}:{lane}"
+        future, leader = self.singleflight.join(key)
+        if not leader:
+            return future
         
-        return result
+        with self._lane_stats_lock:
+            self._lane_stats[lane]['queries'] += 1
+        query = BSSQuery(api_type, iccid, usage_params, force_refresh, future, lane)
+        query.future.set_running_or_notify_cancel()
+        self._submit_attempt(query)
+        return query.future
     
-    def query_subscription_info(self, iccid: str) -> Dict[str, Any]:
+    def _submit_attempt(self, query: 'BSSQuery'):
         """
-        查询订阅信息（带重试机制）
+        将一次查询尝试提交到线程池
+        """
+        self._deferred.discard(query.future)
+        try:
+            attempt_future = self._get_executor(query.lane).submit(self._call, query)
+        except Exception as e:
+            query.future.set_result(BSSResponse.failure(API_ENDPOINTS[query.api_type], UNKNOWN_ERROR, str(e)))
+            return
+        attempt_future.add_done_callback(lambda future: self._on_attempt_done(query, future))
+    
+    def _on_attempt_done(self, query: 'BSSQuery', attempt_future: Future):
+        """
+        查询尝试完成回调：成功或永久失败时结束，可重试时延迟重新提交
+        """
+        result = self._future_result(attempt_future, query.api_type)
+        
+        if not self._is_replay(self.client) and self.retry_policy.should_retry(result, query.attempt):
+            delay = self.retry_policy.compute_delay(query.attempt)
+            query.attempt += 1
+            logger.info(f"{query.api_type}查询可重试失败，{delay:.2f}秒后第{query.attempt}次重试: {query.iccid}")
+            self._deferred.add(query.future)
+            self.retry_scheduler.schedule(delay, lambda: self._submit_attempt(query))
+            return
+        
+        query.future.set_result(result)
+    
+    def submit_iccid_queries(self, iccid: str, usage_params: Optional[Dict[str, str]] = None,
+                             force_refresh: bool = False, lane: str = LANE_BULK,
+                             api_types: Iterable[str] = API_TYPES) -> Dict[str, Future]:
+        """
+        并行提交单个ICCID的用户、订阅、用量查询
+        
+        Args:
+            iccid: ICCID
+            usage_params: 用量查询的可选参数（begin_date/end_date/usage_type）
+            force_refresh: 是否跳过响应缓存
+            lane: 请求通道（bulk/interactive）
+            api_types: 要查询的API类型（默认全部）
+            
+        Returns:
+            Dict[str, Future]: API类型到Future的映射
+        """
+        return {
+            api_type: self.submit_query(api_type, iccid, usage_params, force_refresh, lane)
+            for api_type in api_types
+        }
+    
+    @staticmethod
+    def _future_result(future: Future, api_type: str) -> BSSResponse:
+        """
+        获取Future结果，异常转换为与_make_request一致的错误响应
+        """
+        try:
+            return future.result()
+        except Exception as e:
+            return BSSResponse.failure(API_ENDPOINTS[api_type], UNKNOWN_ERROR, str(e))
+    
+    def query_iccid(self, iccid: str, usage_params: Optional[Dict[str, str]] = None,
+                    force_refresh: bool = False, lane: str = LANE_BULK,
+                    api_types: Iterable[str] = API_TYPES) -> Dict[str, BSSResponse]:
+        """
+        并行查询单个ICCID的全部信息（或api_types指定的部分信息）
+        
+        Returns:
+            Dict[str, BSSResponse]: API类型到响应的映射
         """
+        futures = self.submit_iccid_queries(iccid, usage_params, force_refresh, lane, api_types)
+        return {api_type: self._future_result(future, api_type) for api_type, future in futures.items()}
+    
+    async def _query_async(self, client: AsyncBSSAPIClient, api_type: str, iccid: str,
+                           usage_params: Optional[Dict[str, str]] = None,
+                           force_refresh: bool = False) -> BSSResponse:
+        """
+        按API类型执行单个异步查询（带重试机制，退避等待不阻塞事件循环）；回放模式直接从录制文件返回
+        """
+        if self._is_replay(client):
+            return await self._query_client_async(client, api_type, iccid, usage_params)
+        
+        if not force_refresh and self.response_cache.is_cacheable(api_type):
+            cached = await asyncio.to_thread(self.response_cache.get, api_type, iccid)
+            if cached is not None:
+                return cached
+        
+        key = self.singleflight.make_key(api_type, iccid, usage_params)
         for attempt in range(self.max_retries + 1):
-            result = self.client.query_subscriptions_by_iccid(iccid)
+            shared, lease = None, None
+            if self.singleflight.shares_remotely(api_type, attempt):
+                shared, lease = await self.singleflight.acquire_async(key)
+            if shared is not None:
+                return shared
             
-            # 检查是否成功
-            if result.get("code") == "0000":
+            result = None
+            try:
+                result = await self._call_upstream_async(client, api_type, iccid, usage_params, attempt)
+            finally:
+                if lease:
+                    await asyncio.to_thread(self.singleflight.publish, key, lease, self._shareable(result))
+            
+            # 成功或永久失败直接返回，可重试失败退避后重试
+            if not self.retry_policy.should_retry(result, attempt):
                 return result
             
-            # 如果不是最后一次尝试，等待后重试
-            if attempt < self.max_retries:
-                time.sleep(self.retry_delay)
+            await asyncio.sleep(self.retry_policy.compute_delay(attempt))
         
         return result
     
-    def query_usage_info(self, iccid: str, begin_date: str = None, end_date: str = None, usage_type: str = None) -> Dict[str, Any]:
+    async def _call_upstream_async(self, client: AsyncBSSAPIClient, api_type: str, iccid: str,
+                                   usage_params: Optional[Dict[str, str]] = None,
+                                   attempt: int = 0) -> BSSResponse:
         """
-        查询用量信息（带重试机制）
+        经熔断器、限流器、并发限制器后异步调用BSS接口，并记录结果、写入响应缓存
+        
+        异步查询只用于批量处理，与批量通道一样为交互通道留出预留名额。
         """
-        for attempt in range(self.max_retries + 1):
-            result = self.client.query_daily_usage_by_iccid(iccid, begin_date, end_date, usage_type)
+        if not self.circuit_breaker.allow(api_type):
+            return self._circuit_open_response(api_type)
+        if not await self.rate_limiter.acquire_async(api_type):
+            return self._throttled_response(api_type)
+        if not self.concurrency_limiter.try_acquire(True):
+            waited = time.monotonic()
+            acquired = await self.concurrency_limiter.acquire_async(client.timeout, True)
+            self._record_lane_wait(LANE_BULK, time.monotonic() - waited)
+            if not acquired:
+                return self._throttled_response(api_type)
+        
+        try:
+            started = time.monotonic()
+            result = await self._query_client_async(client, api_type, iccid, usage_params)
+            self._record_outcome(api_type, result, time.monotonic() - started, attempt)
+            self.concurrency_limiter.record(time.monotonic() - started, self._is_retryable(result))
+        finally:
+            self.concurrency_limiter.release()
+        if self.response_cache.is_cacheable(api_type):
+            await asyncio.to_thread(self.response_cache.set, api_type, iccid, result)
+        return result
+    
+    async def query_iccid_async(self, client: AsyncBSSAPIClient, iccid: str,
+                                usage_params: Optional[Dict[str, str]] = None,
+                                force_refresh: bool = False) -> Dict[str, BSSResponse]:
+        """
+        异步并行查询单个ICCID的全部信息
+        
+        Args:
+            client: 异步BSS API客户端
+            iccid: ICCID
+            usage_params: 用量查询的可选参数（begin_date/end_date/usage_type）
+            force_refresh: 是否跳过响应缓存
             
-            # 检查是否成功
-            if result.get("code") == "0000":
-                return result
+        Returns:
+            Dict[str, BSSResponse]: API类型到响应的映射
+        """
+        results = await asyncio.gather(
+            *(self._query_async(client, api_type, iccid, usage_params, force_refresh) for api_type in API_TYPES),
+            return_exceptions=True
+        )
+        return {
+            api_type: result if not isinstance(result, Exception) else BSSResponse.failure(
+                API_ENDPOINTS[api_type], UNKNOWN_ERROR, str(result)
+            )
+            for api_type, result in zip(API_TYPES, results)
+        }
+    
+    def iter_iccid_results(self, iccids: Iterable[str],
+                           usage_params: Optional[Dict[str, Dict[str, str]]] = None,
+                           force_refresh: bool = False, lane: str = LANE_BULK
+                           ) -> Iterator[Tuple[str, Dict[str, BSSResponse]]]:
+        """
+        有界并发查询多个ICCID，按输入顺序逐个返回结果
+        
+        同时在途的ICCID不超过当前窗口（批量通道固定为max_concurrent，或随自适应并发上限伸缩；
+        交互通道为interactive_concurrent）；
+        已完成但尚未轮到返回的结果最多缓存REORDER_BUFFER_FACTOR倍的窗口，避免队首慢请求拖住整体。
+        
+        Args:
+            iccids: ICCID序列
+            usage_params: ICCID到用量查询参数的映射
+            force_refresh: 是否跳过响应缓存
+            lane: 请求通道（bulk/interactive）
             
-            # 如果不是最后一次尝试，等待后重试
-            if attempt < self.max_retries:
-                time.sleep(self.retry_delay)
+        Yields:
+            Tuple[str, Dict[str, BSSResponse]]: (ICCID, API类型到响应的映射)
+        """
+        usage_params = usage_params or {}
+        iccid_iter = iter(iccids)
+        pending = deque()
+        exhausted = False
         
-        return result
+        while True:
+            window = self._iccid_window() if lane == LANE_BULK else self.interactive_concurrent
+            # 补充在途ICCID直到达到并发上限
+            while not exhausted and len(pending) < window * REORDER_BUFFER_FACTOR:
+                # 等待延迟重试的查询不占用并发名额
+                in_flight = sum(
+                    1 for _, futures in pending
+                    if any(not future.done() and future not in self._deferred for future in futures.values())
+                )
+                if in_flight >= window:
+                    break
+                try:
+                    iccid = next(iccid_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((iccid, self.submit_iccid_queries(iccid, usage_params.get(iccid), force_refresh, lane)))
+            
+            if not pending:
+                return
+            
+            iccid, futures = pending[0]
+            if all(future.done() for future in futures.values()):
+                pending.popleft()
+                yield iccid, {api_type: self._future_result(future, api_type) for api_type, future in futures.items()}
+                continue
+            
+            # 等待任意一个查询完成后再调度
+            wait(
+                [future for _, item in pending for future in item.values() if not future.done()],
+                return_when=FIRST_COMPLETED
+            )
+    
+    @staticmethod
+    def is_circuit_open(results: Dict[str, BSSResponse]) -> bool:
+        """
+        判断一组查询结果中是否有熔断快速失败
+        
+        Args:
+            results: API类型到响应的映射
+        """
+        return any(result.circuit_open for result in results.values())
+    
+    def query_user_info(self, iccid: str, force_refresh: bool = False, lane: str = LANE_BULK) -> BSSResponse:
+        """
+        查询用户信息（带重试机制）
+        """
+        return self._future_result(
+            self.submit_query('user', iccid, force_refresh=force_refresh, lane=lane), 'user'
+        )
+    
+    def query_subscription_info(self, iccid: str, force_refresh: bool = False, lane: str = LANE_BULK) -> BSSResponse:
+        """
+        查询订阅信息（带重试机制）
+        """
+        return self._future_result(
+            self.submit_query('subscription', iccid, force_refresh=force_refresh, lane=lane), 'subscription'
+        )
+    
+    def query_usage_info(self, iccid: str, begin_date: str = None, end_date: str = None, usage_type: str = None,
+                         lane: str = LANE_BULK) -> BSSResponse:
+        """
+        查询用量信息（带重试机制）
+        """
+        usage_params = {'begin_date': begin_date, 'end_date': end_date, 'usage_type': usage_type}
+        return self._future_result(self.submit_query('usage', iccid, usage_params, lane=lane), 'usage')
 
 
 # 全局API客户端管理器实例
-api_client_manager = APIClientManager(max_concurrent=5, max_retries=2, retry_delay=5)
+api_client_manager = APIClientManager(
+    max_concurrent=getattr(settings, 'BSS_API_MAX_CONCURRENT', 5),
+    max_retries=getattr(settings, 'BSS_API_MAX_RETRIES', 2),
+    retry_delay=getattr(settings, 'BSS_API_RETRY_BASE_DELAY', 1),
+    retry_max_delay=getattr(settings, 'BSS_API_RETRY_MAX_DELAY', 30),
+    retryable_codes=getattr(settings, 'BSS_API_RETRYABLE_CODES', []),
+    interactive_concurrent=getattr(settings, 'BSS_API_INTERACTIVE_MAX_CONCURRENT', 2)
+)
 
@@ -0,0 +1,187 @@
+"""
+错误案例写入缓冲（write-behind）
+API调用失败时先在进程内缓存错误案例，按条数、时间间隔、文档处理结束、每个Celery任务结束及进程退出时
+以多行upsert（unique_badcase_document_iccid_api约束）批量写入
+"""
+import atexit
+import logging
+import threading
+import time
+from typing import Dict, Any
+
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from django.db import connection, transaction
+
+from apps.document.models import BadCase
+
+logger = logging.getLogger(__name__)
+
+# 唯一约束unique_badcase_document_iccid_api的字段
+BADCASE_UNIQUE_FIELDS = ['document', 'iccid', 'api_type']
+
+# 冲突时更新的字段（与逐条update_or_create的defaults一致）
+BADCASE_UPDATE_FIELDS = ['trans_id', 'status_code', 'response_data', 'error_message', 'updated_at']
+
+
+class BadCaseRecorder:
+    """
+    错误案例写入缓冲
+    
+    - 同一(文档, ICCID, API类型)在写入前多次记录时只保留最后一次，与逐条update_or_create结果一致
+    - 处于事务中时记录在事务提交后才进入缓存，事务回滚时一并丢弃（与逐条写入时随事务回滚一致）
+    - 缓存达到max_size条或距上次写入超过flush_interval秒时写入；处于事务中时不写入
+      （避免单个ICCID事务回滚连带丢弃其他ICCID的错误案例），由apply_batch在批末调用flush_if_due
+    - 文档处理结束、错误案例重试结束时调用flush；每个Celery任务结束时写入缓存（空闲的worker不会
+      一直持有未写入的记录等待下一次record）；进程退出（atexit、Celery子进程退出信号）时写入剩余数据
+    - 批量写入失败时逐条写入，只影响出错的记录
+    """
+    
+    def __init__(self, max_size: int = 500, flush_interval: float = 5):
+        """
+        初始化写入缓冲
+        
+        Args:
+            max_size: 缓存多少条后写入
+            flush_interval: 最长写入间隔（秒）
+        """
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        
+        self._pending: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._stats = {'recorded': 0, 'flushed': 0, 'batches': 0, 'fallbacks': 0}
+    
+    def record(self, document_id: int, iccid: str, api_type: str, trans_id: str, status_code: int,
+               response_data: Dict[str, Any], error_message: str):
+        """
+        缓存一条错误案例（处于事务中时在事务提交后缓存）
+        
+        Args:
+            document_id: 文档ID
+            iccid: ICCID
+            api_type: API类型
+            trans_id: 事务ID
+            status_code: 状态码
+            response_data: 响应数据
+            error_message: 错误信息
+        """
+        key = (document_id, iccid, api_type)
+        values = {
+            'trans_id': trans_id,
+            'status_code': status_code,
+            'response_data': response_data,
+            'error_message': error_message,
+        }
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._add(key, values))
+            return
+        self._add(key, values)
+        self.flush_if_due()
+    
+    def _add(self, key: tuple, values: Dict[str, Any]):
+        """加入缓存，同一键只保留最后一次记录"""
+        with self._lock:
+            self._pending[key] = values
+            self._stats['recorded'] += 1
+    
+    def _due(self) -> bool:
+        return bool(self._pending) and (
+            len(self._pending) >= self.max_size or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+    
+    def flush_if_due(self) -> int:
+        """
+        缓存达到条数或时间间隔时写入
+        
+        Returns:
+            int: 写入的条数
+        """
+        with self._lock:
+            due = self._due()
+        return self.flush() if due else 0
+    
+    def flush(self) -> int:
+        """
+        写入全部缓存的错误案例
+        
+        Returns:
+            int: 写入的条数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        
+        objs = [
+            BadCase(document_id=document_id, iccid=iccid, api_type=api_type, **values)
+            for (document_id, iccid, api_type), values in pending.items()
+        ]
+        try:
+            with transaction.atomic():
+                BadCase.objects.bulk_create(
+                    objs,
+                    batch_size=getattr(settings, 'BSS_DB_UPSERT_BATCH_SIZE', 500),
+                    update_conflicts=True,
+                    unique_fields=BADCASE_UNIQUE_FIELDS if connection.features.supports_update_conflicts_with_target else None,
+                    update_fields=BADCASE_UPDATE_FIELDS
+                )
+        except Exception as e:
+            logger.error(f"批量写入错误案例失败，改为逐条写入: {str(e)}")
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            for (document_id, iccid, api_type), values in pending.items():
+                try:
+                    BadCase.objects.update_or_create(
+                        document_id=document_id, iccid=iccid, api_type=api_type, defaults=values
+                    )
+                except Exception as write_error:
+                    logger.error(f"记录错误案例时发生异常: {str(write_error)}")
+        
+        with self._lock:
+            self._stats['flushed'] += len(objs)
+            self._stats['batches'] += 1
+        return len(objs)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取当前进程的写入统计
+        
+        Returns:
+            Dict[str, int]: 记录数、写入数、写入批次、回退逐条写入次数及当前缓存数
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+
+# 全局错误案例写入缓冲实例
+badcase_recorder = BadCaseRecorder(
+    max_size=getattr(settings, 'BSS_BADCASE_FLUSH_SIZE', 500),
+    flush_interval=getattr(settings, 'BSS_BADCASE_FLUSH_INTERVAL', 5),
+)
+
+
+def _flush_on_shutdown(**kwargs):
+    """进程退出时写入剩余的错误案例"""
+    try:
+        badcase_recorder.flush()
+    except Exception as e:
+        logger.error(f"进程退出时写入错误案例失败: {str(e)}")
+
+
+def _flush_after_task(**kwargs):
+    """Celery任务结束时写入缓存的错误案例"""
+    try:
+        badcase_recorder.flush()
+    except Exception as e:
+        logger.error(f"任务结束时写入错误案例失败: {str(e)}")
+
+
+atexit.register(_flush_on_shutdown)
+task_postrun.connect(_flush_after_task, weak=False)
+# prefork子进程退出时不执行atexit，通过Celery信号写入
+worker_process_shutdown.connect(_flush_on_shutdown, weak=False)
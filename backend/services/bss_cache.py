@@ -0,0 +1,158 @@
+"""
+BSS响应缓存
+缓存用户、订阅查询结果（Redis，复用Django缓存配置），支持负缓存与命中统计
+"""
+import logging
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .bss_response import BSSResponse, SUCCESS_CODE, SOURCE_CACHE
+
+logger = logging.getLogger(__name__)
+
+# 各API类型响应中承载数据的字段，用于判断"未找到"
+DATA_FIELDS = {
+    'user': 'user',
+    'subscription': 'list',
+}
+
+
+class BSSResponseCache:
+    """
+    BSS响应缓存
+    
+    - 成功且有数据的响应按API类型配置的TTL缓存
+    - "未找到"（成功但数据为空，或响应码属于not_found_codes）按negative_ttl缓存
+    - 其他失败不缓存
+    缓存内容为BSSResponse.to_dict()（不含请求体），命中时响应来源为cache。
+    """
+    
+    KEY_PREFIX = 'bss:response:'
+    
+    def __init__(self, enabled: bool = True, ttls: Optional[Dict[str, int]] = None,
+                 negative_ttl: int = 600, not_found_codes: Optional[Iterable[str]] = None,
+                 cache_alias: str = 'default'):
+        """
+        初始化响应缓存
+        
+        Args:
+            enabled: 是否启用
+            ttls: API类型到缓存时间（秒）的映射，未配置的API类型不缓存
+            negative_ttl: "未找到"响应的缓存时间（秒）
+            not_found_codes: 表示"未找到"的BSS响应码
+            cache_alias: Django缓存别名
+        """
+        self.enabled = enabled
+        self.ttls = ttls or {}
+        self.negative_ttl = negative_ttl
+        self.not_found_codes = set(not_found_codes or [])
+        self.cache_alias = cache_alias
+        
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def is_cacheable(self, api_type: str) -> bool:
+        """API类型是否启用缓存"""
+        return self.enabled and bool(self.ttls.get(api_type))
+    
+    def _key(self, api_type: str, iccid: str) -> str:
+        return f"{self.KEY_PREFIX}{api_type}:{iccid}"
+    
+    def _count(self, api_type: str, name: str):
+        with self._lock:
+            stats = self._stats.setdefault(api_type, {'hits': 0, 'negative_hits': 0, 'misses': 0, 'errors': 0})
+            stats[name] += 1
+    
+    def _is_not_found(self, api_type: str, result: BSSResponse) -> bool:
+        """是否为"未找到"响应"""
+        if result.code in self.not_found_codes:
+            return True
+        data_field = DATA_FIELDS.get(api_type)
+        if data_field is None:
+            return False
+        return result.code == SUCCESS_CODE and not result.get_data(data_field)
+    
+    def get(self, api_type: str, iccid: str) -> Optional[BSSResponse]:
+        """
+        读取缓存
+        
+        Args:
+            api_type: API类型
+            iccid: ICCID
+        
+        Returns:
+            Optional[BSSResponse]: 缓存的响应，未命中时返回None
+        """
+        if not self.is_cacheable(api_type):
+            return None
+        try:
+            cached = caches[self.cache_alias].get(self._key(api_type, iccid))
+        except Exception as e:
+            logger.warning(f"读取BSS响应缓存失败: {str(e)}")
+            self._count(api_type, 'errors')
+            return None
+        
+        if cached is None:
+            self._count(api_type, 'misses')
+            return None
+        
+        result = BSSResponse.from_dict(cached, SOURCE_CACHE)
+        self._count(api_type, 'negative_hits' if self._is_not_found(api_type, result) else 'hits')
+        return result
+    
+    def set(self, api_type: str, iccid: str, result: BSSResponse):
+        """
+        写入缓存（仅缓存成功响应和"未找到"响应）
+        """
+        if not self.is_cacheable(api_type) or result.error:
+            return
+        
+        if self._is_not_found(api_type, result):
+            ttl = self.negative_ttl
+        elif result.code == SUCCESS_CODE:
+            ttl = self.ttls[api_type]
+        else:
+            return
+        
+        if not ttl:
+            return
+        try:
+            caches[self.cache_alias].set(self._key(api_type, iccid), result.to_dict(), ttl)
+        except Exception as e:
+            logger.warning(f"写入BSS响应缓存失败: {str(e)}")
+            self._count(api_type, 'errors')
+    
+    def invalidate(self, api_type: str, iccid: str):
+        """
+        删除缓存
+        """
+        try:
+            caches[self.cache_alias].delete(self._key(api_type, iccid))
+        except Exception as e:
+            logger.warning(f"删除BSS响应缓存失败: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取当前进程的缓存命中统计
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: API类型到{hits, negative_hits, misses, errors, hit_rate}的映射
+        """
+        with self._lock:
+            stats = {api_type: dict(values) for api_type, values in self._stats.items()}
+        for values in stats.values():
+            lookups = values['hits'] + values['negative_hits'] + values['misses']
+            values['hit_rate'] = round((values['hits'] + values['negative_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# 全局BSS响应缓存实例
+bss_response_cache = BSSResponseCache(
+    enabled=getattr(settings, 'BSS_API_CACHE_ENABLED', True),
+    ttls=getattr(settings, 'BSS_API_CACHE_TTLS', {}),
+    negative_ttl=getattr(settings, 'BSS_API_CACHE_NEGATIVE_TTL', 600),
+    not_found_codes=getattr(settings, 'BSS_API_NOT_FOUND_CODES', []),
+)
@@ -0,0 +1,173 @@
+"""
+BSS网关选择与故障切换
+配置多个BSS网关地址时，按观测延迟和在途请求数选择网关；
+连接失败时切换到其他网关，连续失败的网关在冷却期内不参与选择
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BSSGateway:
+    """
+    单个BSS网关的状态（当前进程内）
+    """
+    
+    __slots__ = ('url', 'latency', 'in_flight', 'failures', 'cooldown_until', 'requests', 'errors', 'cooldowns')
+    
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.cooldowns = 0
+    
+    def available(self, now: float) -> bool:
+        """是否参与选择（不在冷却期内）"""
+        return now >= self.cooldown_until
+    
+    def score(self) -> float:
+        """
+        选择得分（越小越优先）：延迟EWMA × (在途请求数 + 1)，尚无延迟样本的网关优先探测
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency * (self.in_flight + 1)
+
+
+class BSSGatewayPool:
+    """
+    BSS网关池
+    
+    - 选择：在非冷却的网关中取"延迟EWMA × (在途请求数 + 1)"最小者，快的网关承担更多请求，
+      其在途请求增多后流量自然分摊到其他网关；另以probe_ratio的概率随机选择，
+      保证较慢的网关仍有延迟样本，恢复后能重新分到流量
+    - 健康：连接错误、超时和5xx计为失败，连续failure_threshold次失败后冷却cooldown秒；
+      收到非5xx响应即清零。全部网关都在冷却时选择最早结束冷却的网关，不拒绝请求
+    只有一个网关时不冷却，行为与单地址配置一致。
+    """
+    
+    def __init__(self, urls: Iterable[str], failure_threshold: int = 3, cooldown: float = 30,
+                 smoothing: float = 0.2, probe_ratio: float = 0.02,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random = None):
+        """
+        初始化网关池
+        
+        Args:
+            urls: 网关地址列表（如 https://10.0.0.1）
+            failure_threshold: 连续失败多少次后冷却
+            cooldown: 冷却时长（秒）
+            smoothing: 延迟EWMA的平滑系数（0~1）
+            probe_ratio: 随机选择网关的概率
+            clock: 单调时钟（测试时可注入）
+            rng: 随机数生成器（测试时可注入）
+        """
+        self.gateways: List[BSSGateway] = [BSSGateway(url.rstrip('/')) for url in urls if url]
+        if not self.gateways:
+            raise ValueError("至少需要配置一个BSS网关地址")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.probe_ratio = probe_ratio
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.gateways)
+    
+    def acquire(self, exclude: Iterable[BSSGateway] = ()) -> Optional[BSSGateway]:
+        """
+        选择一个网关并计入在途请求（请求结束后需调用release）
+        
+        Args:
+            exclude: 本次请求已尝试过的网关
+        
+        Returns:
+            Optional[BSSGateway]: 选中的网关，除exclude外没有其他网关时返回None
+        """
+        with self._lock:
+            candidates = [gateway for gateway in self.gateways if gateway not in exclude]
+            if not candidates:
+                return None
+            
+            now = self.clock()
+            healthy = [gateway for gateway in candidates if gateway.available(now)]
+            if not healthy:
+                gateway = min(candidates, key=lambda item: item.cooldown_until)
+            elif len(healthy) > 1 and self.rng.random() < self.probe_ratio:
+                gateway = self.rng.choice(healthy)
+            else:
+                gateway = min(healthy, key=BSSGateway.score)
+            
+            gateway.in_flight += 1
+            gateway.requests += 1
+            return gateway
+    
+    def release(self, gateway: BSSGateway, latency: Optional[float], failed: bool):
+        """
+        记录请求结果并归还在途计数
+        
+        Args:
+            gateway: acquire返回的网关
+            latency: 收到HTTP响应时的请求耗时（秒），未收到响应时为None
+            failed: 是否为网关失败（连接错误、超时、5xx）
+        """
+        with self._lock:
+            gateway.in_flight = max(0, gateway.in_flight - 1)
+            if latency is not None:
+                if gateway.latency is None:
+                    gateway.latency = latency
+                else:
+                    gateway.latency += self.smoothing * (latency - gateway.latency)
+            
+            if not failed:
+                gateway.failures = 0
+                return
+            
+            gateway.errors += 1
+            gateway.failures += 1
+            if gateway.failures >= self.failure_threshold and len(self.gateways) > 1:
+                gateway.failures = 0
+                gateway.cooldowns += 1
+                gateway.cooldown_until = self.clock() + self.cooldown
+                logger.warning(f"BSS网关连续失败，冷却 {self.cooldown} 秒: {gateway.url}")
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取当前进程各网关的状态
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: 网关地址到延迟EWMA、在途数、请求数、失败数、冷却次数及是否可用的映射
+        """
+        now = self.clock()
+        with self._lock:
+            return {
+                gateway.url: {
+                    'latency': round(gateway.latency, 4) if gateway.latency is not None else None,
+                    'in_flight': gateway.in_flight,
+                    'requests': gateway.requests,
+                    'errors': gateway.errors,
+                    'cooldowns': gateway.cooldowns,
+                    'available': gateway.available(now),
+                }
+                for gateway in self.gateways
+            }
+
+
+# 全局BSS网关池实例
+bss_gateway_pool = BSSGatewayPool(
+    getattr(settings, 'BSS_API_BASE_URLS', None) or [getattr(settings, 'BSS_API_BASE_URL', 'https://202.77.19.198')],
+    failure_threshold=getattr(settings, 'BSS_API_GATEWAY_FAILURE_THRESHOLD', 3),
+    cooldown=getattr(settings, 'BSS_API_GATEWAY_COOLDOWN', 30),
+    probe_ratio=getattr(settings, 'BSS_API_GATEWAY_PROBE_RATIO', 0.02),
+)
@@ -0,0 +1,206 @@
+"""
+BSS API调用指标
+按接口统计延迟直方图、HTTP状态码、BSS响应码、响应字节数、重试序号及超时/连接错误次数；
+进程内先聚合，定期合并到Redis供所有worker共享，并导出为Prometheus文本格式
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .bss_response import BSSResponse
+
+logger = logging.getLogger(__name__)
+
+# 默认延迟直方图桶（秒）
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 错误类型（与API客户端错误响应的error_type字段一致）
+ERROR_TIMEOUT = 'timeout'
+ERROR_CONNECTION = 'connection'
+
+
+def _escape_label(value: Any) -> str:
+    """转义Prometheus标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class BSSMetrics:
+    """
+    BSS API调用指标
+    
+    每个接口一个Redis hash（bss:metrics:{endpoint}），字段：
+        requests / latency_sum / response_bytes       请求数、累计延迟、累计响应字节
+        bucket:{i}                                     落在第i个延迟桶的请求数（非累积）
+        status:{http_status} / code:{bss_code}         HTTP状态码、BSS响应码计数
+        attempt:{n}                                    第n次尝试（0为首次）的请求数
+        error:{timeout|connection}                     超时、连接错误次数
+    Redis不可用时丢弃本次合并的数据，不影响调用。
+    """
+    
+    KEY_PREFIX = 'bss:metrics:'
+    
+    def __init__(self, enabled: bool = True, buckets: Optional[Iterable[float]] = None,
+                 flush_interval: float = 5):
+        """
+        初始化指标
+        
+        Args:
+            enabled: 是否启用
+            buckets: 延迟直方图桶上界（秒）
+            flush_interval: 进程内聚合数据合并到Redis的间隔（秒）
+        """
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets or DEFAULT_LATENCY_BUCKETS))
+        self.flush_interval = flush_interval
+        
+        self._pending: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_error_log = 0
+    
+    def _key(self, endpoint: str) -> str:
+        return f"{self.KEY_PREFIX}{endpoint}"
+    
+    def _bucket_index(self, latency: float) -> int:
+        for index, bound in enumerate(self.buckets):
+            if latency <= bound:
+                return index
+        return len(self.buckets)
+    
+    def observe(self, endpoint: str, latency: float, result: BSSResponse, attempt: int = 0):
+        """
+        记录一次BSS调用
+        
+        Args:
+            endpoint: 接口路径
+            latency: 调用耗时（秒）
+            result: API客户端返回的响应
+            attempt: 重试序号（0为首次）
+        """
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            counter = self._pending.setdefault(endpoint, Counter())
+            counter['requests'] += 1
+            counter['latency_sum'] += latency
+            counter[f"bucket:{self._bucket_index(latency)}"] += 1
+            counter[f"attempt:{attempt}"] += 1
+            counter['response_bytes'] += result.response_bytes
+            if result.status_code is not None:
+                counter[f"status:{result.status_code}"] += 1
+            if result.code is not None:
+                counter[f"code:{result.code}"] += 1
+            if result.error_type in (ERROR_TIMEOUT, ERROR_CONNECTION):
+                counter[f"error:{result.error_type}"] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """
+        将进程内聚合的数据合并到Redis
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        
+        try:
+            pipeline = get_redis_connection('default').pipeline(transaction=False)
+            for endpoint, counter in pending.items():
+                key = self._key(endpoint)
+                for field, value in counter.items():
+                    if field == 'latency_sum':
+                        pipeline.hincrbyfloat(key, field, value)
+                    elif value:
+                        pipeline.hincrby(key, field, int(value))
+            pipeline.execute()
+        except Exception as e:
+            now = time.monotonic()
+            if now - self._last_error_log > 60:
+                self._last_error_log = now
+                logger.warning(f"BSS指标写入Redis失败: {str(e)}")
+    
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        读取集群汇总的指标
+        
+        Returns:
+            Dict[str, Dict[str, float]]: 接口路径到字段计数的映射
+        """
+        redis = get_redis_connection('default')
+        snapshot = {}
+        for key in sorted(redis.scan_iter(match=f"{self.KEY_PREFIX}*")):
+            key = key.decode() if isinstance(key, bytes) else key
+            values = redis.hgetall(key)
+            snapshot[key[len(self.KEY_PREFIX):]] = {
+                (field.decode() if isinstance(field, bytes) else field): float(value)
+                for field, value in values.items()
+            }
+        return snapshot
+    
+    def render_prometheus(self) -> str:
+        """
+        以Prometheus文本格式导出指标
+        """
+        self.flush()
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        
+        def family(name: str, metric_type: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+        
+        def labelled(prefix: str, label: str, metric: str):
+            for endpoint, values in snapshot.items():
+                for field, value in sorted(values.items()):
+                    if field.startswith(prefix):
+                        lines.append(f'{metric}{{endpoint="{_escape_label(endpoint)}",'
+                                     f'{label}="{_escape_label(field[len(prefix):])}"}} {_format_number(value)}')
+        
+        family('bss_request_duration_seconds', 'histogram', 'BSS API request latency')
+        for endpoint, values in snapshot.items():
+            label = f'endpoint="{_escape_label(endpoint)}"'
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += values.get(f"bucket:{index}", 0)
+                lines.append(f'bss_request_duration_seconds_bucket{{{label},le="{bound}"}} {_format_number(cumulative)}')
+            lines.append(f'bss_request_duration_seconds_bucket{{{label},le="+Inf"}} {_format_number(values.get("requests", 0))}')
+            lines.append(f'bss_request_duration_seconds_sum{{{label}}} {_format_number(values.get("latency_sum", 0))}')
+            lines.append(f'bss_request_duration_seconds_count{{{label}}} {_format_number(values.get("requests", 0))}')
+        
+        family('bss_response_bytes_total', 'counter', 'BSS API response body bytes')
+        for endpoint, values in snapshot.items():
+            lines.append(f'bss_response_bytes_total{{endpoint="{_escape_label(endpoint)}"}} '
+                         f'{_format_number(values.get("response_bytes", 0))}')
+        
+        family('bss_responses_total', 'counter', 'BSS API responses by HTTP status')
+        labelled('status:', 'status', 'bss_responses_total')
+        family('bss_response_codes_total', 'counter', 'BSS API responses by BSS code')
+        labelled('code:', 'code', 'bss_response_codes_total')
+        family('bss_request_attempts_total', 'counter', 'BSS API requests by retry attempt (0 is the first try)')
+        labelled('attempt:', 'attempt', 'bss_request_attempts_total')
+        family('bss_request_errors_total', 'counter', 'BSS API timeouts and connection errors')
+        labelled('error:', 'type', 'bss_request_errors_total')
+        
+        return '\n'.join(lines) + '\n'
+
+
+# 全局BSS指标实例
+bss_metrics = BSSMetrics(
+    enabled=getattr(settings, 'BSS_METRICS_ENABLED', True),
+    buckets=getattr(settings, 'BSS_METRICS_LATENCY_BUCKETS', None),
+    flush_interval=getattr(settings, 'BSS_METRICS_FLUSH_INTERVAL', 5),
+)
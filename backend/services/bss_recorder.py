@@ -0,0 +1,161 @@
+"""
+BSS响应录制与回放
+录制模式下保存每次请求/响应对（按端点和请求体索引，zlib压缩后存入SQLite文件）；
+回放模式下直接从文件返回响应，不访问网络，用于重放历史文档和单独压测数据库写入
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# BSS API运行模式
+MODE_LIVE = 'live'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+MODES = (MODE_LIVE, MODE_RECORD, MODE_REPLAY)
+
+# 回放未命中时的错误类型（不可重试）
+REPLAY_MISS_ERROR = "回放缺失"
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bss_recording (
+    request_key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    status_code INTEGER,
+    payload BLOB NOT NULL,
+    recorded_at REAL NOT NULL
+)
+"""
+
+
+class BSSResponseStore:
+    """
+    BSS响应录制文件
+    
+    - 键：端点 + 规范化请求体（排序键的JSON）的SHA1，相同请求重复录制时覆盖旧响应
+    - 值：zlib压缩的原始响应体及HTTP状态码
+    回放时首次访问将整个文件加载到内存（仍为压缩数据），之后的查询不再读盘；
+    同一份录制文件的回放结果完全确定。
+    注意：增量用量拉取的请求体含begin_date，回放历史文档时水位需与录制时一致，
+    或关闭BSS_USAGE_INCREMENTAL_ENABLED后重新录制。
+    """
+    
+    def __init__(self, path: str):
+        """
+        初始化录制文件
+        
+        Args:
+            path: SQLite文件路径
+        """
+        self.path = str(path)
+        self._connection = None
+        self._connection_pid = None
+        self._entries: Optional[Dict[str, tuple]] = None
+        self._lock = threading.Lock()
+        self._stats = {'recorded': 0, 'replayed': 0, 'missed': 0}
+    
+    @staticmethod
+    def make_key(endpoint: str, request_body: Dict[str, Any]) -> str:
+        """
+        生成请求键（端点 + 规范化请求体）
+        """
+        canonical = json.dumps(request_body, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha1(f"{endpoint}\n{canonical}".encode('utf-8')).hexdigest()
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前进程的数据库连接（调用方需持有锁），fork后重新连接"""
+        pid = os.getpid()
+        if self._connection is None or self._connection_pid != pid:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection_pid = pid
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(CREATE_TABLE_SQL)
+            self._connection.commit()
+        return self._connection
+    
+    def record(self, endpoint: str, request_body: Dict[str, Any], status_code: Optional[int],
+               content: bytes):
+        """
+        保存一次请求/响应对
+        
+        Args:
+            endpoint: 端点
+            request_body: 请求体
+            status_code: HTTP状态码
+            content: 原始响应体
+        """
+        payload = zlib.compress(content)
+        key = self.make_key(endpoint, request_body)
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                connection.execute(
+                    'INSERT OR REPLACE INTO bss_recording VALUES (?, ?, ?, ?, ?)',
+                    (key, endpoint, status_code, payload, time.time())
+                )
+                connection.commit()
+                if self._entries is not None:
+                    self._entries[key] = (status_code, payload)
+                self._stats['recorded'] += 1
+        except sqlite3.Error as e:
+            logger.error(f"录制BSS响应失败: {str(e)}")
+    
+    def _load(self) -> Dict[str, tuple]:
+        """将录制文件加载到内存"""
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    rows = self._get_connection().execute(
+                        'SELECT request_key, status_code, payload FROM bss_recording'
+                    ).fetchall()
+                    self._entries = {key: (status_code, payload) for key, status_code, payload in rows}
+                    logger.info(f"已加载BSS录制文件: {self.path}，共 {len(self._entries)} 条响应")
+        return self._entries
+    
+    def replay(self, endpoint: str, request_body: Dict[str, Any]) -> Optional[tuple]:
+        """
+        查找录制的响应
+        
+        Returns:
+            Optional[tuple]: (HTTP状态码, 原始响应体)，未录制时返回None
+        """
+        entry = self._load().get(self.make_key(endpoint, request_body))
+        with self._lock:
+            self._stats['replayed' if entry else 'missed'] += 1
+        if entry is None:
+            return None
+        status_code, payload = entry
+        return status_code, zlib.decompress(payload)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取当前进程的录制/回放统计
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+def get_bss_api_mode() -> str:
+    """
+    获取BSS API运行模式（live/record/replay）
+    """
+    mode = getattr(settings, 'BSS_API_MODE', MODE_LIVE)
+    if mode not in MODES:
+        logger.warning(f"未知的BSS_API_MODE: {mode}，按live处理")
+        return MODE_LIVE
+    return mode
+
+
+# 全局BSS响应录制文件实例
+bss_response_store = BSSResponseStore(
+    getattr(settings, 'BSS_API_RECORD_PATH', 'bss_recordings.sqlite3')
+)
@@ -0,0 +1,157 @@
+"""
+BSS响应对象
+以__slots__对象替代"响应dict + _request_info"的合并结构：只保留下游需要的字段，
+请求头（含签名Ciphertext）不随响应传递，错误案例所需的诊断信息按需生成
+"""
+import json
+from typing import Dict, Any, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+# BSS成功响应码
+SUCCESS_CODE = "0000"
+
+# 错误类别
+REQUEST_ERROR = "请求异常"
+PARSE_ERROR = "响应解析异常"
+UNKNOWN_ERROR = "未知异常"
+
+# 响应来源
+SOURCE_LIVE = 'live'
+SOURCE_CACHE = 'cache'
+SOURCE_SHARED = 'shared'
+SOURCE_REPLAY = 'replay'
+SOURCE_LOCAL = 'local'
+
+
+def json_loads(content):
+    """解析JSON（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def json_dumps(value) -> bytes:
+    """序列化为UTF-8 JSON（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class BSSResponse:
+    """
+    BSS响应
+    
+    成功或业务失败时code/message/data来自BSS响应体；
+    请求未完成（超时、连接错误、解析失败、熔断、限流等）时error为错误类别，message为错误详情。
+    """
+    
+    __slots__ = (
+        'endpoint', 'status_code', 'trans_id', 'code', 'message', 'data',
+        'error', 'error_type', 'response_bytes', 'source', 'circuit_open', 'request_body',
+    )
+    
+    def __init__(self, endpoint: str, status_code: Optional[int] = None, trans_id: Optional[str] = None,
+                 code: Optional[str] = None, message: Optional[str] = None, data: Any = None,
+                 error: Optional[str] = None, error_type: Optional[str] = None, response_bytes: int = 0,
+                 source: str = SOURCE_LIVE, circuit_open: bool = False,
+                 request_body: Optional[Dict[str, Any]] = None):
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.trans_id = trans_id
+        self.code = code
+        self.message = message
+        self.data = data
+        self.error = error
+        self.error_type = error_type
+        self.response_bytes = response_bytes
+        self.source = source
+        self.circuit_open = circuit_open
+        self.request_body = request_body
+    
+    @classmethod
+    def parse(cls, endpoint: str, content: bytes, status_code: Optional[int] = None,
+              trans_id: Optional[str] = None, request_body: Optional[Dict[str, Any]] = None,
+              source: str = SOURCE_LIVE) -> 'BSSResponse':
+        """
+        解析BSS响应体，无法解析时返回PARSE_ERROR
+        """
+        try:
+            payload = json_loads(content)
+        except ValueError as e:
+            payload, parse_error = None, str(e)
+        else:
+            parse_error = None if isinstance(payload, dict) else '响应体不是JSON对象'
+        
+        if parse_error:
+            return cls(endpoint, status_code, trans_id, error=PARSE_ERROR, message=parse_error,
+                       response_bytes=len(content), source=source, request_body=request_body)
+        return cls(endpoint, status_code, trans_id, payload.get('code'), payload.get('message'),
+                   payload.get('data'), response_bytes=len(content), source=source, request_body=request_body)
+    
+    @classmethod
+    def failure(cls, endpoint: str, error: str, message: str, trans_id: Optional[str] = None,
+                status_code: Optional[int] = None, error_type: Optional[str] = None,
+                circuit_open: bool = False, source: str = SOURCE_LIVE,
+                request_body: Optional[Dict[str, Any]] = None) -> 'BSSResponse':
+        """
+        构造未完成请求的响应
+        """
+        return cls(endpoint, status_code, trans_id, message=message, error=error, error_type=error_type,
+                   source=source, circuit_open=circuit_open, request_body=request_body)
+    
+    @property
+    def ok(self) -> bool:
+        """是否为BSS成功响应"""
+        return self.error is None and self.code == SUCCESS_CODE
+    
+    def get_data(self, field: str, default: Any = None) -> Any:
+        """读取data中的字段"""
+        if not isinstance(self.data, dict):
+            return default
+        value = self.data.get(field)
+        return default if value is None else value
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        序列化为紧凑dict（用于缓存、跨worker共享），不含请求体
+        """
+        value = {'endpoint': self.endpoint}
+        for name in ('status_code', 'trans_id', 'code', 'message', 'data', 'error', 'error_type'):
+            field_value = getattr(self, name)
+            if field_value is not None:
+                value[name] = field_value
+        if self.response_bytes:
+            value['response_bytes'] = self.response_bytes
+        return value
+    
+    @classmethod
+    def from_dict(cls, value: Dict[str, Any], source: str) -> 'BSSResponse':
+        """
+        从to_dict的结果还原
+        """
+        return cls(
+            value.get('endpoint'), value.get('status_code'), value.get('trans_id'),
+            value.get('code'), value.get('message'), value.get('data'),
+            error=value.get('error'), error_type=value.get('error_type'),
+            response_bytes=value.get('response_bytes', 0), source=source
+        )
+    
+    def to_badcase_data(self) -> Dict[str, Any]:
+        """
+        生成错误案例的诊断信息（不含请求头和签名）
+        """
+        value = self.to_dict()
+        if self.request_body is not None:
+            value['request_body'] = self.request_body
+        if self.source != SOURCE_LIVE:
+            value['source'] = self.source
+        return value
+    
+    def __repr__(self):
+        if self.error:
+            return f"<BSSResponse {self.endpoint} error={self.error!r} message={self.message!r}>"
+        return f"<BSSResponse {self.endpoint} status={self.status_code} code={self.code!r}>"
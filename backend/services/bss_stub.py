@@ -0,0 +1,355 @@
+"""
+本地BSS模拟服务
+实现用户、订阅、日用量查询接口，校验签名并按ICCID生成确定性数据；
+支持延迟分布、错误注入和限流，用于在本地对BSSAPIClient和文档处理流程做端到端压测
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+from .api_clients import USER_QUERY_ENDPOINT, SUBSCRIPTION_QUERY_ENDPOINT, DAILY_USAGE_QUERY_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+# 统计接口
+STATS_PATH = '/stub/stats'
+
+# 用量日期格式
+USAGE_DATE_FORMAT = '%Y%m%d'
+
+# 响应码
+SUCCESS_CODE = "0000"
+SIGNATURE_ERROR_CODE = "1002"
+PARAM_ERROR_CODE = "1003"
+BUSINESS_ERROR_CODE = "9999"
+
+# 支持的延迟分布（参数单位：毫秒）
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+
+class LatencyModel:
+    """
+    响应延迟分布
+    
+    规格格式：
+        fixed:50             固定50ms
+        uniform:20,200       20~200ms均匀分布
+        normal:100,30        均值100ms、标准差30ms的正态分布（截断为非负）
+        lognormal:80,0.6     中位数80ms、sigma为0.6的对数正态分布（长尾）
+    """
+    
+    def __init__(self, spec: str = 'fixed:0'):
+        self.spec = spec
+        name, _, args = spec.partition(':')
+        if name not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {name}，可选: {', '.join(LATENCY_DISTRIBUTIONS)}")
+        try:
+            self.params = [float(arg) for arg in args.split(',') if arg]
+        except ValueError:
+            raise ValueError(f"延迟分布参数格式错误: {spec}")
+        expected = 1 if name == 'fixed' else 2
+        if len(self.params) != expected:
+            raise ValueError(f"延迟分布 {name} 需要 {expected} 个参数: {spec}")
+        self.name = name
+    
+    def sample(self, rng: random.Random) -> float:
+        """
+        采样一次延迟
+        
+        Returns:
+            float: 延迟（秒）
+        """
+        if self.name == 'fixed':
+            millis = self.params[0]
+        elif self.name == 'uniform':
+            millis = rng.uniform(*self.params)
+        elif self.name == 'normal':
+            millis = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            millis = median * rng.lognormvariate(0, sigma)
+        return max(0.0, millis) / 1000
+
+
+class StubTokenBucket:
+    """
+    模拟服务端限流（令牌桶），超出速率的请求返回HTTP 429
+    """
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class BSSDataGenerator:
+    """
+    按ICCID生成确定性的用户、订阅、日用量数据
+    
+    同一ICCID每次返回相同的用户和订阅；日用量按日期生成，截止到当天，
+    因此每天会自然出现新的用量记录，可用于验证增量拉取。
+    """
+    
+    def __init__(self, usage_days: int = 30, max_subscriptions: int = 3):
+        self.usage_days = usage_days
+        self.max_subscriptions = max_subscriptions
+    
+    @staticmethod
+    def _rng(*parts: str) -> random.Random:
+        seed = hashlib.md5(':'.join(parts).encode('utf-8')).hexdigest()
+        return random.Random(int(seed, 16))
+    
+    def user(self, iccid: str) -> Dict[str, Any]:
+        """生成用户信息"""
+        rng = self._rng('user', iccid)
+        user_id = rng.randint(10 ** 9, 10 ** 10 - 1)
+        create_time = date(2023, 1, 1) + timedelta(days=rng.randint(0, 365))
+        return {
+            'userId': user_id,
+            'custId': user_id + 1,
+            'acctId': user_id + 2,
+            'paidFlag': rng.choice(['0', '1']),
+            'imsi': f"46011{rng.randint(0, 10 ** 10 - 1):010d}",
+            'iccid': iccid,
+            'msisdn': f"1{rng.randint(3 * 10 ** 9, 10 ** 10 - 1)}",
+            'brand': rng.choice(['CTExcel', 'CTGlobal']),
+            'rateplanId': f"RP{rng.randint(1000, 9999)}",
+            'lifeCycle': rng.choice(['0', '1', '1', '1', '2']),
+            'hlrState': 'A',
+            'lifeCycleTime': create_time.strftime('%Y%m%d') + '000000',
+            'activeType': '1',
+            'activeTime': create_time.strftime('%Y%m%d') + '120000',
+            'effTime': create_time.strftime('%Y%m%d') + '000000',
+            'expTime': '20991231235959',
+            'createTime': create_time.strftime('%Y%m%d') + '000000',
+        }
+    
+    def subscriptions(self, iccid: str) -> List[Dict[str, Any]]:
+        """生成订阅列表"""
+        user = self.user(iccid)
+        rng = self._rng('subscription', iccid)
+        subscriptions = []
+        for index in range(rng.randint(1, self.max_subscriptions)):
+            subscriptions.append({
+                'subscriptionId': f"{user['userId']}{index:02d}",
+                'userId': user['userId'],
+                'acctId': user['acctId'],
+                'brand': user['brand'],
+                'productId': f"PRD{rng.randint(1000, 9999)}",
+                'productFlag': '0' if index == 0 else '1',
+                'status': '1',
+                'statusTime': user['createTime'],
+                'validityUnit': 'M',
+                'validityTime': 1,
+                'effTime': user['effTime'],
+                'expTime': user['expTime'],
+                'createTime': user['createTime'],
+                'priority': index + 1,
+            })
+        return subscriptions
+    
+    def daily_usage(self, iccid: str, begin_date: Optional[str] = None,
+                    end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """生成日用量列表（按begin_date/end_date过滤，格式yyyyMMdd）"""
+        today = date.today()
+        usages = []
+        for subscription in self.subscriptions(iccid):
+            for offset in range(self.usage_days):
+                usage_date = (today - timedelta(days=offset)).strftime(USAGE_DATE_FORMAT)
+                if (begin_date and usage_date < begin_date) or (end_date and usage_date > end_date):
+                    continue
+                rng = self._rng('usage', iccid, subscription['subscriptionId'], usage_date)
+                usages.append({
+                    'usageDate': usage_date,
+                    'subscriptionId': subscription['subscriptionId'],
+                    'productId': subscription['productId'],
+                    'usageType': 'dat',
+                    'callType': '*',
+                    'visitMcc': '460',
+                    'visitMnc': rng.choice(['01', '03', '11']),
+                    'usage': rng.randint(0, 500 * 1024 * 1024),
+                    'unit': 'Byte',
+                })
+        return usages
+
+
+class BSSStubServer(ThreadingHTTPServer):
+    """
+    本地BSS模拟服务
+    
+    每个请求依次：校验签名 → 限流（HTTP 429）→ 注入延迟 → 注入错误 → 返回确定性数据。
+    GET /stub/stats 返回各接口的请求统计。
+    """
+    
+    daemon_threads = True
+    # 异步客户端压测时并发建连较多，默认backlog（5）会导致SYN重传
+    request_queue_size = 1024
+    
+    def __init__(self, address: Tuple[str, int], app_id: str, app_secret: str,
+                 latency: Optional[LatencyModel] = None, error_rate: float = 0.0,
+                 business_error_rate: float = 0.0, rate_limit: float = 0.0,
+                 generator: Optional[BSSDataGenerator] = None, seed: Optional[int] = None):
+        """
+        初始化模拟服务
+        
+        Args:
+            address: 监听地址
+            app_id: 合法的AppId
+            app_secret: 签名密钥
+            latency: 响应延迟分布
+            error_rate: 返回HTTP 503的比例
+            business_error_rate: 返回业务错误码（不可重试）的比例
+            rate_limit: 每秒最大请求数，0表示不限流
+            generator: 数据生成器
+            seed: 延迟和错误注入的随机种子
+        """
+        super().__init__(address, BSSStubRequestHandler)
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.business_error_rate = business_error_rate
+        self.throttle = StubTokenBucket(rate_limit) if rate_limit else None
+        self.generator = generator or BSSDataGenerator()
+        
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+    
+    def verify_signature(self, headers) -> bool:
+        """校验 Ciphertext = MD5(AppId + TransId + Timestamp + AppSecret)"""
+        app_id = headers.get('AppId')
+        trans_id = headers.get('TransId')
+        timestamp = headers.get('Timestamp')
+        ciphertext = headers.get('Ciphertext')
+        if app_id != self.app_id or not trans_id or not timestamp or not ciphertext:
+            return False
+        expected = hashlib.md5(f"{app_id}{trans_id}{timestamp}{self.app_secret}".encode('utf-8')).hexdigest()
+        return ciphertext.lower() == expected
+    
+    def random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+    
+    def sample_latency(self) -> float:
+        with self._rng_lock:
+            return self.latency.sample(self._rng)
+    
+    def count(self, path: str, outcome: str):
+        with self._stats_lock:
+            stats = self._stats.setdefault(path, {})
+            stats[outcome] = stats.get(outcome, 0) + 1
+    
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self._stats_lock:
+            return {path: dict(values) for path, values in self._stats.items()}
+    
+    def build_data(self, path: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        按接口生成响应数据
+        
+        Returns:
+            Optional[Dict[str, Any]]: data字段内容，ICCID缺失时返回None
+        """
+        iccid = (body.get('userIdentity') or {}).get('iccid')
+        if not iccid:
+            return None
+        if path == USER_QUERY_ENDPOINT:
+            return {'user': self.generator.user(iccid)}
+        if path == SUBSCRIPTION_QUERY_ENDPOINT:
+            return {'list': self.generator.subscriptions(iccid)}
+        return {'list': self.generator.daily_usage(iccid, body.get('beginDate'), body.get('endDate'))}
+
+
+class BSSStubRequestHandler(BaseHTTPRequestHandler):
+    """
+    模拟服务请求处理
+    """
+    
+    server: BSSStubServer
+    protocol_version = 'HTTP/1.1'
+    
+    ENDPOINTS = (USER_QUERY_ENDPOINT, SUBSCRIPTION_QUERY_ENDPOINT, DAILY_USAGE_QUERY_ENDPOINT)
+    
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+    
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == STATS_PATH:
+            self._send_json(200, self.server.get_stats())
+        else:
+            self._send_json(404, {'code': '404', 'message': 'Not Found'})
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        path = self.path
+        server = self.server
+        
+        if path not in self.ENDPOINTS:
+            server.count(path, 'not_found')
+            self._send_json(404, {'code': '404', 'message': 'Not Found'})
+            return
+        
+        if not server.verify_signature(self.headers):
+            server.count(path, 'signature_error')
+            self._send_json(200, {'code': SIGNATURE_ERROR_CODE, 'message': '签名校验失败'})
+            return
+        
+        if server.throttle and not server.throttle.allow():
+            server.count(path, 'throttled')
+            self._send_json(429, {'code': '429', 'message': 'Too Many Requests'})
+            return
+        
+        delay = server.sample_latency()
+        if delay:
+            time.sleep(delay)
+        
+        if server.error_rate and server.random() < server.error_rate:
+            server.count(path, 'server_error')
+            self._send_json(503, {'code': '503', 'message': 'Service Unavailable'})
+            return
+        if server.business_error_rate and server.random() < server.business_error_rate:
+            server.count(path, 'business_error')
+            self._send_json(200, {'code': BUSINESS_ERROR_CODE, 'message': '模拟业务错误'})
+            return
+        
+        try:
+            body = json.loads(raw_body or b'{}')
+        except ValueError:
+            body = {}
+        data = server.build_data(path, body)
+        if data is None:
+            server.count(path, 'param_error')
+            self._send_json(200, {'code': PARAM_ERROR_CODE, 'message': '缺少userIdentity.iccid'})
+            return
+        
+        server.count(path, 'success')
+        self._send_json(200, {'code': SUCCESS_CODE, 'message': 'success', 'data': data})
@@ -0,0 +1,287 @@
+"""
+BSS API熔断器
+按API类型维护closed/open/half_open状态，状态保存在Redis中由所有worker共享
+"""
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# 熔断状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 是否放行：open状态冷却结束后，集群内只放行一个half_open探测请求
+ALLOW_SCRIPT = """
+local cooldown = tonumber(ARGV[1])
+local probe_ttl = tonumber(ARGV[2])
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local data = redis.call('HMGET', KEYS[1], 'state', 'opened_at')
+local state = data[1] or 'closed'
+if state == 'closed' then
+    return {state, 1}
+end
+if state == 'open' and now - (tonumber(data[2]) or 0) < cooldown then
+    return {state, 0}
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'PX', probe_ttl) then
+    redis.call('HSET', KEYS[1], 'state', 'half_open')
+    return {'half_open', 1}
+end
+return {state, 0}
+"""
+
+# 记录失败（连同进程内累计的成功数）：窗口内请求数达到min_requests且失败率达到阈值，或探测失败时打开熔断
+FAILURE_SCRIPT = """
+local ratio = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local min_requests = tonumber(ARGV[3])
+local successes = tonumber(ARGV[4])
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'open' then
+    return state
+end
+if state == 'closed' then
+    local requests = redis.call('HINCRBY', KEYS[3], 'requests', successes + 1)
+    local failures = redis.call('HINCRBY', KEYS[3], 'failures', 1)
+    if redis.call('PTTL', KEYS[3]) < 0 then
+        redis.call('PEXPIRE', KEYS[3], window)
+    end
+    if requests < min_requests or failures < requests * ratio then
+        return state
+    end
+end
+redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', now)
+redis.call('DEL', KEYS[2], KEYS[3])
+return 'open'
+"""
+
+# 记录成功：探测成功时关闭熔断并返回recovered；closed状态下计入窗口请求数
+SUCCESS_SCRIPT = """
+local successes = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'half_open' then
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+    return 'recovered'
+end
+if state == 'closed' and successes > 0 then
+    redis.call('HINCRBY', KEYS[3], 'requests', successes)
+    if redis.call('PTTL', KEYS[3]) < 0 then
+        redis.call('PEXPIRE', KEYS[3], window)
+    end
+end
+return state
+"""
+
+
+class BSSUnavailableError(Exception):
+    """
+    BSS接口熔断中，文档应暂停并稍后重新排队
+    """
+    
+    def __init__(self, message: str, retry_after: float = 60):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BSSCircuitBreaker:
+    """
+    BSS API熔断器
+    
+    - closed：正常放行，窗口期内请求数达到min_requests且可重试失败（超时、连接错误、5xx、限流）
+      占比达到failure_ratio后打开；请求量小时少量失败不会触发熔断
+    - open：快速失败，冷却时间结束后转为half_open
+    - half_open：集群内只放行一个探测请求，成功则关闭，失败则重新打开
+    
+    为避免每次请求都访问Redis，状态在进程内缓存state_cache_ttl秒；closed状态下的成功数在进程内累计，
+    随下一次失败或每success_flush_interval秒写入一次。Redis不可用时放行请求。
+    """
+    
+    KEY_PREFIX = 'bss:circuit:'
+    
+    def __init__(self, enabled: bool = True, failure_ratio: float = 0.5, min_requests: int = 20,
+                 failure_window: float = 60, cooldown: float = 60, probe_timeout: float = 60,
+                 state_cache_ttl: float = 1, success_flush_interval: float = 1):
+        """
+        初始化熔断器
+        
+        Args:
+            enabled: 是否启用
+            failure_ratio: 窗口期内触发熔断的失败率
+            min_requests: 窗口期内请求数达到多少后才按失败率判断
+            failure_window: 请求计数窗口（秒）
+            cooldown: 熔断打开后的冷却时间（秒）
+            probe_timeout: half_open探测请求的租约时间（秒）
+            state_cache_ttl: 进程内状态缓存时间（秒）
+            success_flush_interval: 进程内累计的成功数写入Redis的间隔（秒）
+        """
+        self.enabled = enabled
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.failure_window = failure_window
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.state_cache_ttl = state_cache_ttl
+        self.success_flush_interval = success_flush_interval
+        
+        self._scripts = None
+        self._state_cache: Dict[str, Tuple[str, float]] = {}
+        self._successes: Dict[str, int] = {}
+        self._last_success_flush: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_error_log = 0
+    
+    def _get_scripts(self):
+        """注册Lua脚本"""
+        if self._scripts is None:
+            redis = get_redis_connection('default')
+            self._scripts = (
+                redis.register_script(ALLOW_SCRIPT),
+                redis.register_script(FAILURE_SCRIPT),
+                redis.register_script(SUCCESS_SCRIPT),
+            )
+        return self._scripts
+    
+    def _keys(self, api_type: str):
+        """状态、探测租约、窗口计数的键"""
+        prefix = f"{self.KEY_PREFIX}{api_type}"
+        return [prefix, f"{prefix}:probe", f"{prefix}:window"]
+    
+    def _log_redis_error(self, e: Exception):
+        """Redis异常时降级放行，日志每分钟最多输出一次"""
+        now = time.monotonic()
+        if now - self._last_error_log > 60:
+            self._last_error_log = now
+            logger.warning(f"BSS熔断器Redis不可用，暂时放行请求: {str(e)}")
+    
+    def _cache_state(self, api_type: str, state: str):
+        with self._lock:
+            self._state_cache[api_type] = (state, time.monotonic() + self.state_cache_ttl)
+    
+    def _cached_state(self, api_type: str):
+        with self._lock:
+            cached = self._state_cache.get(api_type)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        return None
+    
+    def _take_successes(self, api_type: str) -> int:
+        """取出进程内累计的成功数"""
+        with self._lock:
+            self._last_success_flush[api_type] = time.monotonic()
+            return self._successes.pop(api_type, 0)
+    
+    def allow(self, api_type: str) -> bool:
+        """
+        判断是否放行请求
+        
+        Args:
+            api_type: API类型
+        
+        Returns:
+            bool: 是否放行
+        """
+        if not self.enabled:
+            return True
+        
+        cached = self._cached_state(api_type)
+        if cached == STATE_CLOSED:
+            return True
+        if cached == STATE_OPEN:
+            return False
+        
+        try:
+            allow_script, _, _ = self._get_scripts()
+            state, allowed = allow_script(
+                keys=self._keys(api_type),
+                args=[int(self.cooldown * 1000), int(self.probe_timeout * 1000)]
+            )
+        except Exception as e:
+            self._log_redis_error(e)
+            return True
+        
+        state = state.decode() if isinstance(state, bytes) else state
+        # half_open状态不缓存，确保探测结果能及时生效
+        if state != STATE_HALF_OPEN:
+            self._cache_state(api_type, state)
+        return bool(allowed)
+    
+    def record_failure(self, api_type: str):
+        """
+        记录一次可重试失败
+        """
+        if not self.enabled:
+            return
+        successes = self._take_successes(api_type)
+        try:
+            _, failure_script, _ = self._get_scripts()
+            state = failure_script(
+                keys=self._keys(api_type),
+                args=[self.failure_ratio, int(self.failure_window * 1000), self.min_requests, successes]
+            )
+        except Exception as e:
+            self._log_redis_error(e)
+            return
+        
+        state = state.decode() if isinstance(state, bytes) else state
+        if state == STATE_OPEN and self._cached_state(api_type) != STATE_OPEN:
+            logger.error(f"BSS {api_type} 接口熔断，{self.cooldown}秒内快速失败")
+        self._cache_state(api_type, state)
+    
+    def record_success(self, api_type: str):
+        """
+        记录一次成功调用（closed状态下先在进程内累计，每success_flush_interval秒写入一次）
+        """
+        if not self.enabled:
+            return
+        closed = self._cached_state(api_type) == STATE_CLOSED
+        with self._lock:
+            self._successes[api_type] = self._successes.get(api_type, 0) + 1
+            if closed and time.monotonic() - self._last_success_flush.get(api_type, 0) < self.success_flush_interval:
+                return
+        successes = self._take_successes(api_type)
+        try:
+            _, _, success_script = self._get_scripts()
+            state = success_script(keys=self._keys(api_type), args=[successes, int(self.failure_window * 1000)])
+        except Exception as e:
+            self._log_redis_error(e)
+            return
+        
+        state = state.decode() if isinstance(state, bytes) else state
+        if state == 'recovered':
+            logger.info(f"BSS {api_type} 接口探测成功，熔断关闭")
+            state = STATE_CLOSED
+        self._cache_state(api_type, state)
+    
+    def get_state(self, api_type: str) -> str:
+        """
+        获取API类型的熔断状态
+        """
+        try:
+            state = get_redis_connection('default').hget(self._keys(api_type)[0], 'state')
+        except Exception as e:
+            self._log_redis_error(e)
+            return STATE_CLOSED
+        if state is None:
+            return STATE_CLOSED
+        return state.decode() if isinstance(state, bytes) else state
+
+
+# 全局BSS熔断器实例
+bss_circuit_breaker = BSSCircuitBreaker(
+    enabled=getattr(settings, 'BSS_CIRCUIT_BREAKER_ENABLED', True),
+    failure_ratio=getattr(settings, 'BSS_CIRCUIT_FAILURE_RATIO', 0.5),
+    min_requests=getattr(settings, 'BSS_CIRCUIT_MIN_REQUESTS', 20),
+    failure_window=getattr(settings, 'BSS_CIRCUIT_FAILURE_WINDOW', 60),
+    cooldown=getattr(settings, 'BSS_CIRCUIT_COOLDOWN', 60),
+)
@@ -0,0 +1,382 @@
+"""
+BSS API自适应并发控制
+根据观察到的延迟和错误动态调整进程内同时在途的BSS请求数上限：
+延迟稳定时逐步放大，延迟相对基线升高时按梯度收缩，出现可重试失败时乘性减小
+"""
+import asyncio
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# 上限调整原因
+REASON_GROW = 'grow'
+REASON_LATENCY = 'latency'
+REASON_ERROR = 'error'
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    自适应并发限制器（梯度 + AIMD）
+    
+    调用结果按采样窗口汇总（至少min_window_samples个样本，且不短于一个短期延迟或0.1秒），每个窗口调整一次上限：
+    - 每个窗口的可重试失败（超时、5xx、限流）占比按error_smoothing平滑为错误率，超过error_threshold时
+      上限乘以backoff_ratio（乘性减小）；单个窗口的偶发失败不会使上限持续停在下限
+    - 否则用窗口平均延迟更新短期延迟EWMA；延迟基线取最近baseline_window秒内短期延迟的最小值（无负载延迟）。
+      梯度 = tolerance × 基线 / 短期延迟（限制在0.5~1之间），新上限 = 上限 × 梯度 + √上限，再按smoothing平滑：
+      延迟接近基线时上限逐步增长，超过基线tolerance倍时收缩；窗口内在途请求峰值不足上限一半时不再增长
+    - 上限的整数值变化时记录历史（每秒最多一条），并定期写入Redis供 /api/metrics/bss/ 按worker导出
+    - 获取名额时可指定reserve=True：在途请求数达到"上限 - 预留名额"后即等待，留出的名额给不预留的调用方
+      （批量流量为交互流量预留容量）。预留名额随上限缩放：min(max_reserve, 上限 × reserve_ratio)，
+      上限降到下限时批量流量仍有大部分名额；判断是否继续增长时预留名额按已占用计算
+    每个进程独立调整；Redis不可用时只影响指标导出。
+    """
+    
+    KEY_PREFIX = 'bss:concurrency:'
+    
+    def __init__(self, enabled: bool = True, initial_limit: int = 15, min_limit: int = 3, max_limit: int = 60,
+                 tolerance: float = 2.0, backoff_ratio: float = 0.75, error_threshold: float = 0.15,
+                 error_smoothing: float = 0.3, smoothing: float = 0.2, min_window_samples: int = 20,
+                 baseline_window: float = 300,
+                 history_size: int = 500, publish_interval: float = 5, max_reserve: int = 0,
+                 reserve_ratio: float = 0.25):
+        """
+        初始化并发限制器
+        
+        Args:
+            enabled: 是否启用，未启用时不限制在途请求数
+            initial_limit: 初始上限
+            min_limit: 上限下限
+            max_limit: 上限上限
+            tolerance: 短期延迟超过长期基线多少倍时开始收缩
+            backoff_ratio: 可重试失败占比超过阈值时上限的乘数
+            error_threshold: 平滑后的可重试失败占比阈值
+            error_smoothing: 错误率的平滑系数（0~1，越小越平滑）
+            smoothing: 每次调整的平滑系数（0~1）
+            min_window_samples: 每个采样窗口的最少样本数
+            baseline_window: 延迟基线的统计窗口（秒）
+            history_size: 保留的上限变化记录数
+            publish_interval: 状态写入Redis的间隔（秒）
+            max_reserve: 预留名额的最大值（如交互通道的最大在途请求数）
+            reserve_ratio: 预留名额占当前上限的比例（0~0.5）
+        """
+        if not 0 <= reserve_ratio <= 0.5:
+            raise ValueError(f"预留名额比例需在0~0.5之间: {reserve_ratio}")
+        self.enabled = enabled
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.initial_limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.tolerance = tolerance
+        self.backoff_ratio = backoff_ratio
+        self.error_threshold = error_threshold
+        self.error_smoothing = error_smoothing
+        self.smoothing = smoothing
+        self.min_window_samples = min_window_samples
+        self.baseline_window = baseline_window
+        self.publish_interval = publish_interval
+        self.max_reserve = max(0, max_reserve)
+        self.reserve_ratio = reserve_ratio
+        if self.min_limit <= self._reserved_at(self.min_limit):
+            raise ValueError(f"并发上限下限 {self.min_limit} 需大于预留名额 {self._reserved_at(self.min_limit)}")
+        
+        self._limit = float(self.initial_limit)
+        self._in_flight = 0
+        self._short_rtt = None
+        self._error_rate = 0.0
+        # 按10秒分桶的短期延迟最小值，用于计算窗口内的延迟基线
+        self._rtt_minima = deque()
+        # 当前采样窗口
+        self._window_start = time.monotonic()
+        self._window_samples = 0
+        self._window_failures = 0
+        self._window_latency = 0.0
+        self._window_peak = 0
+        self._last_publish = 0
+        self._history = deque(maxlen=history_size)
+        self._stats = {'samples': 0, 'grows': 0, 'latency_decreases': 0, 'error_decreases': 0, 'waits': 0}
+        self._condition = threading.Condition()
+    
+    @property
+    def limit(self) -> int:
+        """当前在途请求数上限"""
+        return int(self._limit) if self.enabled else self.max_limit
+    
+    @property
+    def in_flight(self) -> int:
+        """当前在途请求数"""
+        return self._in_flight
+    
+    def _reserved_at(self, limit: float) -> int:
+        """上限为limit时的预留名额数"""
+        return min(self.max_reserve, int(limit * self.reserve_ratio))
+    
+    def _capacity(self, reserve: bool = False) -> int:
+        """可用的上限，reserve为True时扣除预留名额（至少为1，调用方需持有锁）"""
+        return max(1, int(self._limit) - (self._reserved_at(self._limit) if reserve else 0))
+    
+    def capacity(self, reserve: bool = False) -> int:
+        """
+        当前可用的在途请求数上限
+        
+        Args:
+            reserve: 是否扣除预留名额
+        """
+        if not self.enabled:
+            return self.max_limit
+        with self._condition:
+            return self._capacity(reserve)
+    
+    def try_acquire(self, reserve: bool = False) -> bool:
+        """
+        不等待地获取一个在途名额
+        """
+        with self._condition:
+            if self.enabled and self._in_flight >= self._capacity(reserve):
+                return False
+            self._in_flight += 1
+            self._window_peak = max(self._window_peak, self._in_flight)
+            return True
+    
+    def acquire(self, timeout: Optional[float] = None, reserve: bool = False) -> bool:
+        """
+        阻塞获取一个在途名额
+        
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+            reserve: 是否为不预留的调用方留出预留名额
+        
+        Returns:
+            bool: 是否在超时前获取到名额
+        """
+        with self._condition:
+            if self.enabled and self._in_flight >= self._capacity(reserve):
+                self._stats['waits'] += 1
+                if not self._condition.wait_for(lambda: self._in_flight < self._capacity(reserve), timeout):
+                    return False
+            self._in_flight += 1
+            self._window_peak = max(self._window_peak, self._in_flight)
+            return True
+    
+    async def acquire_async(self, timeout: Optional[float] = None, reserve: bool = False,
+                            poll_interval: float = 0.01) -> bool:
+        """
+        异步获取一个在途名额，等待期间不阻塞事件循环
+        
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+            reserve: 是否为不预留的调用方留出预留名额
+            poll_interval: 名额不足时的轮询间隔（秒）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(reserve):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+    
+    def release(self):
+        """
+        归还在途名额
+        """
+        with self._condition:
+            self._in_flight = max(0, self._in_flight - 1)
+            # 等待方的预留名额数不同，逐个唤醒可能唤醒到仍无法获取的一方
+            self._condition.notify_all()
+    
+    def record(self, latency: float, failed: bool):
+        """
+        记录一次调用结果，采样窗口结束时调整上限
+        
+        Args:
+            latency: 调用耗时（秒）
+            failed: 是否为可重试失败
+        """
+        if not self.enabled:
+            return
+        
+        with self._condition:
+            self._stats['samples'] += 1
+            self._window_samples += 1
+            if failed:
+                self._window_failures += 1
+            else:
+                self._window_latency += latency
+            
+            now = time.monotonic()
+            if (self._window_samples < self.min_window_samples
+                    or now - self._window_start < max(0.1, self._short_rtt or 0)):
+                return
+            samples, failures, peak = self._window_samples, self._window_failures, self._window_peak
+            latency_sum = self._window_latency
+            self._window_start = now
+            self._window_samples = self._window_failures = 0
+            self._window_latency = 0.0
+            self._window_peak = self._in_flight
+            
+            old_limit = self._limit
+            self._error_rate += (failures / samples - self._error_rate) * self.error_smoothing
+            if self._error_rate > self.error_threshold:
+                new_limit = old_limit * self.backoff_ratio
+                reason = REASON_ERROR
+            elif failures == samples:
+                return
+            else:
+                new_limit = self._gradient_limit(latency_sum / (samples - failures), peak)
+                reason = REASON_GROW if new_limit >= old_limit else REASON_LATENCY
+            
+            self._limit = min(self.max_limit, max(self.min_limit, new_limit))
+            if int(self._limit) == int(old_limit):
+                return
+            
+            self._stats[{REASON_GROW: 'grows', REASON_LATENCY: 'latency_decreases',
+                         REASON_ERROR: 'error_decreases'}[reason]] += 1
+            # 变化记录每秒最多一条，保留该秒内的最新上限
+            now = time.time()
+            if self._history and now - self._history[-1][0] < 1:
+                self._history[-1] = (self._history[-1][0], int(self._limit), reason)
+            else:
+                self._history.append((now, int(self._limit), reason))
+            if self._limit > old_limit:
+                self._condition.notify_all()
+        
+        if reason == REASON_ERROR:
+            logger.warning(f"BSS调用可重试失败率 {self._error_rate:.1%}，并发上限调整为 {int(self._limit)}")
+        self._maybe_publish()
+    
+    def _baseline_rtt(self) -> Optional[float]:
+        """窗口内的延迟基线（调用方需持有锁）"""
+        return min(value for _, value in self._rtt_minima) if self._rtt_minima else None
+    
+    def _gradient_limit(self, latency: float, peak_in_flight: int) -> float:
+        """根据窗口平均延迟的梯度计算新上限（调用方需持有锁）"""
+        if self._short_rtt is None:
+            self._short_rtt = latency
+        else:
+            self._short_rtt += (latency - self._short_rtt) * 0.5
+        
+        bucket = int(time.monotonic() // 10) * 10
+        if self._rtt_minima and self._rtt_minima[-1][0] == bucket:
+            if self._short_rtt < self._rtt_minima[-1][1]:
+                self._rtt_minima[-1] = (bucket, self._short_rtt)
+        else:
+            self._rtt_minima.append((bucket, self._short_rtt))
+            while self._rtt_minima[0][0] <= bucket - self.baseline_window:
+                self._rtt_minima.popleft()
+        
+        baseline = self._baseline_rtt()
+        if self._short_rtt <= 0 or not baseline:
+            return self._limit
+        gradient = max(0.5, min(1.0, self.tolerance * baseline / self._short_rtt))
+        if gradient >= 1.0 and peak_in_flight + self._reserved_at(self._limit) < self._limit / 2:
+            # 调用方并发不足，无需继续放大（预留名额按已占用计算，否则只能使用剩余名额的批量流量无法触发增长）
+            return self._limit
+        new_limit = self._limit * gradient + math.sqrt(self._limit)
+        return self._limit * (1 - self.smoothing) + new_limit * self.smoothing
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取当前进程的并发控制状态
+        
+        Returns:
+            Dict[str, Any]: 当前上限、在途请求数、延迟基线、平滑后的错误率及调整次数
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'short_rtt': round(self._short_rtt, 4) if self._short_rtt is not None else None,
+                'baseline_rtt': round(self._baseline_rtt(), 4) if self._rtt_minima else None,
+                'error_rate': round(self._error_rate, 4),
+            })
+        return stats
+    
+    def get_history(self) -> List[Dict[str, Any]]:
+        """
+        获取当前进程的上限变化记录
+        
+        Returns:
+            List[Dict[str, Any]]: [{time: Unix时间戳, limit: 新上限, reason: grow/latency/error}]
+        """
+        with self._condition:
+            return [{'time': at, 'limit': limit, 'reason': reason} for at, limit, reason in self._history]
+    
+    # ---------- 指标导出 ----------
+    
+    def _worker_key(self) -> str:
+        return f"{self.KEY_PREFIX}{socket.gethostname()}:{os.getpid()}"
+    
+    def _maybe_publish(self):
+        """按间隔将当前状态写入Redis，过期时间为3个间隔（进程退出后自动消失）"""
+        now = time.monotonic()
+        if now - self._last_publish < self.publish_interval:
+            return
+        self._last_publish = now
+        stats = self.get_stats()
+        try:
+            redis = get_redis_connection('default')
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.hset(self._worker_key(), mapping={
+                'limit': stats['limit'],
+                'in_flight': stats['in_flight'],
+                'latency_decreases': stats['latency_decreases'],
+                'error_decreases': stats['error_decreases'],
+            })
+            pipeline.expire(self._worker_key(), int(self.publish_interval * 3) + 1)
+            pipeline.execute()
+        except Exception as e:
+            logger.debug(f"BSS并发控制状态写入Redis失败: {str(e)}")
+    
+    def render_prometheus(self) -> str:
+        """
+        以Prometheus文本格式导出各worker的并发上限
+        """
+        redis = get_redis_connection('default')
+        workers = {}
+        for key in sorted(redis.scan_iter(match=f"{self.KEY_PREFIX}*")):
+            key = key.decode() if isinstance(key, bytes) else key
+            workers[key[len(self.KEY_PREFIX):]] = {
+                (field.decode() if isinstance(field, bytes) else field): value.decode() if isinstance(value, bytes) else value
+                for field, value in redis.hgetall(key).items()
+            }
+        
+        lines = []
+        for name, field, metric_type, help_text in (
+            ('bss_concurrency_limit', 'limit', 'gauge', 'Adaptive BSS in-flight request limit'),
+            ('bss_concurrency_in_flight', 'in_flight', 'gauge', 'BSS requests in flight'),
+            ('bss_concurrency_latency_decreases_total', 'latency_decreases', 'counter',
+             'Limit decreases caused by rising latency'),
+            ('bss_concurrency_error_decreases_total', 'error_decreases', 'counter',
+             'Limit decreases caused by retryable failures'),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for worker, values in workers.items():
+                if field in values:
+                    lines.append(f'{name}{{worker="{worker}"}} {values[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全局BSS并发限制器实例
+bss_concurrency_limiter = AdaptiveConcurrencyLimiter(
+    enabled=getattr(settings, 'BSS_API_ADAPTIVE_CONCURRENCY_ENABLED', False),
+    initial_limit=getattr(settings, 'BSS_API_CONCURRENCY_INITIAL_LIMIT', 15),
+    min_limit=getattr(settings, 'BSS_API_CONCURRENCY_MIN_LIMIT', 3),
+    max_limit=getattr(settings, 'BSS_API_CONCURRENCY_MAX_LIMIT', 60),
+    tolerance=getattr(settings, 'BSS_API_CONCURRENCY_LATENCY_TOLERANCE', 2.0),
+    backoff_ratio=getattr(settings, 'BSS_API_CONCURRENCY_BACKOFF_RATIO', 0.75),
+    error_threshold=getattr(settings, 'BSS_API_CONCURRENCY_ERROR_THRESHOLD', 0.15),
+    min_window_samples=getattr(settings, 'BSS_API_CONCURRENCY_WINDOW_SAMPLES', 20),
+    # 交互通道每个ICCID并行三个查询
+    max_reserve=getattr(settings, 'BSS_API_INTERACTIVE_MAX_CONCURRENT', 2) * 3,
+    reserve_ratio=getattr(settings, 'BSS_API_INTERACTIVE_RESERVE_RATIO', 0.25),
+)
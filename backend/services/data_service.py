@@ -2,19 +2,83 @@
 数据服务层
 处理ICC、Subscription、Usage数据的创建和更新
 """
+import hashlib
+import json
 import logging
-from typing import Dict, Any, Optional, Tuple
-from django.db import transaction
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Collection, Dict, Any, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 
 from apps.ICC.models import ICC
 from apps.Subscription.models import Subscription
 from apps.Usage.models import Usage
-from apps.document.models import BadCase
-from .api_clients import api_client_manager
+from .api_clients import api_client_manager, AsyncBSSAPIClient, API_TYPES, LANE_BULK
+from .badcase_recorder import badcase_recorder
+from .bss_response import BSSResponse
+from .identity_map import get_identity_map
 
 logger = logging.getLogger(__name__)
 
+# 用量日期格式
+USAGE_DATE_FORMAT = '%Y%m%d'
+
+# 批量读取用量同步水位时每次IN查询的ICCID数量
+USAGE_MARK_BATCH_SIZE = 1000
+
+# 批量解析ICC、订阅主键时每次IN查询的数量
+KEY_LOOKUP_BATCH_SIZE = 1000
+
+# 用户信息字段到ICC模型字段的映射
+ICC_FIELD_MAP = {
+    'userId': 'userid',
+    'custId': 'custid',
+    'acctId': 'acctid',
+    'paidFlag': 'paidFlag',
+    'imsi': 'imsi',
+    'msisdn': 'msisdn',
+    'brand': 'brand',
+    'rateplanId': 'rateplanId',
+    'lifeCycle': 'lifeCycle',
+    'hlrState': 'hlrState',
+    'lifeCycleTime': 'lifeCycleTime',
+    'activeType': 'activeType',
+    'activeTime': 'activeTime',
+    'effTime': 'effTime',
+    'expTime': 'expTime',
+    'createTime': 'createTime',
+}
+
+# 订阅信息中写入Subscription模型的字段（字段名与模型一致）
+SUBSCRIPTION_FIELDS = (
+    'userId', 'acctId', 'brand', 'productId', 'productFlag', 'status', 'statusTime', 'activeDeadline',
+    'validityUnit', 'validityTime', 'effTime', 'expTime', 'createTime', 'priority', 'changeReason',
+)
+
+# Usage唯一约束（unique_usage_per_day_subscription_product_mnc）的字段
+USAGE_UNIQUE_FIELDS = ['usageDate', 'subscription_id', 'productId', 'visitMnc']
+
+# 订阅的产品ID未知时的占位值
+UNKNOWN_PRODUCT_ID = "unknown"
+
+# 数据写入统计的结果类型：新建、更新、无变化跳过
+WRITE_OUTCOMES = ('created', 'updated', 'skipped')
+
+
+def payload_fingerprint(fields: Dict[str, Any]) -> str:
+    """
+    计算BSS数据指纹：写入字段（规范化JSON）的MD5
+    
+    Args:
+        fields: 模型字段名到值的映射（只含本次BSS数据中出现的字段）
+    """
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.md5(canonical.encode('utf-8')).hexdigest()
+
 
 class DataService:
     """
@@ -24,32 +88,93 @@ class DataService:
     
     def __init__(self):
         self.api_client = api_client_manager
+        self._write_stats = Counter()
+        self._write_stats_lock = threading.Lock()
+    
+    def _count_write(self, kind: str, outcome: str, count: int = 1):
+        """记录数据写入结果（kind: icc/subscription，outcome: created/updated/skipped）"""
+        if count:
+            with self._write_stats_lock:
+                self._write_stats[(kind, outcome)] += count
     
-    def process_iccid_data(self, document_id: int, iccid: str) -> Tuple[bool, str]:
+    def reset_write_stats(self):
+        """清空数据写入统计（每个文档开始处理时调用）"""
+        with self._write_stats_lock:
+            self._write_stats.clear()
+    
+    def get_write_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取当前进程自上次清空以来的数据写入统计
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: icc/subscription到新建、更新、跳过数及跳过比例的映射
+        """
+        with self._write_stats_lock:
+            stats = {
+                kind: {outcome: self._write_stats[(kind, outcome)] for outcome in WRITE_OUTCOMES}
+                for kind in ('icc', 'subscription')
+            }
+        for counts in stats.values():
+            total = sum(counts.values())
+            counts['skip_ratio'] = round(counts['skipped'] / total, 4) if total else 0.0
+        return stats
+    
+    def process_iccid_data(self, document_id: int, iccid: str,
+                           results: Optional[Dict[str, BSSResponse]] = None,
+                           force_refresh: bool = False,
+                           usage_params: Optional[Dict[str, str]] = None,
+                           lane: str = LANE_BULK,
+                           saved: Collection[str] = ()) -> Tuple[bool, str]:
         """
         处理单个ICCID的完整数据流程
         
+        分为两个阶段：获取阶段在事务外并行拉取缺少的API响应（含重试退避），
+        写入阶段在一个短事务内写入全部数据，网络请求期间不持有事务和行锁。
+        
         Args:
             document_id: 文档ID
             iccid: ICCID
+            results: 预先并发获取的API响应（API类型到响应的映射），缺少的响应在获取阶段拉取
+            force_refresh: 拉取响应时是否跳过响应缓存（如错误案例重试）
+            usage_params: 获取用量时使用的查询参数（get_usage_params的结果），为空时按水位计算
+            lane: 拉取响应时使用的请求通道（错误案例重试使用交互通道）
+            saved: 已由apply_batch批量写入的API类型（user/subscription/usage）
             
         Returns:
             Tuple[bool, str]: (是否成功, 错误信息)
         """
+        # 1. 获取阶段（事务外）
+        results = dict(results or {})
+        missing = [api_type for api_type in API_TYPES if api_type not in results]
+        if missing:
+            if 'usage' in missing and usage_params is None:
+                usage_params = self.get_usage_params([iccid]).get(iccid)
+            results.update(self.api_client.query_iccid(iccid, usage_params, force_refresh, lane, missing))
+        
+        # 2. 写入阶段：文档处理期间，本ICCID事务提交后其待写字段才并入批末写入
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            identity_map.begin()
         try:
             with transaction.atomic():
-                # 1. 获取用户信息
-                user_success, user_error = self._process_user_info(document_id, iccid)
+                # 写入用户信息
+                user_success, user_error = self._process_user_info(
+                    document_id, iccid, results['user'], 'user' in saved
+                )
                 
-                # 2. 获取订阅信息
-                subscription_success, subscription_error = self._process_subscription_info(document_id, iccid)
+                # 写入订阅信息
+                subscription_success, subscription_error = self._process_subscription_info(
+                    document_id, iccid, results['subscription'], 'subscription' in saved
+                )
                 
-                # 3. 获取用量信息
-                usage_success, usage_error = self._process_usage_info(document_id, iccid)
+                # 写入用量信息
+                usage_success, usage_error = self._process_usage_info(
+                    document_id, iccid, results['usage'], usage_params, 'usage' in saved
+                )
                 
                 # 判断整体处理结果
                 if user_success and subscription_success and usage_success:
-                    return True, "处理成功"
+                    outcome = (True, "处理成功")
                 else:
                     errors = []
                     if not user_success:
@@ -59,125 +184,688 @@ class DataService:
                     if not usage_success:
                         errors.append(f"用量信息: {usage_error}")
                     
-                    return False, "; ".join(errors)
+                    outcome = (False, "; ".join(errors))
+                
+                # 步骤内捕获的数据库错误会使事务在退出时回滚
+                rolled_back = transaction.get_rollback()
                     
         except Exception as e:
             logger.error(f"处理ICCID {iccid} 时发生异常: {str(e)}")
-            return False, f"处理异常: {str(e)}"
+            outcome = (False, f"处理异常: {str(e)}")
+            rolled_back = True
+        
+        if identity_map is not None:
+            if rolled_back:
+                identity_map.rollback()
+            else:
+                identity_map.commit()
+        return outcome
+    
+    async def fetch_iccid_results_async(self, client: AsyncBSSAPIClient, iccid: str,
+                                        usage_params: Optional[Dict[str, str]] = None) -> Dict[str, BSSResponse]:
+        """
+        异步获取阶段：并行拉取单个ICCID的用户、订阅、用量数据（不访问数据库）
+        
+        Args:
+            client: 异步BSS API客户端
+            iccid: ICCID
+            usage_params: 用量查询的可选参数
+            
+        Returns:
+            Dict[str, BSSResponse]: API类型到响应的映射，可直接传给process_iccid_data
+        """
+        return await self.api_client.query_iccid_async(client, iccid, usage_params)
+    
+    @staticmethod
+    def normalize_results(results: Dict[str, BSSResponse]) -> Dict[str, Any]:
+        """
+        转换阶段：从单个ICCID的API响应中提取可批量写入的数据（不访问数据库）
+        
+        Args:
+            results: API类型到响应的映射
+            
+        Returns:
+            Dict[str, Any]: user（用户数据）、subscriptions（订阅列表）、usages（用量列表），
+            不可批量写入的部分为None（由process_iccid_data逐个处理）
+        """
+        normalized = {'user': None, 'subscriptions': None, 'usages': None}
+        user_result = results.get('user')
+        if user_result is not None and user_result.ok and user_result.get_data("user"):
+            normalized['user'] = user_result.get_data("user")
+        subscription_result = results.get('subscription')
+        if subscription_result is not None and subscription_result.ok:
+            subscriptions = subscription_result.get_data("list", [])
+            # 含缺少subscriptionId的订阅时整个ICCID走逐个写入，保持原有的失败语义
+            if subscriptions and all(sub_data.get('subscriptionId') for sub_data in subscriptions):
+                normalized['subscriptions'] = subscriptions
+        usage_result = results.get('usage')
+        if usage_result is not None and usage_result.ok and usage_result.get_data("list"):
+            normalized['usages'] = usage_result.get_data("list")
+        return normalized
     
-    def _process_user_info(self, document_id: int, iccid: str) -> Tuple[bool, str]:
+    def apply_batch(self, document_id: int, batch: List[Tuple[str, Dict[str, BSSResponse]]],
+                    usage_params: Optional[Dict[str, Dict[str, str]]] = None,
+                    normalized: Optional[List[Dict[str, Any]]] = None) -> List[Tuple[str, bool, str]]:
+        """
+        批量写入一批ICCID的API响应
+        
+        ICC、订阅、用量记录依次分别合并为多行upsert写入，错误案例等仍按ICCID逐个处理
+        （文档处理期间逐个写入的字段更新在批末合并写入）；
+        某一类批量写入失败（如某行数据超长导致整条语句失败）时该类数据回退为逐个ICCID写入，只影响出错的ICCID。
+        
+        Args:
+            document_id: 文档ID
+            batch: (ICCID, API类型到响应的映射) 列表
+            usage_params: ICCID到用量查询参数的映射
+            normalized: 与batch顺序一致的normalize_results结果（已在转换阶段提取时传入）
+            
+        Returns:
+            List[Tuple[str, bool, str]]: (ICCID, 是否成功, 错误信息) 列表，顺序与batch一致
+        """
+        usage_params = usage_params or {}
+        if normalized is None:
+            normalized = [self.normalize_results(results) for _, results in batch]
+        user_payloads = {}
+        subscription_lists = {}
+        usage_lists = {}
+        for (iccid, _), data in zip(batch, normalized):
+            if data['user'] is not None:
+                user_payloads[iccid] = data['user']
+            if data['subscriptions'] is not None:
+                subscription_lists[iccid] = data['subscriptions']
+            if data['usages'] is not None:
+                usage_lists[iccid] = data['usages']
+        
+        saved = {iccid: set() for iccid, _ in batch}
+        written = self._bulk_stage("ICC记录", self.bulk_upsert_iccs, user_payloads.values())
+        if written is not None:
+            for iccid, user_data in user_payloads.items():
+                if user_data.get('iccid') in written:
+                    saved[iccid].add('user')
+        
+        subscription_pks = None
+        if subscription_lists:
+            subscription_pks = self._bulk_stage("订阅记录", self.bulk_upsert_subscriptions, [
+                (iccid, sub_data) for iccid, subscriptions in subscription_lists.items() for sub_data in subscriptions
+            ])
+            if subscription_pks is not None:
+                for iccid in subscription_lists:
+                    saved[iccid].add('subscription')
+        
+        if usage_lists:
+            usage_written = self._bulk_stage("用量记录", self.bulk_upsert_usages, usage_lists, subscription_pks)
+            for iccid in usage_written or ():
+                saved[iccid].add('usage')
+        
+        outcomes = [
+            (iccid, *self.process_iccid_data(
+                document_id, iccid, results, usage_params=usage_params.get(iccid), saved=saved[iccid]
+            ))
+            for iccid, results in batch
+        ]
+        
+        # 逐个写入时记下的字段更新合并写入
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            identity_map.flush()
+        # 事务外写入已到期的错误案例
+        badcase_recorder.flush_if_due()
+        return outcomes
+    
+    @staticmethod
+    def _bulk_stage(name: str, write, *args):
+        """
+        在独立事务中执行一类批量写入，失败时返回None（由调用方回退为逐个写入）
+        """
+        try:
+            with transaction.atomic():
+                return write(*args)
+        except Exception as e:
+            logger.error(f"批量写入{name}失败，改为逐个写入: {str(e)}")
+            return None
+    
+    def _process_user_info(self, document_id: int, iccid: str, result: BSSResponse,
+                           saved: bool = False) -> Tuple[bool, str]:
         """
         处理用户信息
         
         Args:
             document_id: 文档ID
             iccid: ICCID
+            result: 用户信息API响应
+            saved: ICC记录是否已批量写入
             
         Returns:
             Tuple[bool, str]: (是否成功, 错误信息)
         """
         try:
-            # 调用API获取用户信息
-            result = self.api_client.query_user_info(iccid)
-            
-            if result.get("code") == "0000":
-                user_data = result.get("data", {}).get("user", {})
+            if result.ok:
+                user_data = result.get_data("user", {})
                 if user_data:
-                    # 创建或更新ICC记录
-                    self._create_or_update_icc(user_data)
+                    # 创建或更新ICC记录（已批量写入时跳过）
+                    if not saved:
+                        self._create_or_update_icc(user_data)
                     return True, "成功"
                 else:
                     return False, "用户数据为空"
+            elif result.circuit_open:
+                # 熔断快速失败不记录错误案例，由文档整体暂停重排
+                return False, result.message or 'BSS接口熔断中'
             else:
                 # 记录API调用失败
                 self._record_bad_case(
-                    document_id, iccid, 'user',
-                    result.get('_request_info', {}).get('trans_id'),
-                    result.get('_request_info', {}).get('status_code'),
-                    result, result.get('message', '未知错误')
+                    document_id, iccid, 'user', result.trans_id, result.status_code,
+                    result.to_badcase_data(), result.message or '未知错误'
                 )
-                return False, result.get('message', 'API调用失败')
+                return False, result.message or 'API调用失败'
                 
         except Exception as e:
             logger.error(f"处理用户信息时发生异常: {str(e)}")
             return False, f"异常: {str(e)}"
     
-    def _process_subscription_info(self, document_id: int, iccid: str) -> Tuple[bool, str]:
+    def _process_subscription_info(self, document_id: int, iccid: str, result: BSSResponse,
+                                   saved: bool = False) -> Tuple[bool, str]:
         """
         处理订阅信息
         
         Args:
             document_id: 文档ID
             iccid: ICCID
+            result: 订阅信息API响应
+            saved: 订阅记录是否已批量写入
             
         Returns:
             Tuple[bool, str]: (是否成功, 错误信息)
         """
         try:
-            # 调用API获取订阅信息
-            result = self.api_client.query_subscription_info(iccid)
-            
-            if result.get("code") == "0000":
-                subscriptions = result.get("data", {}).get("list", [])
+            if result.ok:
+                subscriptions = result.get_data("list", [])
                 if subscriptions:
-                    # 创建或更新订阅记录
-                    for sub_data in subscriptions:
-                        self._create_or_update_subscription(iccid, sub_data)
+                    # 创建或更新订阅记录（已批量写入时跳过）
+                    if not saved:
+                        for sub_data in subscriptions:
+                            self._create_or_update_subscription(iccid, sub_data)
                     return True, "成功"
                 else:
                     return False, "订阅数据为空"
+            elif result.circuit_open:
+                # 熔断快速失败不记录错误案例，由文档整体暂停重排
+                return False, result.message or 'BSS接口熔断中'
             else:
                 # 记录API调用失败
                 self._record_bad_case(
-                    document_id, iccid, 'subscription',
-                    result.get('_request_info', {}).get('trans_id'),
-                    result.get('_request_info', {}).get('status_code'),
-                    result, result.get('message', '未知错误')
+                    document_id, iccid, 'subscription', result.trans_id, result.status_code,
+                    result.to_badcase_data(), result.message or '未知错误'
                 )
-                return False, result.get('message', 'API调用失败')
+                return False, result.message or 'API调用失败'
                 
         except Exception as e:
             logger.error(f"处理订阅信息时发生异常: {str(e)}")
             return False, f"异常: {str(e)}"
     
-    def _process_usage_info(self, document_id: int, iccid: str) -> Tuple[bool, str]:
+    def _process_usage_info(self, document_id: int, iccid: str, result: BSSResponse,
+                            usage_params: Optional[Dict[str, str]] = None,
+                            saved: bool = False) -> Tuple[bool, str]:
         """
         处理用量信息
         
         Args:
             document_id: 文档ID
             iccid: ICCID
+            result: 用量信息API响应
+            usage_params: 用量查询参数，含begin_date时为增量拉取
+            saved: 用量记录是否已批量写入（同步水位已推进）
             
         Returns:
             Tuple[bool, str]: (是否成功, 错误信息)
         """
         try:
-            # 调用API获取用量信息
-            result = self.api_client.query_usage_info(iccid)
-            
-            if result.get("code") == "0000":
-                usages = result.get("data", {}).get("list", [])
+            if result.ok:
+                usages = result.get_data("list", [])
                 if usages:
-                    # 创建或更新用量记录
-                    for usage_data in usages:
-                        self._create_or_update_usage(iccid, usage_data)
+                    # 创建或更新用量记录，全部写入成功后推进同步水位（已批量写入时跳过）
+                    if not saved:
+                        written = [self._create_or_update_usage(iccid, usage_data) for usage_data in usages]
+                        if all(written):
+                            self._advance_usage_mark(iccid, usages)
                     return True, "成功"
+                elif usage_params and usage_params.get('begin_date'):
+                    # 增量拉取时窗口内无新用量属于正常情况
+                    return True, "无新增用量"
                 else:
                     return False, "用量数据为空"
+            elif result.circuit_open:
+                # 熔断快速失败不记录错误案例，由文档整体暂停重排
+                return False, result.message or 'BSS接口熔断中'
             else:
                 # 记录API调用失败
                 self._record_bad_case(
-                    document_id, iccid, 'usage',
-                    result.get('_request_info', {}).get('trans_id'),
-                    result.get('_request_info', {}).get('status_code'),
-                    result, result.get('message', '未知错误')
+                    document_id, iccid, 'usage', result.trans_id, result.status_code,
+                    result.to_badcase_data(), result.message or '未知错误'
                 )
-                return False, result.get('message', 'API调用失败')
+                return False, result.message or 'API调用失败'
                 
         except Exception as e:
             logger.error(f"处理用量信息时发生异常: {str(e)}")
             return False, f"异常: {str(e)}"
     
+    def get_usage_params(self, iccids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        """
+        根据ICC的用量同步水位计算增量用量查询参数
+        
+        Args:
+            iccids: ICCID列表
+            
+        Returns:
+            Dict[str, Dict[str, str]]: ICCID到{begin_date}的映射；没有水位的ICCID不在结果中（拉取全部历史）
+        """
+        if not getattr(settings, 'BSS_USAGE_INCREMENTAL_ENABLED', True):
+            return {}
+        
+        overlap = timedelta(days=getattr(settings, 'BSS_USAGE_OVERLAP_DAYS', 3))
+        iccids = list(iccids)
+        usage_params = {}
+        for start in range(0, len(iccids), USAGE_MARK_BATCH_SIZE):
+            marks = ICC.objects.filter(
+                iccid__in=iccids[start:start + USAGE_MARK_BATCH_SIZE],
+                usage_synced_date__isnull=False
+            ).values_list('iccid', 'usage_synced_date')
+            for iccid, synced_date in marks:
+                try:
+                    begin_date = datetime.strptime(synced_date, USAGE_DATE_FORMAT) - overlap
+                except ValueError:
+                    continue
+                usage_params[iccid] = {'begin_date': begin_date.strftime(USAGE_DATE_FORMAT)}
+        return usage_params
+    
+    @staticmethod
+    def _usage_mark(usages: Iterable[Dict[str, Any]]) -> Optional[str]:
+        """
+        计算本次入库用量对应的同步水位：各订阅最新用量日期中的最小值
+        
+        各订阅的用量数据进度可能不同，取最小值保证进度落后的订阅下次仍从其最新日期（减去重叠窗口）开始拉取；
+        最新日期比全部订阅中的最新日期早BSS_USAGE_MAX_LAG_DAYS天以上的订阅视为已停用，不再拖住水位。
+        
+        Returns:
+            没有带日期的用量时返回None
+        """
+        latest_by_subscription = {}
+        for usage in usages:
+            usage_date = usage.get('usageDate')
+            if usage_date:
+                subscription_id = usage.get('subscriptionId')
+                latest_by_subscription[subscription_id] = max(
+                    latest_by_subscription.get(subscription_id, usage_date), usage_date
+                )
+        if not latest_by_subscription:
+            return None
+        
+        latest = max(latest_by_subscription.values())
+        try:
+            max_lag = timedelta(days=getattr(settings, 'BSS_USAGE_MAX_LAG_DAYS', 30))
+            cutoff = (datetime.strptime(latest, USAGE_DATE_FORMAT) - max_lag).strftime(USAGE_DATE_FORMAT)
+        except ValueError:
+            return latest
+        return min(usage_date for usage_date in latest_by_subscription.values() if usage_date >= cutoff)
+    
+    def _advance_usage_mark(self, iccid: str, usages: Iterable[Dict[str, Any]]):
+        """
+        将ICC的用量同步水位推进到本次入库用量对应的水位（只前进不后退）
+        """
+        self._advance_usage_marks({iccid: usages})
+    
+    def _advance_usage_marks(self, usage_lists: Dict[str, Iterable[Dict[str, Any]]]):
+        """
+        批量推进用量同步水位：水位相同的ICC合并为一条UPDATE
+        """
+        by_date = {}
+        for iccid, usages in usage_lists.items():
+            mark = self._usage_mark(usages)
+            if mark:
+                by_date.setdefault(mark, []).append(iccid)
+        
+        for latest, iccids in by_date.items():
+            for start in range(0, len(iccids), KEY_LOOKUP_BATCH_SIZE):
+                ICC.objects.filter(iccid__in=iccids[start:start + KEY_LOOKUP_BATCH_SIZE]).filter(
+                    Q(usage_synced_date__isnull=True) | Q(usage_synced_date__lt=latest)
+                ).update(usage_synced_date=latest)
+    
+    def bulk_upsert_iccs(self, user_payloads: Iterable[Dict[str, Any]]) -> Set[str]:
+        """
+        批量创建或更新ICC记录
+        
+        与_create_or_update_icc语义一致：新建时缺失字段为空，更新时只覆盖用户数据中出现的字段。
+        同一ICCID出现多次时按顺序合并；BSS数据指纹未变化的记录不写入，变化的记录只更新变化的字段。
+        
+        Args:
+            user_payloads: 用户数据列表
+            
+        Returns:
+            Set[str]: 已写入的ICCID（缺少iccid的用户数据被跳过）
+        """
+        rows = {}
+        for user_data in user_payloads:
+            iccid = user_data.get('iccid')
+            if not iccid:
+                continue
+            row = rows.setdefault(iccid, {'iccid': iccid})
+            row.update({field: user_data[key] for key, field in ICC_FIELD_MAP.items() if key in user_data})
+        
+        items, _ = self._plan_upsert(ICC, 'iccid', rows.values(), 'icc')
+        self._bulk_write(ICC, ['iccid'], items)
+        self._discard_cached(ICC, 'iccid', rows)
+        return set(rows)
+    
+    def resolve_icc_pks(self, iccids: Iterable[str], create_missing: bool = False) -> Dict[str, int]:
+        """
+        批量解析ICC主键（每KEY_LOOKUP_BATCH_SIZE个ICCID一次IN查询）
+        
+        Args:
+            iccids: ICCID列表
+            create_missing: 是否为不存在的ICCID创建只含ICCID的ICC记录（与逐个写入订阅时一致）
+            
+        Returns:
+            Dict[str, int]: ICCID到ICC主键的映射
+        """
+        iccids = list(set(iccids))
+        pks = {}
+        for start in range(0, len(iccids), KEY_LOOKUP_BATCH_SIZE):
+            pks.update(ICC.objects.filter(
+                iccid__in=iccids[start:start + KEY_LOOKUP_BATCH_SIZE]
+            ).values_list('iccid', 'pk'))
+        
+        missing = [iccid for iccid in iccids if iccid not in pks]
+        if missing and create_missing:
+            self._bulk_upsert(ICC, ['iccid'], [{'iccid': iccid} for iccid in missing])
+            pks.update(self.resolve_icc_pks(missing))
+        return pks
+    
+    def bulk_upsert_subscriptions(self, subscriptions: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        批量创建或更新订阅记录
+        
+        与_create_or_update_subscription语义一致：所属ICC不存在时创建只含ICCID的ICC记录；
+        新建时缺失字段为空，更新时只覆盖订阅数据中出现的字段，已有订阅的所属ICC不变。
+        同一subscriptionId出现多次时按顺序合并，所属ICC取首次出现的ICCID；
+        BSS数据指纹未变化的订阅不写入，变化的订阅只更新变化的字段。
+        
+        Args:
+            subscriptions: (ICCID, 订阅数据) 列表
+            
+        Returns:
+            Dict[str, int]: subscriptionId到订阅主键的映射（供用量写入使用，缺少subscriptionId的订阅被跳过）
+        """
+        rows = {}
+        owners = {}
+        for iccid, sub_data in subscriptions:
+            subscription_id = sub_data.get('subscriptionId')
+            if not subscription_id:
+                continue
+            owners.setdefault(subscription_id, iccid)
+            row = rows.setdefault(subscription_id, {'subscriptionId': subscription_id})
+            row.update({field: sub_data[field] for field in SUBSCRIPTION_FIELDS if field in sub_data})
+        if not rows:
+            return {}
+        
+        icc_pks = self.resolve_icc_pks(owners.values(), create_missing=True)
+        for subscription_id, row in rows.items():
+            row['icc_id'] = icc_pks[owners[subscription_id]]
+        
+        items, pks = self._plan_upsert(Subscription, 'subscriptionId', rows.values(), 'subscription',
+                                       insert_only_fields=('icc_id',))
+        self._bulk_write(Subscription, ['subscriptionId'], items)
+        self._discard_cached(Subscription, 'subscriptionId', rows)
+        created = [subscription_id for subscription_id in rows if subscription_id not in pks]
+        if created:
+            pks.update(self.resolve_subscription_pks(created))
+        return pks
+    
+    def resolve_subscription_pks(self, subscription_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        批量解析订阅主键（每KEY_LOOKUP_BATCH_SIZE个subscriptionId一次IN查询）
+        
+        Returns:
+            Dict[str, int]: subscriptionId到订阅主键的映射，不存在的订阅不在结果中
+        """
+        subscription_ids = list(subscription_ids)
+        pks = {}
+        for start in range(0, len(subscription_ids), KEY_LOOKUP_BATCH_SIZE):
+            pks.update(Subscription.objects.filter(
+                subscriptionId__in=subscription_ids[start:start + KEY_LOOKUP_BATCH_SIZE]
+            ).values_list('subscriptionId', 'pk'))
+        return pks
+    
+    def bulk_upsert_usages(self, usage_lists: Dict[str, List[Dict[str, Any]]],
+                           subscription_pks: Optional[Dict[str, int]] = None) -> Set[str]:
+        """
+        批量创建或更新用量记录，并推进同步水位
+        
+        按唯一约束（usageDate, subscription, productId, visitMnc）多行upsert，冲突时更新用量值等字段，
+        与_create_or_update_usage的update_or_create语义一致；subscriptionId直接取自订阅映射，不逐行查询订阅。
+        以下ICCID不写入，由调用方逐个写入（保持原有行为）：ICC不存在、用量引用的订阅不存在（需创建占位订阅）、
+        用量缺少subscriptionId/usageDate/productId，或visitMnc为空（唯一约束中的NULL互不冲突，无法upsert）。
+        
+        Args:
+            usage_lists: ICCID到用量数据列表的映射
+            subscription_pks: bulk_upsert_subscriptions返回的subscriptionId到订阅主键的映射
+            
+        Returns:
+            Set[str]: 已写入的ICCID
+        """
+        subscription_pks = dict(subscription_pks or {})
+        referenced = {
+            usage_data.get('subscriptionId') for usages in usage_lists.values() for usage_data in usages
+            if usage_data.get('subscriptionId')
+        }
+        unresolved = referenced.difference(subscription_pks)
+        if unresolved:
+            subscription_pks.update(self.resolve_subscription_pks(unresolved))
+        icc_pks = self.resolve_icc_pks(usage_lists)
+        
+        rows = {}
+        products = {}
+        written = set()
+        for iccid, usages in usage_lists.items():
+            if iccid not in icc_pks or not all(
+                usage_data.get('subscriptionId') in subscription_pks and usage_data.get('usageDate')
+                and usage_data.get('productId') and usage_data.get('visitMnc') is not None
+                for usage_data in usages
+            ):
+                continue
+            
+            for usage_data in usages:
+                subscription_id = usage_data['subscriptionId']
+                subscription_pk = subscription_pks[subscription_id]
+                key = (usage_data['usageDate'], subscription_pk, usage_data['productId'], usage_data['visitMnc'])
+                rows[key] = {
+                    'usageDate': usage_data['usageDate'],
+                    'subscription_id': subscription_pk,
+                    'productId': usage_data['productId'],
+                    'visitMnc': usage_data['visitMnc'],
+                    'subscriptionId': subscription_id,
+                    'usageType': usage_data.get('usageType', 'dat'),
+                    'callType': usage_data.get('callType'),
+                    'visitMcc': usage_data.get('visitMcc'),
+                    'usage': usage_data.get('usage'),
+                    'unit': usage_data.get('unit', 'Byte'),
+                }
+                products.setdefault(subscription_pk, (usage_data['productId'], subscription_id))
+            written.add(iccid)
+        
+        if not rows:
+            return written
+        
+        self._bulk_upsert(Usage, USAGE_UNIQUE_FIELDS, rows.values())
+        
+        # 产品ID未知的订阅以用量中的产品ID补全（与逐个写入时一致）
+        unknown = Subscription.objects.filter(pk__in=list(products)).filter(
+            Q(productId__isnull=True) | Q(productId='') | Q(productId=UNKNOWN_PRODUCT_ID)
+        ).values_list('pk', flat=True)
+        for subscription_pk in unknown:
+            product_id, subscription_id = products[subscription_pk]
+            Subscription.objects.filter(pk=subscription_pk).update(
+                productId=product_id, payload_hash=None, updated_at=timezone.now()
+            )
+            self._discard_cached(Subscription, 'subscriptionId', [subscription_id])
+        
+        self._advance_usage_marks({iccid: usage_lists[iccid] for iccid in written})
+        return written
+    
+    def _plan_upsert(self, model, key_field: str, rows: Iterable[Dict[str, Any]], kind: str,
+                     insert_only_fields: Tuple[str, ...] = ()) -> Tuple[List[Tuple[Dict[str, Any], List[str]]], Dict[str, int]]:
+        """
+        按BSS数据指纹规划批量写入：每KEY_LOOKUP_BATCH_SIZE个唯一键一次IN查询读取已有记录的指纹和字段值
+        
+        - 不存在的记录：新建（冲突时更新全部字段）
+        - 指纹与本次数据一致：跳过
+        - 其他：只更新值变化的字段和指纹；字段值均未变化（如指纹尚未写入）时只更新指纹
+        
+        Args:
+            model: 模型类
+            key_field: 唯一键字段
+            rows: 字段名到值的映射列表（同一唯一键只能出现一次）
+            kind: 写入统计的类型（icc/subscription）
+            insert_only_fields: 只在新建时写入的字段，不计入指纹
+            
+        Returns:
+            Tuple: ([(行, 冲突时更新的字段)], 已存在记录的唯一键到主键的映射)
+        """
+        rows = list(rows)
+        value_fields = sorted({field for row in rows for field in row}.difference([key_field], insert_only_fields))
+        keys = [row[key_field] for row in rows]
+        existing = {}
+        for start in range(0, len(keys), KEY_LOOKUP_BATCH_SIZE):
+            for values in model.objects.filter(
+                **{f'{key_field}__in': keys[start:start + KEY_LOOKUP_BATCH_SIZE]}
+            ).values('pk', 'payload_hash', key_field, *value_fields):
+                existing[values[key_field]] = values
+        
+        items = []
+        outcomes = Counter()
+        for row in rows:
+            fields = {field: value for field, value in row.items() if field != key_field and field not in insert_only_fields}
+            payload_hash = payload_fingerprint(fields)
+            current = existing.get(row[key_field])
+            if current is None:
+                items.append(({**row, 'payload_hash': payload_hash}, sorted(fields) + ['payload_hash']))
+                outcomes['created'] += 1
+            elif current['payload_hash'] == payload_hash:
+                outcomes['skipped'] += 1
+            else:
+                changed = sorted(field for field, value in fields.items() if current[field] != value)
+                items.append(({**row, 'payload_hash': payload_hash}, changed + ['payload_hash']))
+                outcomes['updated' if changed else 'skipped'] += 1
+        
+        for outcome, count in outcomes.items():
+            self._count_write(kind, outcome, count)
+        return items, {key: values['pk'] for key, values in existing.items()}
+    
+    def _bulk_upsert(self, model, unique_fields: List[str], rows: Iterable[Dict[str, Any]],
+                     touch_fields: Tuple[str, ...] = ('updated_at',),
+                     insert_only_fields: Tuple[str, ...] = ()) -> int:
+        """
+        按唯一键批量插入或更新，冲突时更新行中出现的全部字段（除唯一键和insert_only_fields）
+        
+        Args:
+            model: 模型类
+            unique_fields: 唯一键字段
+            rows: 字段名到值的映射列表（同一唯一键只能出现一次）
+            touch_fields: 冲突更新时额外更新的字段（auto_now时间戳）
+            insert_only_fields: 只在新建时写入、冲突时不更新的字段（如外键）
+            
+        Returns:
+            int: 写入的行数
+        """
+        return self._bulk_write(model, unique_fields, [
+            (row, sorted(set(row).difference(unique_fields, insert_only_fields))) for row in rows
+        ], touch_fields)
+    
+    def _bulk_write(self, model, unique_fields: List[str], items: Iterable[Tuple[Dict[str, Any], List[str]]],
+                    touch_fields: Tuple[str, ...] = ('updated_at',)) -> int:
+        """
+        按唯一键批量插入或更新（bulk_create(update_conflicts=True)，即多行
+        INSERT ... ON CONFLICT DO UPDATE / ON DUPLICATE KEY UPDATE）
+        
+        按字段集合和冲突更新字段分组，每组按BSS_DB_UPSERT_BATCH_SIZE行一条语句；
+        MySQL不支持指定冲突目标，由表上的唯一索引判断冲突。
+        
+        Args:
+            model: 模型类
+            unique_fields: 唯一键字段
+            items: (字段名到值的映射, 冲突时更新的字段) 列表（同一唯一键只能出现一次）
+            touch_fields: 冲突更新时额外更新的字段（auto_now时间戳）
+            
+        Returns:
+            int: 写入的行数
+        """
+        batch_size = getattr(settings, 'BSS_DB_UPSERT_BATCH_SIZE', 500)
+        groups = {}
+        for row, update_fields in items:
+            groups.setdefault((frozenset(row), tuple(update_fields)), []).append(row)
+        
+        written = 0
+        for (_, update_fields), group in groups.items():
+            objs = [model(**row) for row in group]
+            if update_fields:
+                model.objects.bulk_create(
+                    objs,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=unique_fields if connection.features.supports_update_conflicts_with_target else None,
+                    update_fields=list(update_fields) + list(touch_fields)
+                )
+            else:
+                # 只有唯一键时无需更新，已存在的行保持不变
+                model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+            written += len(objs)
+        return written
+    
+    @staticmethod
+    def _get_cached(model, field: str, value):
+        """文档处理期间从身份映射取实例，未缓存或不在文档处理范围内时返回None"""
+        identity_map = get_identity_map()
+        return identity_map.get(model, field, value) if identity_map is not None else None
+    
+    @staticmethod
+    def _cache(instance, field: str):
+        """文档处理期间将实例放入身份映射"""
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            identity_map.add(instance, field)
+    
+    @staticmethod
+    def _discard_cached(model, field: str, values: Iterable):
+        """批量写入后淘汰身份映射中的旧实例"""
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            identity_map.discard(model, field, values)
+    
+    def _get_icc(self, iccid: str) -> ICC:
+        """
+        获取ICC记录（文档处理期间优先取身份映射中的实例）
+        
+        Raises:
+            ICC.DoesNotExist: ICC不存在
+        """
+        icc = self._get_cached(ICC, 'iccid', iccid)
+        if icc is None:
+            icc = ICC.objects.get(iccid=iccid)
+            self._cache(icc, 'iccid')
+        return icc
+    
+    @staticmethod
+    def _save_fields(instance, fields: List[str]):
+        """
+        保存实例的指定字段（及updated_at）；文档处理期间记为待写，由apply_batch在批末合并写入
+        """
+        identity_map = get_identity_map()
+        if identity_map is None:
+            instance.save(update_fields=fields + ['updated_at'])
+            return
+        # bulk_update不处理auto_now，手动更新时间戳
+        instance.updated_at = timezone.now()
+        identity_map.mark_dirty(instance, fields + ['updated_at'])
+    
     def _create_or_update_icc(self, user_data: Dict[str, Any]) -> ICC:
         """
         创建或更新ICC记录
@@ -192,51 +880,51 @@ class DataService:
         if not iccid:
             raise ValueError("ICCID不能为空")
         
+        fields = {field: user_data[key] for key, field in ICC_FIELD_MAP.items() if key in user_data}
+        payload_hash = payload_fingerprint(fields)
+        
         # 获取或创建ICC记录
-        icc, created = ICC.objects.get_or_create(
-            iccid=iccid,
-            defaults={
-                'userid': user_data.get('userId'),
-                'custid': user_data.get('custId'),
-                'acctid': user_data.get('acctId'),
-                'paidFlag': user_data.get('paidFlag'),
-                'imsi': user_data.get('imsi'),
-                'msisdn': user_data.get('msisdn'),
-                'brand': user_data.get('brand'),
-                'rateplanId': user_data.get('rateplanId'),
-                'lifeCycle': user_data.get('lifeCycle'),
-                'hlrState': user_data.get('hlrState'),
-                'lifeCycleTime': user_data.get('lifeCycleTime'),
-                'activeType': user_data.get('activeType'),
-                'activeTime': user_data.get('activeTime'),
-                'effTime': user_data.get('effTime'),
-                'expTime': user_data.get('expTime'),
-                'createTime': user_data.get('createTime'),
-            }
-        )
-        
-        if not created:
-            # 更新现有记录
-            icc.userid = user_data.get('userId', icc.userid)
-            icc.custid = user_data.get('custId', icc.custid)
-            icc.acctid = user_data.get('acctId', icc.acctid)
-            icc.paidFlag = user_data.get('paidFlag', icc.paidFlag)
-            icc.imsi = user_data.get('imsi', icc.imsi)
-            icc.msisdn = user_data.get('msisdn', icc.msisdn)
-            icc.brand = user_data.get('brand', icc.brand)
-            icc.rateplanId = user_data.get('rateplanId', icc.rateplanId)
-            icc.lifeCycle = user_data.get('lifeCycle', icc.lifeCycle)
-            icc.hlrState = user_data.get('hlrState', icc.hlrState)
-            icc.lifeCycleTime = user_data.get('lifeCycleTime', icc.lifeCycleTime)
-            icc.activeType = user_data.get('activeType', icc.activeType)
-            icc.activeTime = user_data.get('activeTime', icc.activeTime)
-            icc.effTime = user_data.get('effTime', icc.effTime)
-            icc.expTime = user_data.get('expTime', icc.expTime)
-            icc.createTime = user_data.get('createTime', icc.createTime)
-            icc.save()
+        icc = self._get_cached(ICC, 'iccid', iccid)
+        created = False
+        if icc is None:
+            icc, created = ICC.objects.get_or_create(
+                iccid=iccid,
+                defaults={
+                    **{field: user_data.get(key) for key, field in ICC_FIELD_MAP.items()},
+                    'payload_hash': payload_hash,
+                }
+            )
+            self._cache(icc, 'iccid')
+        
+        if created:
+            self._count_write('icc', 'created')
+        else:
+            # 更新现有记录（只更新变化的字段）
+            self._apply_changes(icc, fields, payload_hash, 'icc')
         
         return icc
     
+    def _apply_changes(self, instance, fields: Dict[str, Any], payload_hash: str, kind: str):
+        """
+        按BSS数据更新已有记录：指纹一致时跳过，否则只保存值变化的字段和指纹
+        
+        Args:
+            instance: ICC或订阅实例
+            fields: 本次BSS数据中出现的模型字段
+            payload_hash: fields的指纹
+            kind: 写入统计的类型（icc/subscription）
+        """
+        if instance.payload_hash == payload_hash:
+            self._count_write(kind, 'skipped')
+            return
+        
+        changed = [field for field, value in fields.items() if getattr(instance, field) != value]
+        for field in changed:
+            setattr(instance, field, fields[field])
+        instance.payload_hash = payload_hash
+        self._save_fields(instance, changed + ['payload_hash'])
+        self._count_write(kind, 'updated' if changed else 'skipped')
+    
     def _create_or_update_subscription(self, iccid: str, sub_data: Dict[str, Any]) -> Subscription:
         """
         创建或更新订阅记录
@@ -254,55 +942,37 @@ class DataService:
         
         # 获取ICC记录
         try:
-            icc = ICC.objects.get(iccid=iccid)
+            icc = self._get_icc(iccid)
         except ICC.DoesNotExist:
             # 如果ICC不存在，创建一个基本的ICC记录
             icc = ICC.objects.create(
                 iccid=iccid,
                 # 其他字段留空
             )
+            self._cache(icc, 'iccid')
+        
+        fields = {field: sub_data[field] for field in SUBSCRIPTION_FIELDS if field in sub_data}
+        payload_hash = payload_fingerprint(fields)
         
         # 获取或创建订阅记录
-        subscription, created = Subscription.objects.get_or_create(
-            subscriptionId=subscription_id,
-            defaults={
-                'icc': icc,
-                'userId': sub_data.get('userId'),
-                'acctId': sub_data.get('acctId'),
-                'brand': sub_data.get('brand'),
-                'productId': sub_data.get('productId'),
-                'productFlag': sub_data.get('productFlag'),
-                'status': sub_data.get('status'),
-                'statusTime': sub_data.get('statusTime'),
-                'activeDeadline': sub_data.get('activeDeadline'),
-                'validityUnit': sub_data.get('validityUnit'),
-                'validityTime': sub_data.get('validityTime'),
-                'effTime': sub_data.get('effTime'),
-                'expTime': sub_data.get('expTime'),
-                'createTime': sub_data.get('createTime'),
-                'priority': sub_data.get('priority'),
-                'changeReason': sub_data.get('changeReason'),
-            }
-        )
-        
-        if not created:
-            # 更新现有记录
-            subscription.userId = sub_data.get('userId', subscription.userId)
-            subscription.acctId = sub_data.get('acctId', subscription.acctId)
-            subscription.brand = sub_data.get('brand', subscription.brand)
-            subscription.productId = sub_data.get('productId', subscription.productId)
-            subscription.productFlag = sub_data.get('productFlag', subscription.productFlag)
-            subscription.status = sub_data.get('status', subscription.status)
-            subscription.statusTime = sub_data.get('statusTime', subscription.statusTime)
-            subscription.activeDeadline = sub_data.get('activeDeadline', subscription.activeDeadline)
-            subscription.validityUnit = sub_data.get('validityUnit', subscription.validityUnit)
-            subscription.validityTime = sub_data.get('validityTime', subscription.validityTime)
-            subscription.effTime = sub_data.get('effTime', subscription.effTime)
-            subscription.expTime = sub_data.get('expTime', subscription.expTime)
-            subscription.createTime = sub_data.get('createTime', subscription.createTime)
-            subscription.priority = sub_data.get('priority', subscription.priority)
-            subscription.changeReason = sub_data.get('changeReason', subscription.changeReason)
-            subscription.save()
+        subscription = self._get_cached(Subscription, 'subscriptionId', subscription_id)
+        created = False
+        if subscription is None:
+            subscription, created = Subscription.objects.get_or_create(
+                subscriptionId=subscription_id,
+                defaults={
+                    'icc': icc,
+                    **{field: sub_data.get(field) for field in SUBSCRIPTION_FIELDS},
+                    'payload_hash': payload_hash,
+                }
+            )
+            self._cache(subscription, 'subscriptionId')
+        
+        if created:
+            self._count_write('subscription', 'created')
+        else:
+            # 更新现有记录（只更新变化的字段）
+            self._apply_changes(subscription, fields, payload_hash, 'subscription')
         
         return subscription
     
@@ -319,7 +989,7 @@ class DataService:
         """
         try:
             # 获取ICC记录
-            icc = ICC.objects.get(iccid=iccid)
+            icc = self._get_icc(iccid)
             
             # 从用量数据中获取subscriptionId和productId
             subscription_id = usage_data.get('subscriptionId')
@@ -330,35 +1000,42 @@ class DataService:
                 return None
             
             # 获取或创建订阅记录
-            subscription, created = Subscription.objects.get_or_create(
-                subscriptionId=subscription_id,
-                defaults={
-                    'icc': icc,
-                    'productId': product_id or "unknown",
-                    'brand': icc.brand,  # 从ICC记录继承
-                    'userId': icc.userid,  # 从ICC记录继承
-                    'acctId': icc.acctid,  # 从ICC记录继承
-                    # 其他字段留空，等待订阅信息API补充
-                }
-            )
+            subscription = self._get_cached(Subscription, 'subscriptionId', subscription_id)
+            created = False
+            if subscription is None:
+                subscription, created = Subscription.objects.get_or_create(
+                    subscriptionId=subscription_id,
+                    defaults={
+                        'icc': icc,
+                        'productId': product_id or UNKNOWN_PRODUCT_ID,
+                        'brand': icc.brand,  # 从ICC记录继承
+                        'userId': icc.userid,  # 从ICC记录继承
+                        'acctId': icc.acctid,  # 从ICC记录继承
+                        # 其他字段留空，等待订阅信息API补充
+                    }
+                )
+                self._cache(subscription, 'subscriptionId')
             
             # 如果订阅已存在但productId为空，更新它
-            if not created and (not subscription.productId or subscription.productId == "unknown"):
-                subscription.productId = product_id or "unknown"
-                subscription.save()
+            if not created and (not subscription.productId or subscription.productId == UNKNOWN_PRODUCT_ID):
+                subscription.productId = product_id or UNKNOWN_PRODUCT_ID
+                subscription.payload_hash = None
+                self._save_fields(subscription, ['productId', 'payload_hash'])
             
-            # 创建用量记录
-            usage = Usage.objects.create(
+            # 创建或更新用量记录（重叠窗口内的日期会再次返回，按唯一约束更新）
+            usage, _ = Usage.objects.update_or_create(
                 usageDate=usage_data.get('usageDate'),
                 subscription=subscription,
-                subscriptionId=subscription_id,
                 productId=product_id or subscription.productId,
-                usageType=usage_data.get('usageType', 'dat'),
-                callType=usage_data.get('callType'),
-                visitMcc=usage_data.get('visitMcc'),
                 visitMnc=usage_data.get('visitMnc'),
-                usage=usage_data.get('usage'),
-                unit=usage_data.get('unit', 'Byte'),
+                defaults={
+                    'subscriptionId': subscription_id,
+                    'usageType': usage_data.get('usageType', 'dat'),
+                    'callType': usage_data.get('callType'),
+                    'visitMcc': usage_data.get('visitMcc'),
+                    'usage': usage_data.get('usage'),
+                    'unit': usage_data.get('unit', 'Byte'),
+                }
             )
             
             return usage
@@ -374,7 +1051,7 @@ class DataService:
                         trans_id: str, status_code: int, response_data: Dict[str, Any], 
                         error_message: str):
         """
-        记录错误案例
+        记录错误案例（先缓存，由badcase_recorder批量写入）
         
         Args:
             document_id: 文档ID
@@ -386,19 +1063,8 @@ class DataService:
             error_message: 错误信息
         """
         try:
-            from apps.document.models import Document
-            document = Document.objects.get(id=document_id)
-            
-            BadCase.objects.update_or_create(
-                document=document,
-                iccid=iccid,
-                api_type=api_type,
-                defaults={
-                    'trans_id': trans_id,
-                    'status_code': status_code,
-                    'response_data': response_data,
-                    'error_message': error_message,
-                }
+            badcase_recorder.record(
+                document_id, iccid, api_type, trans_id, status_code, response_data, error_message
             )
         except Exception as e:
             logger.error(f"记录错误案例时发生异常: {str(e)}")
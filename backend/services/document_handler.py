@@ -2,18 +2,31 @@
 文档处理服务
 处理CDR文件的扫描、解析和处理
 """
+import asyncio
 import os
 import re
 import shutil
 import csv
 import logging
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, Optional, Tuple
 from pathlib import Path
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
 
 from apps.document.models import Document
+from .api_clients import api_client_manager, AsyncBSSAPIClient, LANE_BULK
+from .badcase_recorder import badcase_recorder
+from .bss_cache import bss_response_cache
+from .bss_metrics import bss_metrics
+from .bss_response import BSSResponse
+from .circuit_breaker import BSSUnavailableError
+from .concurrency_limiter import bss_concurrency_limiter
 from .data_service import data_service
+from .hedging import bss_hedging_policy
+from .identity_map import document_scope
+from .pipeline import create_document_pipeline
+from .singleflight import bss_singleflight
 
 logger = logging.getLogger(__name__)
 
@@ -275,104 +288,310 @@ class DocumentHandler:
         logger.info(f"提取到 {len(iccids)} 个唯一ICCID")
         return iccids
     
-    def process_document(self, document_id: int) -> bool:
+    def _load_document_iccids(self, document_id: int) -> Optional[Tuple[Document, Path, List[str]]]:
         """
-        处理文档
+        加载文档并解析出待处理的唯一ICCID
         
         Args:
             document_id: 文档ID
             
+        Returns:
+            Optional[Tuple[Document, Path, List[str]]]: (文档, 文件路径, ICCID列表)，
+            文件不存在或无有效ICCID时标记文档失败并返回None
+        """
+        # 获取文档记录
+        document = Document.objects.get(id=document_id)
+        file_path = Path(document.file_path)
+        
+        # 检查文件是否存在
+        if not file_path.exists():
+            logger.error(f"文件不存在: {file_path}")
+            document.mark_as_failed("文件不存在")
+            return None
+        
+        # 解析CSV文件
+        data_list = self.parse_csv_file(file_path)
+        if not data_list:
+            logger.error(f"CSV文件解析失败或为空: {file_path}")
+            document.mark_as_failed("CSV文件解析失败或为空")
+            return None
+        
+        # 提取唯一ICCID
+        unique_iccids = self.extract_unique_iccids(data_list)
+        if not unique_iccids:
+            logger.error(f"未找到有效的ICCID: {file_path}")
+            document.mark_as_failed("未找到有效的ICCID")
+            return None
+        
+        # 更新文档统计信息
+        document.total_iccid_count = len(unique_iccids)
+        document.save()
+        
+        return document, file_path, list(unique_iccids)
+    
+    def _process_iccid_chunk(self, document: Document, chunk_results: List[Tuple[str, Dict[str, BSSResponse]]],
+                             counts: Dict[str, int], usage_params: Dict[str, Dict[str, str]],
+                             normalized: Optional[List[Dict[str, Any]]] = None):
+        """
+        批量写入一批ICCID的API响应并更新文档进度
+        
+        Args:
+            document: 文档实例
+            chunk_results: (ICCID, API类型到响应的映射) 列表
+            counts: 成功/失败计数（原地更新）
+            usage_params: ICCID到用量查询参数的映射
+            normalized: 转换阶段已提取的数据（与chunk_results顺序一致）
+        """
+        if not chunk_results:
+            return
+        
+        try:
+            outcomes = data_service.apply_batch(document.id, chunk_results, usage_params, normalized)
+        except Exception as e:
+            logger.error(f"批量写入ICCID数据时发生异常: {str(e)}")
+            outcomes = [(iccid, False, f"处理异常: {str(e)}") for iccid, _ in chunk_results]
+        
+        for iccid, success, error_msg in outcomes:
+            if success:
+                counts['success'] += 1
+            else:
+                counts['failed'] += 1
+                logger.warning(f"处理ICCID {iccid} 失败: {error_msg}")
+        
+        # 更新处理进度（每批一次）
+        document.processed_iccid_count += len(outcomes)
+        document.success_iccid_count = counts['success']
+        document.failed_iccid_count = counts['failed']
+        document.save()
+    
+    def _finalize_document(self, document: Document, file_path: Path, counts: Dict[str, int]) -> bool:
+        """
+        根据处理结果更新文档状态并移动文件
+        
         Returns:
             bool: 是否处理成功
         """
+        success_count = counts['success']
+        failed_count = counts['failed']
+        
+        # 判断整体处理结果
+        if failed_count == 0:
+            # 全部成功
+            document.mark_as_success()
+            self.move_file_to_success(file_path)
+            logger.info(f"文档处理成功: {document.filename}")
+            return True
+        elif success_count > 0:
+            # 部分成功
+            document.mark_as_success()  # 部分成功也标记为成功
+            self.move_file_to_success(file_path)
+            logger.info(f"文档处理完成（部分成功）: {document.filename}")
+            return True
+        else:
+            # 全部失败
+            document.mark_as_failed("所有ICCID处理失败")
+            self.move_file_to_failed(file_path)
+            logger.error(f"文档处理失败: {document.filename}")
+            return False
+    
+    def _check_circuit(self, iccid: str, results: Dict[str, BSSResponse]):
+        """
+        BSS接口熔断时中止文档处理，避免为剩余ICCID逐个快速失败
+        
+        Raises:
+            BSSUnavailableError: 任一查询因熔断快速失败
+        """
+        if api_client_manager.is_circuit_open(results):
+            raise BSSUnavailableError(
+                f"BSS接口熔断中，处理在ICCID {iccid} 处暂停",
+                retry_after=api_client_manager.circuit_breaker.cooldown
+            )
+    
+    def _pause_document(self, document_id: int, e: BSSUnavailableError):
+        """
+        暂停文档处理，文件保留在processing目录等待重新排队
+        """
+        logger.warning(f"文档 {document_id} 暂停处理: {str(e)}")
+        try:
+            Document.objects.get(id=document_id).mark_as_paused(str(e))
+        except Exception as pause_error:
+            logger.error(f"暂停文档时发生异常: {str(pause_error)}")
+    
+    def _handle_document_exception(self, document_id: int, e: Exception):
+        """
+        处理文档时发生异常：标记失败并移动文件到失败目录
+        """
+        logger.error(f"处理文档时发生异常: {str(e)}")
+        self.fail_document(document_id, f"处理异常: {str(e)}")
+    
+    def fail_document(self, document_id: int, error_message: str):
+        """
+        标记文档处理失败并移动文件到失败目录（可通过重试失败文档重新处理）
+        """
         try:
-            # 获取文档记录
             document = Document.objects.get(id=document_id)
+            document.mark_as_failed(error_message)
+            # 移动文件到失败目录
             file_path = Path(document.file_path)
+            if file_path.exists():
+                self.move_file_to_failed(file_path)
+        except:
+            pass
+    
+    def process_document(self, document_id: int, lane: str = LANE_BULK) -> bool:
+        """
+        处理文档
+        
+        Args:
+            document_id: 文档ID
+            lane: BSS请求通道（bulk/interactive）
             
-            # 检查文件是否存在
-            if not file_path.exists():
-                logger.error(f"文件不存在: {file_path}")
-                document.mark_as_failed("文件不存在")
-                return False
+        Returns:
+            bool: 是否处理成功
             
-            # 解析CSV文件
-            data_list = self.parse_csv_file(file_path)
-            if not data_list:
-                logger.error(f"CSV文件解析失败或为空: {file_path}")
-                document.mark_as_failed("CSV文件解析失败或为空")
+        Raises:
+            BSSUnavailableError: BSS接口熔断，文档已暂停，需稍后重新排队
+        """
+        try:
+            loaded = self._load_document_iccids(document_id)
+            if loaded is None:
                 return False
+            document, file_path, unique_iccids = loaded
             
-            # 提取唯一ICCID
-            unique_iccids = self.extract_unique_iccids(data_list)
-            if not unique_iccids:
-                logger.error(f"未找到有效的ICCID: {file_path}")
-                document.mark_as_failed("未找到有效的ICCID")
-                return False
+            # 处理每个ICCID
+            counts = {'success': 0, 'failed': 0}
+            data_service.reset_write_stats()
             
-            # 更新文档统计信息
-            document.total_iccid_count = len(unique_iccids)
-            document.save()
+            # 按用量同步水位增量拉取用量
+            usage_params = data_service.get_usage_params(unique_iccids)
             
-            # 处理每个ICCID
-            success_count = 0
-            failed_count = 0
+            # 获取（有界并发请求BSS）→ 转换（熔断检查、提取数据）→ 写入（每BSS_DB_WRITE_BATCH_SIZE个批量写库）
+            # 流水线执行，熔断时写入已获取的结果后暂停
+            def transform(item):
+                iccid, results = item
+                self._check_circuit(iccid, results)
+                return iccid, results, data_service.normalize_results(results)
+            
+            def write(items):
+                self._process_iccid_chunk(
+                    document, [(iccid, results) for iccid, results, _ in items], counts, usage_params,
+                    [normalized for _, _, normalized in items]
+                )
             
-            for iccid in unique_iccids:
+            pipeline = create_document_pipeline()
+            # 文档处理期间缓存ICC、订阅等实例，逐个写入的字段更新每批合并写入
+            with document_scope() as identity_map:
                 try:
-                    # 处理ICCID数据
-                    success, error_msg = data_service.process_iccid_data(document_id, iccid)
-                    
-                    if success:
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                        logger.warning(f"处理ICCID {iccid} 失败: {error_msg}")
-                    
-                    # 更新处理进度
-                    document.processed_iccid_count += 1
-                    document.success_iccid_count = success_count
-                    document.failed_iccid_count = failed_count
-                    document.save()
-                    
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"处理ICCID {iccid} 时发生异常: {str(e)}")
+                    pipeline.run(api_client_manager.iter_iccid_results(unique_iccids, usage_params, lane=lane),
+                                 transform, write)
+                finally:
+                    # 文档处理结束（含熔断暂停）时写入缓存的错误案例
+                    badcase_recorder.flush()
+                    logger.info(f"文档处理流水线统计: {pipeline.get_stats()}")
             
-            # 判断整体处理结果
-            if failed_count == 0:
-                # 全部成功
-                document.mark_as_success()
-                self.move_file_to_success(file_path)
-                logger.info(f"文档处理成功: {document.filename}")
-                return True
-            elif success_count > 0:
-                # 部分成功
-                document.mark_as_success()  # 部分成功也标记为成功
-                self.move_file_to_success(file_path)
-                logger.info(f"文档处理完成（部分成功）: {document.filename}")
-                return True
-            else:
-                # 全部失败
-                document.mark_as_failed("所有ICCID处理失败")
-                self.move_file_to_failed(file_path)
-                logger.error(f"文档处理失败: {document.filename}")
-                return False
+            logger.info(f"BSS连接池统计: {api_client_manager.client.get_pool_stats()}")
+            if len(api_client_manager.client.gateways) > 1:
+                logger.info(f"BSS网关状态: {api_client_manager.client.gateways.get_stats()}")
+            if bss_concurrency_limiter.enabled:
+                logger.info(f"BSS并发控制状态: {bss_concurrency_limiter.get_stats()}")
+            logger.info(f"BSS请求通道统计: {api_client_manager.get_lane_stats()}")
+            logger.info(f"BSS响应缓存统计: {bss_response_cache.get_stats()}")
+            logger.info(f"BSS请求合并统计: {bss_singleflight.get_stats()}")
+            if bss_hedging_policy.enabled:
+                logger.info(f"BSS请求对冲统计: {bss_hedging_policy.get_stats()}")
+            logger.info(f"数据写入统计: {data_service.get_write_stats()}")
+            logger.info(f"数据对象缓存统计: {identity_map.get_stats()}")
+            logger.info(f"错误案例写入统计: {badcase_recorder.get_stats()}")
+            bss_metrics.flush()
+            
+            return self._finalize_document(document, file_path, counts)
                 
         except Document.DoesNotExist:
             logger.error(f"文档记录不存在: {document_id}")
             return False
+        except BSSUnavailableError as e:
+            self._pause_document(document_id, e)
+            raise
+        except Exception as e:
+            self._handle_document_exception(document_id, e)
+            return False
+    
+    async def process_document_async(self, document_id: int) -> bool:
+        """
+        异步处理文档
+        
+        BSS请求由AsyncBSSAPIClient在事件循环内并发发起，每批最多
+        BSS_API_ASYNC_BATCH_SIZE个ICCID；数据库读写通过sync_to_async执行，
+        并与下一批的网络请求重叠。
+        
+        Args:
+            document_id: 文档ID
+            
+        Returns:
+            bool: 是否处理成功
+            
+        Raises:
+            BSSUnavailableError: BSS接口熔断，文档已暂停，需稍后重新排队
+        """
+        batch_size = getattr(settings, 'BSS_API_ASYNC_BATCH_SIZE', 500)
+        
+        async def fetch_chunk(client, chunk):
+            results = await asyncio.gather(
+                *(data_service.fetch_iccid_results_async(client, iccid, usage_params.get(iccid)) for iccid in chunk)
+            )
+            chunk_results = list(zip(chunk, results))
+            for iccid, iccid_results in chunk_results:
+                self._check_circuit(iccid, iccid_results)
+            return chunk_results
+        
+        try:
+            loaded = await sync_to_async(self._load_document_iccids)(document_id)
+            if loaded is None:
+                return False
+            document, file_path, unique_iccids = loaded
+            
+            counts = {'success': 0, 'failed': 0}
+            data_service.reset_write_stats()
+            usage_params = await sync_to_async(data_service.get_usage_params)(unique_iccids)
+            chunks = [unique_iccids[i:i + batch_size] for i in range(0, len(unique_iccids), batch_size)]
+            
+            # sync_to_async会带上当前上下文，写库线程可见文档处理范围的身份映射
+            with document_scope() as identity_map:
+                async with AsyncBSSAPIClient() as client:
+                    next_fetch = asyncio.ensure_future(fetch_chunk(client, chunks[0]))
+                    try:
+                        for index in range(len(chunks)):
+                            chunk_results = await next_fetch
+                            # 写库期间提前拉取下一批
+                            if index + 1 < len(chunks):
+                                next_fetch = asyncio.ensure_future(fetch_chunk(client, chunks[index + 1]))
+                            await sync_to_async(self._process_iccid_chunk)(document, chunk_results, counts, usage_params)
+                    finally:
+                        if not next_fetch.done():
+                            next_fetch.cancel()
+                        await sync_to_async(badcase_recorder.flush)()
+            
+            if len(api_client_manager.client.gateways) > 1:
+                logger.info(f"BSS网关状态: {api_client_manager.client.gateways.get_stats()}")
+            logger.info(f"BSS响应缓存统计: {bss_response_cache.get_stats()}")
+            logger.info(f"BSS请求合并统计: {bss_singleflight.get_stats()}")
+            if bss_hedging_policy.enabled:
+                logger.info(f"BSS请求对冲统计: {bss_hedging_policy.get_stats()}")
+            logger.info(f"数据写入统计: {data_service.get_write_stats()}")
+            logger.info(f"数据对象缓存统计: {identity_map.get_stats()}")
+            logger.info(f"错误案例写入统计: {badcase_recorder.get_stats()}")
+            await asyncio.to_thread(bss_metrics.flush)
+            
+            return await sync_to_async(self._finalize_document)(document, file_path, counts)
+            
+        except Document.DoesNotExist:
+            logger.error(f"文档记录不存在: {document_id}")
+            return False
+        except BSSUnavailableError as e:
+            await sync_to_async(self._pause_document)(document_id, e)
+            raise
         except Exception as e:
-            logger.error(f"处理文档时发生异常: {str(e)}")
-            try:
-                document = Document.objects.get(id=document_id)
-                document.mark_as_failed(f"处理异常: {str(e)}")
-                # 移动文件到失败目录
-                file_path = Path(document.file_path)
-                if file_path.exists():
-                    self.move_file_to_failed(file_path)
-            except:
-                pass
+            await sync_to_async(self._handle_document_exception)(document_id, e)
             return False
 
 
@@ -0,0 +1,246 @@
+"""
+BSS请求对冲（hedged requests）
+查询在接口近期延迟的高分位（如p95）内仍未返回时，再发起一个相同的请求，取先返回者；
+三个BSS接口均为只读查询，重复请求没有副作用
+"""
+import logging
+import math
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 对冲竞速的两方：原请求与对冲请求
+LEG_PRIMARY = 'primary'
+LEG_HEDGE = 'hedge'
+
+
+class EndpointLatency:
+    """
+    单个接口的近期延迟样本（滑动窗口）
+    分位数每新增recompute_every个样本重新计算一次，避免每次请求都排序
+    """
+    
+    __slots__ = ('samples', 'percentile', 'recompute_every', '_value', '_since_compute')
+    
+    def __init__(self, window: int, percentile: float, recompute_every: int = 20):
+        self.samples = deque(maxlen=window)
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._value = None
+        self._since_compute = 0
+    
+    def add(self, latency: float):
+        self.samples.append(latency)
+        self._since_compute += 1
+        if self._value is None or self._since_compute >= self.recompute_every:
+            self._since_compute = 0
+            ordered = sorted(self.samples)
+            index = min(len(ordered) - 1, max(0, math.ceil(len(ordered) * self.percentile / 100) - 1))
+            self._value = ordered[index]
+    
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+
+class BSSHedgingPolicy:
+    """
+    请求对冲策略
+    
+    - 对冲延迟：各接口近期成功返回（收到HTTP响应）的请求延迟的percentile分位，
+      不低于min_delay；样本数不足min_samples时不对冲
+    - 对冲预算：每个请求积累max_ratio个令牌（上限burst），每次对冲消耗一个令牌，
+      因此对冲请求数不超过总请求数的max_ratio（加burst），额外负载有全局上限；
+      各进程按自身请求数积累预算，集群整体比例同样不超过max_ratio
+    超时、连接错误的延迟不计入样本，避免BSS整体故障时分位数被拉高到超时时间。
+    """
+    
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_delay: float = 0.05,
+                 max_ratio: float = 0.05, burst: float = 10, min_samples: int = 50, window: int = 500):
+        """
+        初始化对冲策略
+        
+        Args:
+            enabled: 是否启用
+            percentile: 对冲延迟取近期延迟的分位数（0~100）
+            min_delay: 对冲延迟下限（秒）
+            max_ratio: 对冲请求占总请求数的比例上限
+            burst: 对冲预算积累上限
+            min_samples: 开始对冲前每个接口所需的最少延迟样本数
+            window: 每个接口保留的延迟样本数
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.window = window
+        
+        self._latencies: Dict[str, EndpointLatency] = {}
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0}
+    
+    def observe(self, endpoint: str, latency: float):
+        """
+        记录一次收到HTTP响应的请求延迟
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            tracker = self._latencies.get(endpoint)
+            if tracker is None:
+                tracker = self._latencies[endpoint] = EndpointLatency(self.window, self.percentile)
+            tracker.add(latency)
+    
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """
+        获取接口的对冲延迟，并为本次请求积累对冲预算
+        
+        Returns:
+            Optional[float]: 等待多久未返回时发起对冲请求（秒），不对冲时返回None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._stats['requests'] += 1
+            self._tokens = min(self.burst, self._tokens + self.max_ratio)
+            tracker = self._latencies.get(endpoint)
+            if tracker is None or len(tracker.samples) < self.min_samples:
+                return None
+            return max(self.min_delay, tracker.value)
+    
+    def try_acquire(self) -> bool:
+        """
+        申请一次对冲预算
+        """
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._stats['hedged'] += 1
+                return True
+            self._stats['budget_denied'] += 1
+            return False
+    
+    def record_win(self):
+        """记录对冲请求先于原请求返回"""
+        with self._lock:
+            self._stats['hedge_wins'] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取当前进程的对冲统计
+        
+        Returns:
+            Dict[str, Any]: 请求数、对冲数、对冲胜出数、预算不足次数及各接口当前对冲延迟
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['delays'] = {
+                endpoint: round(max(self.min_delay, tracker.value), 4)
+                for endpoint, tracker in self._latencies.items()
+                if len(tracker.samples) >= self.min_samples
+            }
+        stats['hedge_ratio'] = round(stats['hedged'] / stats['requests'], 4) if stats['requests'] else 0.0
+        return stats
+
+
+class HedgeRace:
+    """
+    一次对冲竞速
+    原请求与对冲请求中先收到响应者胜出，另一方使用中的连接随即被中止；
+    均未收到响应（超时、连接错误）时取后结束者的结果。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._winner = None
+        # 已发出且尚未结束的请求
+        self._running = {LEG_PRIMARY}
+        # 各请求当前使用中连接的中止方法
+        self._closers: Dict[str, Callable[[], None]] = {}
+        self._aborted = set()
+    
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+    
+    def start_hedge(self) -> bool:
+        """
+        登记对冲请求，竞速已有结果时返回False
+        """
+        with self._lock:
+            if self._done.is_set():
+                return False
+            self._running.add(LEG_HEDGE)
+            return True
+    
+    def attach(self, leg: str, closer: Callable[[], None]):
+        """
+        登记请求当前使用的连接，落败时通过closer中止
+        """
+        with self._lock:
+            aborted = leg in self._aborted
+            if not aborted:
+                self._closers[leg] = closer
+        if aborted:
+            closer()
+    
+    def detach(self, leg: str):
+        """请求的连接已归还，不再需要中止"""
+        with self._lock:
+            self._closers.pop(leg, None)
+    
+    def is_aborted(self, leg: str) -> bool:
+        """请求是否已落败被中止"""
+        with self._lock:
+            return leg in self._aborted
+    
+    def finish(self, leg: str, result: Any, answered: bool) -> bool:
+        """
+        请求结束，返回其是否胜出
+        
+        Args:
+            leg: LEG_PRIMARY或LEG_HEDGE
+            result: 请求结果
+            answered: 是否收到了HTTP响应
+        """
+        with self._lock:
+            self._running.discard(leg)
+            if self._done.is_set() or not (answered or not self._running):
+                return False
+            self._result, self._winner = result, leg
+            self._aborted.update(self._running)
+            closers = [closer for other, closer in self._closers.items() if other != leg]
+            self._done.set()
+        for closer in closers:
+            closer()
+        return True
+    
+    def wait(self) -> Tuple[Any, str]:
+        """
+        等待竞速结束
+        
+        Returns:
+            Tuple[Any, str]: 胜出的结果及胜出方
+        """
+        self._done.wait()
+        return self._result, self._winner
+
+
+# 全局BSS请求对冲策略实例
+bss_hedging_policy = BSSHedgingPolicy(
+    enabled=getattr(settings, 'BSS_API_HEDGE_ENABLED', False),
+    percentile=getattr(settings, 'BSS_API_HEDGE_PERCENTILE', 95),
+    min_delay=getattr(settings, 'BSS_API_HEDGE_MIN_DELAY', 0.05),
+    max_ratio=getattr(settings, 'BSS_API_HEDGE_MAX_RATIO', 0.05),
+    burst=getattr(settings, 'BSS_API_HEDGE_BURST', 10),
+    min_samples=getattr(settings, 'BSS_API_HEDGE_MIN_SAMPLES', 50),
+)
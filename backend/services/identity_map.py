@@ -0,0 +1,180 @@
+"""
+文档处理期间的身份映射（identity map）与待写对象集合（unit of work）
+同一文档内按唯一键缓存已读取的ICC、订阅实例，重复读取直接返回内存中的实例；
+逐个写入时的字段更新先记为待写，每批结束时按字段集合合并为bulk_update
+"""
+import logging
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterable, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前文档处理范围的身份映射（未处于文档处理范围时为None）
+_current_identity_map: ContextVar[Optional['IdentityMap']] = ContextVar('bss_identity_map', default=None)
+
+
+class IdentityMap:
+    """
+    有界身份映射
+    
+    - 缓存：(模型, 唯一键字段, 值) 到实例的映射，超过max_size时按LRU淘汰；
+      待写对象在写入前不会因淘汰而丢失（另行持有）
+    - 工作单元：begin/commit/rollback包住单个ICCID的事务，事务回滚时丢弃该ICCID产生的
+      待写字段，并淘汰期间新增或修改的实例（内存状态已与数据库不一致）
+    - 写入：flush将已提交的待写对象按(模型, 字段集合)分组bulk_update，失败时逐个保存
+    只在单个文档的处理流程中使用，不做线程同步。
+    """
+    
+    def __init__(self, max_size: int = 10000):
+        """
+        初始化身份映射
+        
+        Args:
+            max_size: 最多缓存的实例数
+        """
+        self.max_size = max_size
+        self._objects: OrderedDict = OrderedDict()
+        self._dirty: Dict[tuple, tuple] = {}
+        self._unit: Optional[Dict[str, Any]] = None
+        self._stats = Counter()
+    
+    @staticmethod
+    def _key(model, field: str, value) -> tuple:
+        return model._meta.label, field, value
+    
+    def get(self, model, field: str, value):
+        """
+        按唯一键取缓存的实例
+        
+        Returns:
+            未缓存时返回None
+        """
+        key = self._key(model, field, value)
+        instance = self._objects.get(key)
+        if instance is None:
+            self._stats['misses'] += 1
+            return None
+        self._objects.move_to_end(key)
+        self._stats['hits'] += 1
+        return instance
+    
+    def add(self, instance, field: str):
+        """
+        按唯一键缓存实例
+        """
+        key = self._key(type(instance), field, getattr(instance, field))
+        self._objects[key] = instance
+        self._objects.move_to_end(key)
+        if self._unit is not None:
+            self._unit['keys'].append(key)
+        while len(self._objects) > self.max_size:
+            self._objects.popitem(last=False)
+            self._stats['evictions'] += 1
+    
+    def discard(self, model, field: str, values: Iterable):
+        """
+        淘汰指定唯一键的实例（批量写入或其他方式绕过实例更新了这些行之后调用）
+        """
+        for value in values:
+            self._objects.pop(self._key(model, field, value), None)
+    
+    def mark_dirty(self, instance, fields: List[str]):
+        """
+        记录实例待写入的字段（当前工作单元提交后才会写入）
+        """
+        key = (instance._meta.label, instance.pk)
+        target = self._unit['dirty'] if self._unit is not None else self._dirty
+        _, pending = target.get(key) or self._dirty.get(key) or (instance, set())
+        target[key] = (instance, pending | set(fields))
+    
+    def begin(self):
+        """开始一个工作单元"""
+        self._unit = {'keys': [], 'dirty': {}}
+    
+    def commit(self):
+        """提交当前工作单元：待写字段并入批末写入"""
+        if self._unit is None:
+            return
+        self._dirty.update(self._unit['dirty'])
+        self._unit = None
+    
+    def rollback(self):
+        """回滚当前工作单元：丢弃待写字段并淘汰期间新增或修改的实例"""
+        if self._unit is None:
+            return
+        for key in self._unit['keys']:
+            self._objects.pop(key, None)
+        stale = {id(instance) for instance, _ in self._unit['dirty'].values()}
+        for key, instance in list(self._objects.items()):
+            if id(instance) in stale:
+                del self._objects[key]
+        self._unit = None
+    
+    def flush(self) -> int:
+        """
+        写入已提交的待写对象
+        
+        Returns:
+            int: 写入的实例数
+        """
+        if not self._dirty:
+            return 0
+        batch_size = getattr(settings, 'BSS_DB_UPSERT_BATCH_SIZE', 500)
+        groups = {}
+        for instance, fields in self._dirty.values():
+            groups.setdefault((type(instance), frozenset(fields)), []).append(instance)
+        self._dirty = {}
+        
+        written = 0
+        for (model, fields), instances in groups.items():
+            try:
+                model.objects.bulk_update(instances, sorted(fields), batch_size=batch_size)
+            except Exception as e:
+                logger.error(f"批量写入{model._meta.verbose_name}失败，改为逐个写入: {str(e)}")
+                for instance in instances:
+                    try:
+                        instance.save(update_fields=sorted(fields))
+                    except Exception as save_error:
+                        logger.error(f"写入{model._meta.verbose_name} {instance.pk} 失败: {str(save_error)}")
+            written += len(instances)
+        self._stats['flushed'] += written
+        return written
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+        
+        Returns:
+            Dict[str, Any]: 命中数、未命中数、淘汰数、批量写入的实例数、当前缓存数及命中率
+        """
+        stats = {name: self._stats[name] for name in ('hits', 'misses', 'evictions', 'flushed')}
+        stats['size'] = len(self._objects)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def get_identity_map() -> Optional[IdentityMap]:
+    """
+    获取当前文档处理范围的身份映射，不在文档处理范围内时返回None
+    """
+    return _current_identity_map.get()
+
+
+@contextmanager
+def document_scope():
+    """
+    在文档处理期间启用身份映射（范围结束时丢弃缓存）
+    
+    使用ContextVar保存，sync_to_async执行的数据库操作同样可见，其他线程中的重试任务不受影响。
+    """
+    identity_map = IdentityMap(getattr(settings, 'BSS_IDENTITY_MAP_MAX_SIZE', 10000))
+    token = _current_identity_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _current_identity_map.reset(token)
@@ -0,0 +1,265 @@
+"""
+文档处理流水线
+获取、转换、写入三个阶段通过有界队列衔接，网络请求与数据库写入重叠执行；
+各阶段统计处理量、吞吐和忙碌比例，各队列统计深度，用于定位瓶颈阶段
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 上游阶段结束的标记
+_DONE = object()
+
+
+class StageQueue(queue.Queue):
+    """
+    有界阶段队列，入队时采样队列深度
+    """
+    
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.max_depth = 0
+        self._depth_total = 0
+        self._samples = 0
+    
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        depth = self.qsize()
+        with self.mutex:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._samples += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self.mutex:
+            return {
+                'depth': len(self.queue),
+                'max_depth': self.max_depth,
+                'avg_depth': round(self._depth_total / self._samples, 1) if self._samples else 0.0,
+                'capacity': self.maxsize,
+            }
+
+
+class StageStats:
+    """
+    单个阶段的统计：处理量、处理耗时（busy）及等待下游队列的耗时（blocked）
+    """
+    
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, items: int, busy: float, blocked: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.blocked += blocked
+    
+    def get_stats(self, elapsed: float) -> Dict[str, Any]:
+        """
+        Args:
+            elapsed: 流水线运行时长（秒）
+        """
+        capacity = elapsed * self.workers
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'items': self.items,
+                'rate': round(self.items / elapsed, 1) if elapsed else 0.0,
+                'busy_ratio': round(self.busy / capacity, 4) if capacity else 0.0,
+                'blocked_ratio': round(self.blocked / capacity, 4) if capacity else 0.0,
+            }
+
+
+class DocumentPipeline:
+    """
+    获取 → 转换 → 写入 三阶段流水线
+    
+    - 获取：一个线程消费source（如api_client_manager.iter_iccid_results，其内部按BSS并发上限并发请求），
+      结果放入fetched队列
+    - 转换：transform_workers个线程调用transform（不访问数据库），结果放入transformed队列
+    - 写入：调用run的线程攒满write_batch_size条后调用write，只有一个写入者，
+      避免并发upsert同一批行时互相等待锁；写入线程即调用线程，数据库连接和上下文（如身份映射）不变
+    任一阶段出错时停止获取，已转换的结果仍全部写入后再抛出该异常；获取阶段出错时（如熔断）
+    已获取的结果仍会转换并写入，转换或写入阶段出错时丢弃尚未转换的输入。
+    
+    统计：busy_ratio接近1且上游队列常满的阶段为瓶颈；blocked_ratio高说明该阶段在等待下游。
+    """
+    
+    def __init__(self, transform_workers: int = 2, queue_size: int = 1000, write_batch_size: int = 100):
+        """
+        初始化流水线
+        
+        Args:
+            transform_workers: 转换阶段线程数
+            queue_size: 每个阶段队列的容量
+            write_batch_size: 每次写入的条数
+        """
+        self.transform_workers = max(1, transform_workers)
+        self.write_batch_size = max(1, write_batch_size)
+        self.fetched = StageQueue(queue_size)
+        self.transformed = StageQueue(queue_size)
+        self.stages = {
+            'fetch': StageStats('fetch', 1),
+            'transform': StageStats('transform', self.transform_workers),
+            'write': StageStats('write', 1),
+        }
+        self._stop = threading.Event()
+        self._discard = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        self._started = None
+        self._finished = None
+    
+    def _fail(self, error: BaseException, discard: bool = True):
+        """记录第一个异常并停止获取，discard为True时转换阶段丢弃剩余输入"""
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+        if discard:
+            self._discard.set()
+    
+    def _timed_put(self, target: StageQueue, item) -> float:
+        started = time.monotonic()
+        target.put(item)
+        return time.monotonic() - started
+    
+    def _fetch(self, source: Iterable):
+        """获取阶段：消费source直到结束或停止"""
+        stats = self.stages['fetch']
+        iterator = iter(source)
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                busy = time.monotonic() - started
+                stats.record(1, busy, self._timed_put(self.fetched, item))
+        except BaseException as e:
+            self._fail(e, discard=False)
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            for _ in range(self.transform_workers):
+                self.fetched.put(_DONE)
+    
+    def _transform(self, transform: Callable):
+        """转换阶段：转换或写入出错后丢弃剩余输入，直到收到结束标记"""
+        stats = self.stages['transform']
+        try:
+            while True:
+                item = self.fetched.get()
+                if item is _DONE:
+                    break
+                if self._discard.is_set():
+                    continue
+                started = time.monotonic()
+                try:
+                    result = transform(item)
+                except BaseException as e:
+                    self._fail(e)
+                    continue
+                busy = time.monotonic() - started
+                stats.record(1, busy, self._timed_put(self.transformed, result))
+        finally:
+            self.transformed.put(_DONE)
+    
+    def run(self, source: Iterable, transform: Callable[[Any], Any], write: Callable[[List[Any]], None]):
+        """
+        运行流水线，所有结果写入后返回
+        
+        Args:
+            source: 获取阶段的输入（迭代器在获取线程中消费）
+            transform: 转换函数（在转换线程中调用，不应访问数据库）
+            write: 写入函数（在当前线程中按批调用）
+        
+        Raises:
+            任一阶段抛出的第一个异常（已转换的结果写入之后）
+        """
+        self._started = time.monotonic()
+        threads = [threading.Thread(target=self._fetch, args=(source,), name='pipeline-fetch', daemon=True)]
+        threads += [
+            threading.Thread(target=self._transform, args=(transform,), name=f'pipeline-transform-{index}', daemon=True)
+            for index in range(self.transform_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        stats = self.stages['write']
+        buffer = []
+        remaining = self.transform_workers
+        write_failed = False
+        
+        def flush():
+            started = time.monotonic()
+            write(buffer)
+            stats.record(len(buffer), time.monotonic() - started)
+        
+        try:
+            while remaining:
+                item = self.transformed.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if write_failed:
+                    # 写入失败后继续取出队列内容，使上游线程能够结束
+                    continue
+                buffer.append(item)
+                if len(buffer) >= self.write_batch_size:
+                    try:
+                        flush()
+                    except BaseException as e:
+                        write_failed = True
+                        self._fail(e)
+                    buffer = []
+            if buffer and not write_failed:
+                flush()
+        finally:
+            self._stop.set()
+            self._discard.set()
+            for thread in threads:
+                thread.join()
+            self._finished = time.monotonic()
+        
+        if self._error is not None:
+            raise self._error
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取流水线统计
+        
+        Returns:
+            Dict[str, Any]: 各阶段的处理量、吞吐（条/秒）、忙碌比例、等待下游比例，及各队列深度
+        """
+        if self._started is None:
+            return {}
+        elapsed = (self._finished or time.monotonic()) - self._started
+        stats = {name: stage.get_stats(elapsed) for name, stage in self.stages.items()}
+        stats['queues'] = {'fetched': self.fetched.get_stats(), 'transformed': self.transformed.get_stats()}
+        stats['elapsed'] = round(elapsed, 3)
+        return stats
+
+
+def create_document_pipeline() -> DocumentPipeline:
+    """
+    按配置创建文档处理流水线（每个文档一个实例）
+    """
+    return DocumentPipeline(
+        transform_workers=getattr(settings, 'BSS_PIPELINE_TRANSFORM_WORKERS', 2),
+        queue_size=getattr(settings, 'BSS_PIPELINE_QUEUE_SIZE', 1000),
+        write_batch_size=getattr(settings, 'BSS_DB_WRITE_BATCH_SIZE', 100),
+    )
@@ -0,0 +1,271 @@
+"""
+BSS API集群限流器
+基于Redis令牌桶，所有Celery worker共享同一份额度；
+BSS出错或变慢时自适应降低速率，恢复后逐步回升
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶脚本：按Redis服务器时间补充令牌，返回需要等待的毫秒数（0表示已获取令牌）
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'factor')
+local factor = tonumber(data[3]) or 1
+local effective_rate = rate * factor
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) / 1000 * effective_rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / effective_rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+return wait
+"""
+
+# 速率系数调整脚本：降低时按间隔节流，避免多个worker同时观察到错误导致速率骤降；
+# 返回调整后的系数，降速被节流时返回nil
+ADJUST_FACTOR_SCRIPT = """
+local mode = ARGV[1]
+local decrease_ratio = tonumber(ARGV[2])
+local increase_step = tonumber(ARGV[3])
+local min_factor = tonumber(ARGV[4])
+local decrease_interval = tonumber(ARGV[5])
+local ttl = tonumber(ARGV[6])
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local data = redis.call('HMGET', KEYS[1], 'factor', 'decreased_at')
+local factor = tonumber(data[1]) or 1
+local decreased_at = tonumber(data[2]) or 0
+if mode == 'decrease' then
+    if now - decreased_at < decrease_interval then
+        return false
+    end
+    factor = math.max(min_factor, factor * decrease_ratio)
+    redis.call('HSET', KEYS[1], 'factor', factor, 'decreased_at', now)
+else
+    factor = math.min(1, factor + increase_step)
+    redis.call('HSET', KEYS[1], 'factor', factor)
+end
+redis.call('PEXPIRE', KEYS[1], ttl)
+return tostring(factor)
+"""
+
+
+class BSSRateLimiter:
+    """
+    BSS API集群限流器
+    
+    每个API类型一个令牌桶（Redis hash），速率 = 配置速率 × 自适应系数。
+    出现可重试失败（超时、5xx、限流）或响应超过慢请求阈值时，系数按比例下降；
+    连续成功若干次后系数线性回升，直至恢复到配置速率。
+    Redis不可用时放行请求，避免限流器成为单点故障。
+    """
+    
+    KEY_PREFIX = 'bss:ratelimit:'
+    
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, enabled: bool = True,
+                 acquire_timeout: float = 30, slow_seconds: float = 5,
+                 decrease_ratio: float = 0.7, increase_step: float = 0.05, increase_every: int = 50,
+                 min_factor: float = 0.1, decrease_interval: float = 2):
+        """
+        初始化限流器
+        
+        Args:
+            limits: API类型到{'rate': 每秒请求数, 'burst': 桶容量}的映射，rate为0表示不限流
+            enabled: 是否启用
+            acquire_timeout: 获取令牌的最长等待时间（秒）
+            slow_seconds: 慢请求阈值（秒）
+            decrease_ratio: 出错或变慢时速率系数的乘数
+            increase_step: 每次回升的速率系数增量
+            increase_every: 每多少次成功回升一次
+            min_factor: 速率系数下限
+            decrease_interval: 两次降速之间的最小间隔（秒）
+        """
+        self.limits = limits or {}
+        self.enabled = enabled
+        self.acquire_timeout = acquire_timeout
+        self.slow_seconds = slow_seconds
+        self.decrease_ratio = decrease_ratio
+        self.increase_step = increase_step
+        self.increase_every = increase_every
+        self.min_factor = min_factor
+        self.decrease_interval = decrease_interval
+        
+        self._scripts = None
+        self._success_counts = {}
+        self._lock = threading.Lock()
+        self._last_error_log = 0
+    
+    def _get_scripts(self):
+        """注册Lua脚本（redis-py会自动使用EVALSHA）"""
+        if self._scripts is None:
+            redis = get_redis_connection('default')
+            self._scripts = (
+                redis.register_script(TOKEN_BUCKET_SCRIPT),
+                redis.register_script(ADJUST_FACTOR_SCRIPT),
+            )
+        return self._scripts
+    
+    def _get_limit(self, api_type: str) -> Optional[Dict[str, float]]:
+        """获取API类型的限流配置，未配置或速率为0时返回None"""
+        if not self.enabled:
+            return None
+        limit = self.limits.get(api_type)
+        if not limit or not limit.get('rate'):
+            return None
+        return limit
+    
+    def _key(self, api_type: str) -> str:
+        return f"{self.KEY_PREFIX}{api_type}"
+    
+    def _ttl_ms(self, limit: Dict[str, float]) -> int:
+        """令牌桶过期时间：足够补满令牌桶且不少于一分钟"""
+        return int(max(60, limit.get('burst', 1) / limit['rate'] * 2) * 1000)
+    
+    def _log_redis_error(self, e: Exception):
+        """Redis异常时降级放行，日志每分钟最多输出一次"""
+        now = time.monotonic()
+        if now - self._last_error_log > 60:
+            self._last_error_log = now
+            logger.warning(f"BSS限流器Redis不可用，暂时放行请求: {str(e)}")
+    
+    def _try_acquire(self, api_type: str) -> float:
+        """
+        尝试获取一个令牌
+        
+        Returns:
+            float: 需要等待的秒数，0表示已获取
+        """
+        limit = self._get_limit(api_type)
+        if limit is None:
+            return 0
+        try:
+            token_bucket, _ = self._get_scripts()
+            wait_ms = token_bucket(
+                keys=[self._key(api_type)],
+                args=[limit['rate'], limit.get('burst', limit['rate']), self._ttl_ms(limit)]
+            )
+            return int(wait_ms) / 1000
+        except Exception as e:
+            self._log_redis_error(e)
+            return 0
+    
+    def acquire(self, api_type: str, timeout: float = None) -> bool:
+        """
+        阻塞获取一个令牌
+        
+        Args:
+            api_type: API类型
+            timeout: 最长等待时间（秒），默认acquire_timeout
+        
+        Returns:
+            bool: 是否在超时前获取到令牌
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            wait = self._try_acquire(api_type)
+            if wait <= 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(wait, remaining))
+    
+    async def acquire_async(self, api_type: str, timeout: float = None) -> bool:
+        """
+        异步获取一个令牌，等待期间不阻塞事件循环
+        """
+        if self._get_limit(api_type) is None:
+            return True
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, api_type)
+            if wait <= 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(wait, remaining))
+    
+    def _adjust(self, api_type: str, mode: str, limit: Dict[str, float]):
+        """调整共享的速率系数"""
+        try:
+            _, adjust_factor = self._get_scripts()
+            factor = adjust_factor(
+                keys=[self._key(api_type)],
+                args=[mode, self.decrease_ratio, self.increase_step, self.min_factor,
+                      int(self.decrease_interval * 1000), self._ttl_ms(limit)]
+            )
+            if mode == 'decrease' and factor is not None:
+                logger.warning(f"BSS {api_type} 接口出错或变慢，速率系数调整为 {float(factor):.2f}")
+        except Exception as e:
+            self._log_redis_error(e)
+    
+    def record(self, api_type: str, failed: bool, latency: float):
+        """
+        记录一次调用结果，用于自适应调整速率
+        
+        Args:
+            api_type: API类型
+            failed: 是否为可重试失败（超时、5xx、限流等）
+            latency: 调用耗时（秒）
+        """
+        limit = self._get_limit(api_type)
+        if limit is None:
+            return
+        
+        if failed or latency > self.slow_seconds:
+            with self._lock:
+                self._success_counts[api_type] = 0
+            self._adjust(api_type, 'decrease', limit)
+            return
+        
+        with self._lock:
+            count = self._success_counts.get(api_type, 0) + 1
+            self._success_counts[api_type] = 0 if count >= self.increase_every else count
+        if count >= self.increase_every:
+            self._adjust(api_type, 'increase', limit)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """
+        获取各API类型的限流状态
+        
+        Returns:
+            Dict[str, Any]: API类型到{rate, burst, factor, tokens}的映射
+        """
+        status = {}
+        redis = get_redis_connection('default')
+        for api_type, limit in self.limits.items():
+            factor, tokens = redis.hmget(self._key(api_type), 'factor', 'tokens')
+            status[api_type] = {
+                'rate': limit.get('rate'),
+                'burst': limit.get('burst'),
+                'factor': float(factor) if factor else 1.0,
+                'tokens': float(tokens) if tokens else None,
+            }
+        return status
+
+
+# 全局BSS限流器实例
+bss_rate_limiter = BSSRateLimiter(
+    limits=getattr(settings, 'BSS_API_RATE_LIMITS', {}),
+    enabled=getattr(settings, 'BSS_API_RATE_LIMIT_ENABLED', False),
+    acquire_timeout=getattr(settings, 'BSS_API_RATE_LIMIT_ACQUIRE_TIMEOUT', 30),
+    slow_seconds=getattr(settings, 'BSS_API_RATE_LIMIT_SLOW_SECONDS', 5),
+)
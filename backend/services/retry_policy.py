@@ -0,0 +1,162 @@
+"""
+BSS API重试策略
+区分可重试与永久失败，按指数退避加抖动计算重试间隔，
+并通过调度器延迟执行重试，避免查询线程sleep
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from .bss_response import BSSResponse, REQUEST_ERROR, PARSE_ERROR
+
+logger = logging.getLogger(__name__)
+
+# 响应分类结果
+RESULT_SUCCESS = 'success'
+RESULT_RETRYABLE = 'retryable'
+RESULT_PERMANENT = 'permanent'
+
+
+class RetryPolicy:
+    """
+    重试策略
+    
+    先按HTTP状态码分类：5xx、429限流可重试，其余4xx为永久失败（即使响应体无法解析）；
+    再按错误类别和响应码分类：超时/连接错误、非4xx时网关返回非JSON内容、配置的BSS限流/繁忙响应码可重试，
+    其余（业务错误码、未知异常）视为永久失败。
+    """
+    
+    def __init__(self, max_retries: int = 2, base_delay: float = 1.0, max_delay: float = 30.0,
+                 multiplier: float = 2.0, retryable_codes: Optional[Iterable[str]] = None):
+        """
+        初始化重试策略
+        
+        Args:
+            max_retries: 最大重试次数
+            base_delay: 首次重试的基础延迟（秒）
+            max_delay: 单次重试延迟上限（秒）
+            multiplier: 指数退避倍数
+            retryable_codes: 可重试的BSS响应码（如限流、系统繁忙）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.retryable_codes = set(retryable_codes or [])
+    
+    @staticmethod
+    def _is_retryable_status(status_code: Optional[int]) -> bool:
+        """HTTP状态码是否可重试"""
+        return status_code is not None and (status_code >= 500 or status_code == 429)
+    
+    def classify(self, result: BSSResponse) -> str:
+        """
+        对API响应进行分类
+        
+        Args:
+            result: API响应
+        
+        Returns:
+            str: RESULT_SUCCESS / RESULT_RETRYABLE / RESULT_PERMANENT
+        """
+        if result.ok:
+            return RESULT_SUCCESS
+        
+        status_code = result.status_code
+        if self._is_retryable_status(status_code):
+            return RESULT_RETRYABLE
+        if status_code is not None and 400 <= status_code < 500:
+            return RESULT_PERMANENT
+        
+        error = result.error
+        if error:
+            if error == REQUEST_ERROR:
+                # 无状态码表示超时或连接错误
+                return RESULT_RETRYABLE if status_code is None else RESULT_PERMANENT
+            if error == PARSE_ERROR:
+                return RESULT_RETRYABLE
+            return RESULT_PERMANENT
+        
+        if result.code in self.retryable_codes:
+            return RESULT_RETRYABLE
+        return RESULT_PERMANENT
+    
+    def should_retry(self, result: BSSResponse, attempt: int) -> bool:
+        """
+        判断是否需要重试
+        
+        Args:
+            result: API响应
+            attempt: 当前尝试序号（从0开始）
+        """
+        return attempt < self.max_retries and self.classify(result) == RESULT_RETRYABLE
+    
+    def compute_delay(self, attempt: int) -> float:
+        """
+        计算第attempt次失败后的重试延迟（指数退避 + full jitter）
+        """
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        return random.uniform(0, ceiling)
+
+
+class RetryScheduler:
+    """
+    延迟重试调度器
+    单个守护线程按到期时间执行回调，等待期间不占用查询线程（也用于调度对冲请求）
+    """
+    
+    def __init__(self, name: str = 'bss-retry-scheduler'):
+        self.name = name
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+    
+    def _ensure_thread(self):
+        """确保当前进程的调度线程已启动（fork后需重新创建）"""
+        pid = os.getpid()
+        if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+            if self._thread_pid != pid:
+                # 父进程中待执行的重试不属于当前进程
+                self._heap = []
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+    
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        """
+        在delay秒后执行回调
+        
+        Args:
+            delay: 延迟（秒）
+            callback: 回调函数
+        """
+        with self._condition:
+            self._ensure_thread()
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), callback))
+            self._condition.notify()
+    
+    def _run(self):
+        """调度线程主循环"""
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                due, _, callback = self._heap[0]
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._heap)
+            
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行延迟回调时发生异常: {str(e)}")
+
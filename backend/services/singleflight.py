@@ -0,0 +1,264 @@
+"""
+BSS请求合并（singleflight）
+相同（接口、ICCID、参数）的并发查询只发起一次上游调用并共享结果：
+进程内通过共享Future合并，跨worker通过Redis租约合并
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .bss_response import BSSResponse, SOURCE_SHARED, json_loads, json_dumps
+
+logger = logging.getLogger(__name__)
+
+# 释放租约：仅持有者可删除
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class BSSSingleFlight:
+    """
+    BSS请求合并
+    
+    - 进程内：第一个查询成为leader，其余相同查询直接复用leader的Future（含重试）
+    - 跨worker：仅remote_api_types（可缓存、各worker常重复查询的接口）的首次尝试在发起上游调用前
+      以SET NX获取Redis租约，未获取到的worker按指数退避轮询leader发布的结果；
+      leader失败（可重试错误、熔断、限流）时不发布结果，租约释放后由等待方自行调用；
+      等待超过max_wait秒时不再等待，直接调用上游，避免查询线程长时间被轮询占用
+    Redis不可用时直接调用，不影响查询。
+    """
+    
+    KEY_PREFIX = 'bss:singleflight:'
+    
+    def __init__(self, enabled: bool = True, lease_timeout: float = 35, result_ttl: float = 5,
+                 poll_interval: float = 0.05, max_poll_interval: float = 0.5, max_wait: float = 2,
+                 remote_api_types: Iterable[str] = ('user', 'subscription')):
+        """
+        初始化请求合并
+        
+        Args:
+            enabled: 是否启用
+            lease_timeout: 租约时间（秒），应大于单次请求超时
+            result_ttl: leader发布结果的保留时间（秒）
+            poll_interval: 等待方首次轮询结果的间隔（秒），之后每次翻倍
+            max_poll_interval: 轮询间隔上限（秒）
+            max_wait: 等待方的最长等待时间（秒），不超过租约时间
+            remote_api_types: 跨worker合并的API类型
+        """
+        self.enabled = enabled
+        self.lease_timeout = lease_timeout
+        self.max_wait = min(max_wait, lease_timeout)
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.remote_api_types = frozenset(remote_api_types)
+        
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {'local_shared': 0, 'remote_shared': 0, 'leases': 0, 'wait_timeouts': 0}
+        self._lock = threading.Lock()
+        self._release_script = None
+        self._last_error_log = 0
+    
+    @staticmethod
+    def make_key(api_type: str, iccid: str, params: Optional[Dict[str, str]] = None) -> str:
+        """
+        生成合并键（接口、ICCID、查询参数）
+        """
+        if not params:
+            return f"{api_type}:{iccid}"
+        digest = hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        return f"{api_type}:{iccid}:{digest}"
+    
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _log_redis_error(self, e: Exception):
+        """Redis异常时降级为直接调用，日志每分钟最多输出一次"""
+        now = time.monotonic()
+        if now - self._last_error_log > 60:
+            self._last_error_log = now
+            logger.warning(f"BSS请求合并Redis不可用，直接调用: {str(e)}")
+    
+    # ---------- 进程内合并 ----------
+    
+    def join(self, key: str) -> Tuple[Future, bool]:
+        """
+        加入进程内的在途查询
+        
+        Args:
+            key: 合并键
+        
+        Returns:
+            Tuple[Future, bool]: (共享的Future, 是否为leader)；leader负责执行查询并设置结果
+        """
+        if not self.enabled:
+            return Future(), True
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['local_shared'] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._leave(key, done))
+        return future, True
+    
+    def _leave(self, key: str, future: Future):
+        """查询完成后移除在途记录"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    # ---------- 跨worker合并 ----------
+    
+    def shares_remotely(self, api_type: str, attempt: int = 0) -> bool:
+        """
+        是否通过Redis租约跨worker合并：只用于可共享接口的首次尝试，
+        重试时leader已失败过，其他worker也无可共享的结果
+        """
+        return self.enabled and attempt == 0 and api_type in self.remote_api_types
+    
+    def _lease_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}lease:{key}"
+    
+    def _result_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}result:{key}"
+    
+    def _try_lead(self, key: str) -> Tuple[Optional[BSSResponse], Optional[str], bool]:
+        """
+        尝试获取租约或读取已发布的结果
+        
+        Returns:
+            Tuple: (共享结果, 租约令牌, 是否继续等待)
+        """
+        redis = get_redis_connection('default')
+        cached = redis.get(self._result_key(key))
+        if cached is not None:
+            return BSSResponse.from_dict(json_loads(cached), SOURCE_SHARED), None, False
+        
+        token = uuid.uuid4().hex
+        if redis.set(self._lease_key(key), token, nx=True, px=int(self.lease_timeout * 1000)):
+            return None, token, False
+        return None, None, True
+    
+    def _poll_delays(self) -> Iterable[float]:
+        """
+        等待方的轮询间隔：从poll_interval开始指数退避至max_poll_interval，总等待不超过max_wait秒
+        """
+        deadline = time.monotonic() + self.max_wait
+        interval = self.poll_interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            yield min(interval, remaining)
+            interval = min(interval * 2, self.max_poll_interval)
+    
+    def acquire(self, key: str) -> Tuple[Optional[BSSResponse], Optional[str]]:
+        """
+        获取跨worker租约；租约被其他worker持有时按指数退避轮询，最多等待max_wait秒
+        
+        Args:
+            key: 合并键
+        
+        Returns:
+            Tuple[Optional[BSSResponse], Optional[str]]:
+                (共享结果, 租约令牌)；共享结果为空时需自行调用，令牌不为空时调用后需publish
+        """
+        if not self.enabled:
+            return None, None
+        delays = self._poll_delays()
+        try:
+            while True:
+                result, token, waiting = self._try_lead(key)
+                if not waiting:
+                    self._count('remote_shared' if result is not None else 'leases')
+                    return result, token
+                delay = next(delays, None)
+                if delay is None:
+                    self._count('wait_timeouts')
+                    return None, None
+                time.sleep(delay)
+        except Exception as e:
+            self._log_redis_error(e)
+            return None, None
+    
+    async def acquire_async(self, key: str) -> Tuple[Optional[BSSResponse], Optional[str]]:
+        """
+        异步获取跨worker租约，等待期间不阻塞事件循环
+        """
+        if not self.enabled:
+            return None, None
+        delays = self._poll_delays()
+        try:
+            while True:
+                result, token, waiting = await asyncio.to_thread(self._try_lead, key)
+                if not waiting:
+                    self._count('remote_shared' if result is not None else 'leases')
+                    return result, token
+                delay = next(delays, None)
+                if delay is None:
+                    self._count('wait_timeouts')
+                    return None, None
+                await asyncio.sleep(delay)
+        except Exception as e:
+            self._log_redis_error(e)
+            return None, None
+    
+    def publish(self, key: str, token: Optional[str], result: Optional[BSSResponse]):
+        """
+        发布leader的结果并释放租约
+        
+        Args:
+            key: 合并键
+            token: acquire返回的租约令牌，为空时不做任何操作
+            result: 可共享的结果，为空时只释放租约（等待方将自行调用）
+        """
+        if not token:
+            return
+        try:
+            redis = get_redis_connection('default')
+            if result is not None:
+                # 不共享请求体，保留trans_id、状态码等用于错误案例记录
+                redis.set(self._result_key(key), json_dumps(result.to_dict()),
+                          px=int(self.result_ttl * 1000))
+            if self._release_script is None:
+                self._release_script = redis.register_script(RELEASE_SCRIPT)
+            self._release_script(keys=[self._lease_key(key)], args=[token])
+        except Exception as e:
+            self._log_redis_error(e)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取当前进程的合并统计
+        
+        Returns:
+            Dict[str, int]: {local_shared: 进程内复用次数, remote_shared: 复用其他worker结果次数, leases: 获取租约次数,
+                             wait_timeouts: 等待超时后直接调用的次数}
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+# 全局BSS请求合并实例
+bss_singleflight = BSSSingleFlight(
+    enabled=getattr(settings, 'BSS_SINGLEFLIGHT_ENABLED', True),
+    lease_timeout=getattr(settings, 'BSS_SINGLEFLIGHT_LEASE_TIMEOUT', 35),
+    result_ttl=getattr(settings, 'BSS_SINGLEFLIGHT_RESULT_TTL', 5),
+    max_wait=min(getattr(settings, 'BSS_SINGLEFLIGHT_MAX_WAIT', 2), getattr(settings, 'BSS_API_TIMEOUT', 30) / 4),
+    remote_api_types=getattr(settings, 'BSS_SINGLEFLIGHT_REMOTE_API_TYPES', ('user', 'subscription')),
+)
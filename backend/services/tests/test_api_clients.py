@@ -0,0 +1,175 @@
+"""
+BSS API客户端及客户端管理器测试
+"""
+import asyncio
+import random
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.api_clients import APIClientManager, BSSAPIClient, BSSQuery, USER_QUERY_ENDPOINT, API_TYPES
+from services.bss_response import BSSResponse, REQUEST_ERROR, UNKNOWN_ERROR
+from services.singleflight import BSSSingleFlight
+
+
+class FakeHTTPResponse:
+    """requests响应的最小替身"""
+    
+    def __init__(self, status_code: int = 200, content: bytes = b'{"code":"0000","message":"ok","data":{}}'):
+        self.status_code = status_code
+        self.content = content
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """进程内连接池"""
+    
+    def test_request_count_is_exact_across_threads(self):
+        client = BSSAPIClient()
+        session = client._get_session()
+        threads_per_run, requests_per_thread = 8, 200
+        
+        def send():
+            for _ in range(requests_per_thread):
+                client._send(USER_QUERY_ENDPOINT, client._build_request_body('8986'))
+        
+        with mock.patch.object(session, 'post', return_value=FakeHTTPResponse()):
+            threads = [threading.Thread(target=send) for _ in range(threads_per_run)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertEqual(client.get_pool_stats()['requests'], threads_per_run * requests_per_thread)
+
+
+def ok_response(api_type: str, iccid: str) -> BSSResponse:
+    """构造成功响应"""
+    return BSSResponse(api_type, 200, code='0000', data={'iccid': iccid})
+
+
+class IterICCIDResultsTests(SimpleTestCase):
+    """有界并发查询多个ICCID"""
+    
+    def setUp(self):
+        self.manager = APIClientManager(max_concurrent=3, max_retries=0)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+    
+    def fake_call(self, query):
+        """随机延迟的上游调用，记录同时在途的查询数"""
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(random.uniform(0, 0.01))
+            if query.iccid == 'broken' and query.api_type == 'subscription':
+                raise RuntimeError('boom')
+            return ok_response(query.api_type, query.iccid)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+    
+    def test_results_follow_input_order(self):
+        iccids = [f'8986{index:04d}' for index in range(30)]
+        with mock.patch.object(self.manager, '_call', side_effect=self.fake_call):
+            results = list(self.manager.iter_iccid_results(iccids))
+        
+        self.assertEqual([iccid for iccid, _ in results], iccids)
+        for iccid, responses in results:
+            self.assertEqual(set(responses), set(API_TYPES))
+            self.assertTrue(all(response.ok and response.data == {'iccid': iccid} for response in responses.values()))
+        self.assertLessEqual(self.peak_in_flight, 3 * len(API_TYPES))
+    
+    def test_exception_becomes_failure_response(self):
+        with mock.patch.object(self.manager, '_call', side_effect=self.fake_call):
+            results = dict(self.manager.iter_iccid_results(['89860001', 'broken', '89860002']))
+        
+        failed = results['broken']['subscription']
+        self.assertIsInstance(failed, BSSResponse)
+        self.assertFalse(failed.ok)
+        self.assertEqual((failed.error, failed.message), (UNKNOWN_ERROR, 'boom'))
+        self.assertTrue(results['broken']['user'].ok)
+        self.assertTrue(results['89860002']['usage'].ok)
+
+
+class QueryICCIDAsyncTests(SimpleTestCase):
+    """异步查询的重试"""
+    
+    def setUp(self):
+        self.manager = APIClientManager(max_retries=2, retry_delay=0.001, retry_max_delay=0.001)
+        self.calls = []
+    
+    def run_query(self, responses):
+        """按API类型依次返回responses中的响应，执行一次query_iccid_async"""
+        async def fake_call(client, api_type, iccid, usage_params=None, attempt=0):
+            self.calls.append((api_type, attempt))
+            return responses[api_type][attempt]
+        
+        with mock.patch.object(self.manager, '_call_upstream_async', side_effect=fake_call):
+            return asyncio.run(self.manager.query_iccid_async(mock.Mock(), '89860000000000000301', force_refresh=True))
+    
+    def test_retryable_failure_is_retried_until_success(self):
+        timeout = BSSResponse.failure('user', REQUEST_ERROR, 'timeout')
+        throttled = BSSResponse.failure('user', REQUEST_ERROR, 'throttled', status_code=429)
+        results = self.run_query({
+            'user': [timeout, throttled, ok_response('user', '8986')],
+            'subscription': [ok_response('subscription', '8986')],
+            'usage': [ok_response('usage', '8986')],
+        })
+        
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual(sorted(attempt for api_type, attempt in self.calls if api_type == 'user'), [0, 1, 2])
+    
+    def test_permanent_failure_is_not_retried(self):
+        business_error = BSSResponse('subscription', 200, code='1001', message='ICCID不存在')
+        results = self.run_query({
+            'user': [ok_response('user', '8986')],
+            'subscription': [business_error],
+            'usage': [ok_response('usage', '8986')],
+        })
+        
+        self.assertIs(results['subscription'], business_error)
+        self.assertEqual([attempt for api_type, attempt in self.calls if api_type == 'subscription'], [0])
+    
+    def test_retries_stop_at_max_retries(self):
+        timeout = BSSResponse.failure('usage', REQUEST_ERROR, 'timeout')
+        results = self.run_query({
+            'user': [ok_response('user', '8986')],
+            'subscription': [ok_response('subscription', '8986')],
+            'usage': [timeout] * 3,
+        })
+        
+        self.assertIs(results['usage'], timeout)
+        self.assertEqual([attempt for api_type, attempt in self.calls if api_type == 'usage'], [0, 1, 2])
+
+
+class SingleFlightLeaseTests(SimpleTestCase):
+    """跨worker合并的范围"""
+    
+    def setUp(self):
+        self.manager = APIClientManager()
+        self.manager.singleflight = BSSSingleFlight()
+        for name, value in (('acquire', (None, 'token')), ('publish', None)):
+            patcher = mock.patch.object(self.manager.singleflight, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def call(self, api_type, attempt=0):
+        query = BSSQuery(api_type, '89860000000000000401', force_refresh=True)
+        query.attempt = attempt
+        with mock.patch.object(self.manager, '_call_upstream', return_value=ok_response(api_type, '8986')):
+            return self.manager._call(query)
+    
+    def test_usage_and_retries_skip_redis_lease(self):
+        self.call('usage')
+        self.call('user', attempt=1)
+        self.manager.singleflight.acquire.assert_not_called()
+        self.manager.singleflight.publish.assert_not_called()
+    
+    def test_first_user_attempt_takes_lease(self):
+        self.call('user')
+        self.manager.singleflight.acquire.assert_called_once()
+        self.manager.singleflight.publish.assert_called_once()
@@ -0,0 +1,115 @@
+"""
+错误案例写入缓冲测试
+"""
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from apps.document.models import Document, BadCase
+from services.badcase_recorder import BadCaseRecorder
+from tasks.document_scan import cleanup_old_documents
+
+ICCID = '89860000000000000001'
+
+
+class BadCaseRecorderTests(TransactionTestCase):
+    """缓存、合并与批量写入（需要真实提交事务，使用TransactionTestCase）"""
+    
+    def setUp(self):
+        self.document = Document.objects.create(filename='cdr.csv', file_path='/tmp/cdr.csv', file_size=1)
+        self.recorder = BadCaseRecorder(max_size=100, flush_interval=3600)
+    
+    def record(self, iccid=ICCID, api_type='user', message='timeout', document_id=None):
+        self.recorder.record(document_id or self.document.pk, iccid, api_type, 'trans-1', 500,
+                             {'error': message}, message)
+    
+    def test_records_are_buffered_until_flush(self):
+        self.record()
+        self.assertEqual(BadCase.objects.count(), 0)
+        self.assertEqual(self.recorder.get_stats()['pending'], 1)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(BadCase.objects.get().error_message, 'timeout')
+        self.assertEqual(self.recorder.flush(), 0)
+    
+    def test_same_key_keeps_last_record(self):
+        self.record(message='first')
+        self.record(message='second')
+        self.record(api_type='usage')
+        self.assertEqual(self.recorder.flush(), 2)
+        self.assertEqual(BadCase.objects.get(api_type='user').error_message, 'second')
+        stats = self.recorder.get_stats()
+        self.assertEqual((stats['recorded'], stats['flushed'], stats['batches']), (3, 2, 1))
+    
+    def test_flush_upserts_and_keeps_retry_count(self):
+        self.record(message='first')
+        self.recorder.flush()
+        BadCase.objects.update(retry_count=2)
+        self.record(message='again')
+        self.recorder.flush()
+        badcase = BadCase.objects.get()
+        self.assertEqual((badcase.error_message, badcase.retry_count), ('again', 2))
+    
+    def test_flushes_when_size_reached(self):
+        recorder = BadCaseRecorder(max_size=3, flush_interval=3600)
+        for index in range(3):
+            recorder.record(self.document.pk, f'8986000000000000000{index}', 'user', 't', 500, {}, 'error')
+        self.assertEqual(BadCase.objects.count(), 3)
+        self.assertEqual(recorder.get_stats()['pending'], 0)
+    
+    def test_flush_if_due_after_interval(self):
+        recorder = BadCaseRecorder(max_size=100, flush_interval=0)
+        with transaction.atomic():
+            recorder.record(self.document.pk, ICCID, 'user', 't', 500, {}, 'error')
+        self.assertEqual(BadCase.objects.count(), 0)
+        self.assertEqual(recorder.flush_if_due(), 1)
+        self.assertEqual(BadCase.objects.count(), 1)
+    
+    def test_record_in_committed_transaction_is_kept(self):
+        with transaction.atomic():
+            self.record()
+            # 事务提交前不进入缓存
+            self.assertEqual(self.recorder.get_stats()['pending'], 0)
+        self.assertEqual(self.recorder.get_stats()['pending'], 1)
+    
+    def test_record_in_rolled_back_transaction_is_dropped(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.record(iccid='89860000000000000002')
+                raise RuntimeError('rollback')
+        with transaction.atomic():
+            self.record(iccid='89860000000000000003')
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.record(iccid='89860000000000000004')
+                    raise RuntimeError('savepoint rollback')
+            except RuntimeError:
+                pass
+            self.record(iccid='89860000000000000005')
+        self.recorder.flush()
+        self.assertEqual(list(BadCase.objects.values_list('iccid', flat=True)), ['89860000000000000005'])
+    
+    def test_bulk_failure_falls_back_to_per_row(self):
+        self.record(iccid='89860000000000000001')
+        self.record(iccid='89860000000000000002', document_id=self.document.pk + 1000)
+        self.assertEqual(self.recorder.flush(), 2)
+        self.assertEqual(list(BadCase.objects.values_list('iccid', flat=True)), ['89860000000000000001'])
+        self.assertEqual(self.recorder.get_stats()['fallbacks'], 1)
+    
+    def test_shutdown_flushes_pending(self):
+        from services import badcase_recorder as module
+        with mock.patch.object(module, 'badcase_recorder', self.recorder):
+            self.record()
+            module._flush_on_shutdown()
+        self.assertEqual(BadCase.objects.count(), 1)
+    
+    def test_task_end_flushes_pending(self):
+        from services import badcase_recorder as module
+        with mock.patch.object(module, 'badcase_recorder', self.recorder):
+            self.record()
+            # 任意任务结束后写入，不等待下一次记录或写入间隔
+            cleanup_old_documents.apply()
+        self.assertEqual(BadCase.objects.count(), 1)
+        self.assertEqual(self.recorder.get_stats()['pending'], 0)
@@ -0,0 +1,110 @@
+"""
+BSS响应缓存测试
+"""
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from services.api_clients import APIClientManager, BSSQuery
+from services.bss_cache import BSSResponseCache
+from services.bss_response import BSSResponse, REQUEST_ERROR, SOURCE_CACHE, SOURCE_LIVE
+from services.singleflight import BSSSingleFlight
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bss-default'},
+    'bss_test': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bss-cache-tests'},
+}
+
+
+def user_response(user=None, code='0000', error=None, status_code=200):
+    data = None if code is None else {'user': user}
+    return BSSResponse('queryUser', status_code, 'trans-1', code, 'ok', data, error=error)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTests(SimpleTestCase):
+    """缓存、负缓存与不缓存的响应"""
+    
+    def setUp(self):
+        self.cache = BSSResponseCache(ttls={'user': 60, 'subscription': 60}, negative_ttl=30,
+                                      not_found_codes=['4004'], cache_alias='bss_test')
+        self.addCleanup(lambda: caches['bss_test'].clear())
+    
+    def test_success_is_cached(self):
+        self.assertIsNone(self.cache.get('user', '8986'))
+        self.cache.set('user', '8986', user_response({'name': 'a'}))
+        cached = self.cache.get('user', '8986')
+        self.assertEqual(cached.source, SOURCE_CACHE)
+        self.assertEqual(cached.get_data('user'), {'name': 'a'})
+        self.assertEqual(cached.trans_id, 'trans-1')
+        stats = self.cache.get_stats()['user']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+    
+    def test_empty_data_is_negative_hit(self):
+        self.cache.set('user', '8986', user_response(None))
+        cached = self.cache.get('user', '8986')
+        self.assertIsNotNone(cached)
+        self.assertEqual(self.cache.get_stats()['user']['negative_hits'], 1)
+    
+    def test_not_found_code_uses_negative_ttl(self):
+        with mock.patch('services.bss_cache.caches') as caches:
+            self.cache.set('user', '8986', user_response(code='4004'))
+            self.cache.set('subscription', '8986', BSSResponse('querySub', 200, 't', '0000', 'ok', {'list': [1]}))
+        (_, _, negative_ttl), (_, _, ttl) = [call.args for call in caches['bss_test'].set.call_args_list]
+        self.assertEqual((negative_ttl, ttl), (30, 60))
+    
+    def test_failures_are_not_cached(self):
+        self.cache.set('user', '1', user_response(code='9999'))
+        self.cache.set('user', '2', BSSResponse.failure('queryUser', REQUEST_ERROR, 'timeout'))
+        self.assertIsNone(self.cache.get('user', '1'))
+        self.assertIsNone(self.cache.get('user', '2'))
+    
+    def test_unconfigured_api_type_is_not_cached(self):
+        self.assertFalse(self.cache.is_cacheable('usage'))
+        self.cache.set('usage', '8986', BSSResponse('queryUsage', 200, 't', '0000', 'ok', {'list': [1]}))
+        self.assertIsNone(self.cache.get('usage', '8986'))
+        self.assertNotIn('usage', self.cache.get_stats())
+    
+    def test_invalidate(self):
+        self.cache.set('user', '8986', user_response({'name': 'a'}))
+        self.cache.invalidate('user', '8986')
+        self.assertIsNone(self.cache.get('user', '8986'))
+    
+    def test_cache_errors_are_misses(self):
+        with mock.patch('services.bss_cache.caches') as caches:
+            caches.__getitem__.return_value.get.side_effect = ConnectionError('down')
+            self.assertIsNone(self.cache.get('user', '8986'))
+        self.assertEqual(self.cache.get_stats()['user']['errors'], 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheBypassTests(SimpleTestCase):
+    """查询时读取或跳过响应缓存"""
+    
+    def setUp(self):
+        self.manager = APIClientManager()
+        self.manager.response_cache = BSSResponseCache(ttls={'user': 60}, cache_alias='bss_test')
+        self.manager.singleflight = BSSSingleFlight(enabled=False)
+        self.manager.response_cache.set('user', '8986', user_response({'name': 'cached'}))
+        self.live = user_response({'name': 'live'})
+        patcher = mock.patch.object(self.manager, '_call_upstream', return_value=self.live)
+        self.upstream = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: caches['bss_test'].clear())
+    
+    def test_first_attempt_reads_cache(self):
+        result = self.manager._call(BSSQuery('user', '8986'))
+        self.assertEqual(result.get_data('user'), {'name': 'cached'})
+        self.upstream.assert_not_called()
+    
+    def test_force_refresh_bypasses_cache(self):
+        result = self.manager._call(BSSQuery('user', '8986', force_refresh=True))
+        self.assertIs(result, self.live)
+        self.assertEqual(result.source, SOURCE_LIVE)
+        self.upstream.assert_called_once()
+    
+    def test_retry_attempt_bypasses_cache(self):
+        query = BSSQuery('user', '8986')
+        query.attempt = 1
+        self.assertIs(self.manager._call(query), self.live)
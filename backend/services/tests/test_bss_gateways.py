@@ -0,0 +1,170 @@
+"""
+BSS网关选择与故障切换测试
+"""
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.api_clients import BSSAPIClient, USER_QUERY_ENDPOINT
+from services.bss_gateways import BSSGatewayPool
+from services.bss_metrics import ERROR_CONNECTION, ERROR_TIMEOUT
+from services.bss_response import BSSResponse, REQUEST_ERROR
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+class BSSGatewayPoolTests(SimpleTestCase):
+    """网关选择、冷却与探测"""
+    
+    def setUp(self):
+        self.clock = FakeClock()
+    
+    def make_pool(self, count=2, **kwargs):
+        kwargs.setdefault('probe_ratio', 0)
+        urls = [f'http://10.0.0.{index}' for index in range(1, count + 1)]
+        return BSSGatewayPool(urls, clock=self.clock, rng=random.Random(7), **kwargs)
+    
+    def use(self, pool, latency=None, failed=False):
+        """选择一个网关并立即归还"""
+        gateway = pool.acquire()
+        pool.release(gateway, latency, failed)
+        return gateway
+    
+    def test_prefers_unsampled_then_lowest_score(self):
+        pool = self.make_pool()
+        first, second = pool.gateways
+        # 尚无延迟样本的网关优先
+        self.assertIs(self.use(pool, 0.1), first)
+        self.assertIs(self.use(pool, 0.3), second)
+        self.assertIs(pool.acquire(), first)
+    
+    def test_in_flight_requests_shift_load(self):
+        pool = self.make_pool()
+        first, second = pool.gateways
+        first.latency, second.latency = 0.1, 0.35
+        # 快网关得分随在途请求数增长为0.1、0.2、0.3，第4个请求时为0.4，超过慢网关
+        self.assertEqual([pool.acquire() for _ in range(4)], [first, first, first, second])
+    
+    def test_latency_is_smoothed(self):
+        pool = self.make_pool(count=1, smoothing=0.5)
+        self.use(pool, 0.2)
+        self.use(pool, 0.4)
+        self.assertAlmostEqual(pool.gateways[0].latency, 0.3)
+    
+    def test_probe_ratio_picks_random_healthy_gateway(self):
+        pool = self.make_pool(probe_ratio=0.2)
+        first, second = pool.gateways
+        first.latency, second.latency = 0.1, 10
+        picks = [self.use(pool) for _ in range(10000)]
+        # 探测时在两个网关中随机选择，慢网关约分到probe_ratio/2的请求
+        self.assertAlmostEqual(picks.count(second) / len(picks), 0.1, delta=0.02)
+    
+    def test_consecutive_failures_cool_down_gateway(self):
+        pool = self.make_pool(failure_threshold=2, cooldown=30)
+        first, second = pool.gateways
+        second.latency = 0.5
+        self.use(pool, failed=True)
+        self.assertIs(self.use(pool, failed=True), first)
+        self.assertFalse(pool.get_stats()[first.url]['available'])
+        self.assertEqual(first.cooldowns, 1)
+        self.assertIs(pool.acquire(), second)
+        
+        self.clock.now += 30
+        self.assertTrue(pool.get_stats()[first.url]['available'])
+        self.assertIs(pool.acquire(), first)
+    
+    def test_success_resets_consecutive_failures(self):
+        pool = self.make_pool(count=1, failure_threshold=2)
+        self.use(pool, failed=True)
+        self.use(pool, 0.1)
+        self.use(pool, failed=True)
+        gateway = pool.gateways[0]
+        self.assertEqual((gateway.failures, gateway.errors, gateway.cooldowns), (1, 2, 0))
+    
+    def test_single_gateway_never_cools_down(self):
+        pool = self.make_pool(count=1, failure_threshold=1)
+        self.use(pool, failed=True)
+        self.assertTrue(pool.get_stats()['http://10.0.0.1']['available'])
+    
+    def test_all_cooling_picks_earliest_expiry(self):
+        pool = self.make_pool(count=3, failure_threshold=1, cooldown=30)
+        first, second, third = pool.gateways
+        for gateway in (second, first, third):
+            pool.release(gateway, None, True)
+            self.clock.now += 1
+        self.assertFalse(any(stats['available'] for stats in pool.get_stats().values()))
+        self.assertIs(pool.acquire(), second)
+        self.assertIs(pool.acquire([second]), first)
+    
+    def test_acquire_excludes_tried_gateways(self):
+        pool = self.make_pool()
+        first, second = pool.gateways
+        self.assertIs(pool.acquire([first]), second)
+        self.assertIsNone(pool.acquire([first, second]))
+        self.assertEqual((first.in_flight, second.in_flight), (0, 1))
+    
+    def test_requires_a_gateway(self):
+        with self.assertRaises(ValueError):
+            BSSGatewayPool(['', None])
+
+
+class GatewayFailoverTests(SimpleTestCase):
+    """BSSAPIClient连接失败时切换网关"""
+    
+    def setUp(self):
+        self.bss_client = BSSAPIClient()
+        self.bss_client.gateways = BSSGatewayPool(
+            ['http://10.0.0.1', 'http://10.0.0.2', 'http://10.0.0.3'], probe_ratio=0, rng=random.Random(7)
+        )
+        self.bss_client.hedging = mock.Mock(enabled=False)
+        self.bss_client.hedging.hedge_delay.return_value = None
+    
+    def fail(self, error_type):
+        return BSSResponse.failure(USER_QUERY_ENDPOINT, REQUEST_ERROR, 'error', 'trans', error_type=error_type)
+    
+    def test_connection_error_resends_to_untried_gateway(self):
+        first, second, third = self.bss_client.gateways.gateways
+        ok = BSSResponse(USER_QUERY_ENDPOINT, 200, 'trans', '0000', 'ok', {})
+        posted = []
+        
+        def post(gateway, *args):
+            posted.append(gateway)
+            return self.fail(ERROR_CONNECTION) if gateway is first else ok
+        
+        with mock.patch.object(self.bss_client, '_post', side_effect=post):
+            result = self.bss_client.query_user_by_iccid('8986')
+        
+        self.assertTrue(result.ok)
+        self.assertEqual(posted[0], first)
+        self.assertEqual(len(posted), 2)
+        self.assertIn(posted[1], (second, third))
+    
+    def test_gives_up_after_every_gateway_tried(self):
+        posted = []
+        
+        def post(gateway, *args):
+            posted.append(gateway)
+            return self.fail(ERROR_CONNECTION)
+        
+        with mock.patch.object(self.bss_client, '_post', side_effect=post):
+            result = self.bss_client.query_user_by_iccid('8986')
+        
+        self.assertEqual(result.error_type, ERROR_CONNECTION)
+        self.assertCountEqual(posted, self.bss_client.gateways.gateways)
+    
+    def test_timeout_is_not_resent(self):
+        # 超时的请求可能已到达BSS，不切换网关重发
+        with mock.patch.object(self.bss_client, '_post', return_value=self.fail(ERROR_TIMEOUT)) as post:
+            result = self.bss_client.query_user_by_iccid('8986')
+        
+        self.assertEqual(result.error_type, ERROR_TIMEOUT)
+        self.assertEqual(post.call_count, 1)
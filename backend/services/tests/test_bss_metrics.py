@@ -0,0 +1,99 @@
+"""
+BSS调用指标与Prometheus导出测试
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase, RequestFactory, override_settings
+
+from mysite.metrics_views import bss_metrics_view
+from services.bss_metrics import BSSMetrics, ERROR_TIMEOUT
+from services.bss_response import BSSResponse, REQUEST_ERROR
+from services.tests.utils import requires_fakeredis, patch_redis
+
+ENDPOINT = '/bossapi/v3/business/user/query'
+
+
+@requires_fakeredis
+class PrometheusRenderTests(SimpleTestCase):
+    """指标汇总与文本格式"""
+    
+    def setUp(self):
+        patcher, self.redis = patch_redis('services.bss_metrics')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.metrics = BSSMetrics(buckets=(0.1, 1), flush_interval=3600)
+    
+    def test_renders_histogram_and_counters(self):
+        self.metrics.observe(ENDPOINT, 0.05, BSSResponse(ENDPOINT, 200, code='0000', response_bytes=100))
+        self.metrics.observe(ENDPOINT, 0.5, BSSResponse(ENDPOINT, 200, code='1001', response_bytes=20), attempt=1)
+        self.metrics.observe(ENDPOINT, 5, BSSResponse.failure(ENDPOINT, REQUEST_ERROR, 'timeout', error_type=ERROR_TIMEOUT))
+        lines = self.metrics.render_prometheus().splitlines()
+        
+        label = f'endpoint="{ENDPOINT}"'
+        for line in (
+            '# TYPE bss_request_duration_seconds histogram',
+            f'bss_request_duration_seconds_bucket{{{label},le="0.1"}} 1',
+            f'bss_request_duration_seconds_bucket{{{label},le="1"}} 2',
+            f'bss_request_duration_seconds_bucket{{{label},le="+Inf"}} 3',
+            f'bss_request_duration_seconds_sum{{{label}}} 5.55',
+            f'bss_request_duration_seconds_count{{{label}}} 3',
+            f'bss_response_bytes_total{{{label}}} 120',
+            f'bss_responses_total{{{label},status="200"}} 2',
+            f'bss_response_codes_total{{{label},code="1001"}} 1',
+            f'bss_request_attempts_total{{{label},attempt="1"}} 1',
+            f'bss_request_errors_total{{{label},type="timeout"}} 1',
+        ):
+            self.assertIn(line, lines)
+    
+    def test_workers_aggregate_in_redis(self):
+        other_worker = BSSMetrics(buckets=(0.1, 1), flush_interval=3600)
+        self.metrics.observe(ENDPOINT, 0.05, BSSResponse(ENDPOINT, 200, code='0000'))
+        other_worker.observe(ENDPOINT, 0.05, BSSResponse(ENDPOINT, 200, code='0000'))
+        other_worker.flush()
+        self.assertIn(f'bss_request_duration_seconds_count{{endpoint="{ENDPOINT}"}} 2',
+                      self.metrics.render_prometheus().splitlines())
+    
+    def test_escapes_label_values(self):
+        self.metrics.observe(ENDPOINT, 0.05, BSSResponse(ENDPOINT, 200, code='a"b\\c'))
+        self.assertIn(f'bss_response_codes_total{{endpoint="{ENDPOINT}",code="a\\"b\\\\c"}} 1',
+                      self.metrics.render_prometheus().splitlines())
+
+
+@requires_fakeredis
+@override_settings(BSS_METRICS_ALLOWED_IPS=['127.0.0.1', '10.0.0.0/8'])
+class MetricsViewTests(SimpleTestCase):
+    """/api/metrics/bss/ 访问控制"""
+    
+    def setUp(self):
+        for module in ('services.bss_metrics', 'services.concurrency_limiter'):
+            patcher, _ = patch_redis(module)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+    
+    def get(self, remote_addr, **headers):
+        return bss_metrics_view(self.factory.get('/api/metrics/bss/', REMOTE_ADDR=remote_addr, **headers))
+    
+    def test_allows_internal_addresses(self):
+        for address in ('127.0.0.1', '10.1.2.3'):
+            response = self.get(address)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('# TYPE bss_request_duration_seconds histogram', response.content.decode())
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+    
+    def test_rejects_external_addresses(self):
+        for address in ('203.0.113.5', '192.168.1.1', 'not-an-ip', ''):
+            self.assertEqual(self.get(address).status_code, 403)
+    
+    def test_ignores_forwarded_for_header(self):
+        self.assertEqual(self.get('203.0.113.5', HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 403)
+    
+    def test_post_not_allowed(self):
+        request = self.factory.post('/api/metrics/bss/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(bss_metrics_view(request).status_code, 405)
+    
+    def test_redis_failure_returns_503(self):
+        with mock.patch('mysite.metrics_views.bss_metrics.render_prometheus', side_effect=ConnectionError('down')):
+            response = self.get('127.0.0.1')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('down', response.content.decode())
@@ -0,0 +1,126 @@
+"""
+BSS响应录制与回放测试
+"""
+import asyncio
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.api_clients import APIClientManager, AsyncBSSAPIClient, BSSAPIClient, USER_QUERY_ENDPOINT
+from services.bss_gateways import BSSGatewayPool
+from services.bss_recorder import BSSResponseStore, MODE_RECORD, MODE_REPLAY, REPLAY_MISS_ERROR
+from services.bss_response import SOURCE_REPLAY
+from services.bss_stub import BSSStubServer
+from services.retry_policy import RetryPolicy, RESULT_PERMANENT
+
+ICCID = '89860000000000000001'
+
+
+class RecorderTestCase(SimpleTestCase):
+    """使用临时录制文件"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'recordings.sqlite3')
+        self.store = BSSResponseStore(self.path)
+    
+    def make_client(self, mode, client_class=BSSAPIClient):
+        client = client_class()
+        client.mode, client.store = mode, self.store
+        return client
+
+
+class BSSResponseStoreTests(RecorderTestCase):
+    """录制文件"""
+    
+    def test_record_then_replay_from_file(self):
+        self.store.record(USER_QUERY_ENDPOINT, {'userIdentity': {'iccid': ICCID}}, 200, b'{"code":"0000"}')
+        replayed = BSSResponseStore(self.path).replay(USER_QUERY_ENDPOINT, {'userIdentity': {'iccid': ICCID}})
+        self.assertEqual(replayed, (200, b'{"code":"0000"}'))
+    
+    def test_key_ignores_body_key_order(self):
+        self.store.record(USER_QUERY_ENDPOINT, {'a': 1, 'b': 2}, 200, b'{}')
+        self.assertIsNotNone(self.store.replay(USER_QUERY_ENDPOINT, {'b': 2, 'a': 1}))
+        self.assertIsNone(self.store.replay(USER_QUERY_ENDPOINT, {'a': 1, 'b': 3}))
+        self.assertIsNone(self.store.replay('/other', {'a': 1, 'b': 2}))
+    
+    def test_rerecord_overwrites(self):
+        self.store.record(USER_QUERY_ENDPOINT, {}, 503, b'{}')
+        self.store.replay(USER_QUERY_ENDPOINT, {})
+        self.store.record(USER_QUERY_ENDPOINT, {}, 200, b'{"code":"0000"}')
+        self.assertEqual(self.store.replay(USER_QUERY_ENDPOINT, {}), (200, b'{"code":"0000"}'))
+        self.assertEqual(self.store.get_stats(), {'recorded': 2, 'replayed': 2, 'missed': 0})
+
+
+class ClientReplayTests(RecorderTestCase):
+    """客户端录制与回放"""
+    
+    def test_recorded_live_responses_replay_identically(self):
+        server = BSSStubServer(('127.0.0.1', 0), 'APP', 'SECRET')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        recorder = self.make_client(MODE_RECORD)
+        recorder.app_id, recorder.app_secret = 'APP', 'SECRET'
+        recorder.gateways = BSSGatewayPool([f'http://127.0.0.1:{server.server_address[1]}'])
+        live = recorder.query_subscriptions_by_iccid(ICCID)
+        
+        replayer = self.make_client(MODE_REPLAY)
+        replayer.gateways = BSSGatewayPool(['http://127.0.0.1:9'])
+        replayed = replayer.query_subscriptions_by_iccid(ICCID)
+        self.assertTrue(replayed.ok)
+        self.assertEqual(replayed.source, SOURCE_REPLAY)
+        self.assertEqual((replayed.status_code, replayed.data), (live.status_code, live.data))
+        self.assertEqual(replayer.gateways.get_stats()['http://127.0.0.1:9']['requests'], 0)
+    
+    def test_miss_is_permanent_failure(self):
+        result = self.make_client(MODE_REPLAY).query_user_by_iccid(ICCID)
+        self.assertEqual(result.error, REPLAY_MISS_ERROR)
+        self.assertEqual(result.source, SOURCE_REPLAY)
+        self.assertEqual(RetryPolicy().classify(result), RESULT_PERMANENT)
+        self.assertEqual(self.store.get_stats()['missed'], 1)
+
+
+class ManagerReplayIsolationTests(RecorderTestCase):
+    """回放模式与线上缓存、合并及流控隔离"""
+    
+    def setUp(self):
+        super().setUp()
+        self.manager = APIClientManager(max_retries=2, retry_delay=0.001)
+        self.manager.client = self.make_client(MODE_REPLAY)
+        self.shared = {}
+        for name in ('response_cache', 'circuit_breaker', 'rate_limiter', 'concurrency_limiter', 'metrics'):
+            self.shared[name] = mock.Mock(enabled=False)
+            setattr(self.manager, name, self.shared[name])
+        for name in ('acquire', 'acquire_async', 'publish'):
+            patcher = mock.patch.object(self.manager.singleflight, name)
+            self.shared[f'singleflight.{name}'] = patcher.start()
+            self.addCleanup(patcher.stop)
+        body = BSSAPIClient._build_request_body(ICCID)
+        self.store.record(USER_QUERY_ENDPOINT, body, 200, b'{"code":"0000","data":{"user":{"iccid":"1"}}}')
+    
+    def assert_isolated(self):
+        for name, shared in self.shared.items():
+            self.assertEqual(shared.mock_calls, [], name)
+    
+    def test_sync_replay_skips_shared_state(self):
+        results = self.manager.query_iccid(ICCID)
+        self.assertTrue(results['user'].ok)
+        self.assertEqual(results['subscription'].error, REPLAY_MISS_ERROR)
+        self.assert_isolated()
+        # 回放缺失不重试
+        self.assertEqual(self.store.get_stats(), {'recorded': 1, 'replayed': 1, 'missed': 2})
+    
+    def test_async_replay_skips_shared_state(self):
+        async def query():
+            async with self.make_client(MODE_REPLAY, AsyncBSSAPIClient) as client:
+                return await self.manager.query_iccid_async(client, ICCID)
+        
+        results = asyncio.run(query())
+        self.assertTrue(results['user'].ok)
+        self.assertEqual(results['usage'].error, REPLAY_MISS_ERROR)
+        self.assert_isolated()
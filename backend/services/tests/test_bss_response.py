@@ -0,0 +1,71 @@
+"""
+BSS响应对象测试
+"""
+from django.test import SimpleTestCase
+
+from services.bss_response import (
+    BSSResponse, PARSE_ERROR, REQUEST_ERROR, SOURCE_CACHE, SOURCE_LIVE, SOURCE_REPLAY, json_dumps,
+)
+
+ENDPOINT = '/bossapi/v3/business/user/query'
+REQUEST_BODY = {'userIdentity': {'iccid': '89860000000000000001'}}
+
+
+class ParseTests(SimpleTestCase):
+    """响应体解析"""
+    
+    def test_success_response(self):
+        content = json_dumps({'code': '0000', 'message': 'ok', 'data': {'user': {'userId': 1}}})
+        result = BSSResponse.parse(ENDPOINT, content, 200, 'trans-1', REQUEST_BODY)
+        self.assertTrue(result.ok)
+        self.assertIsNone(result.error)
+        self.assertEqual((result.status_code, result.trans_id, result.code), (200, 'trans-1', '0000'))
+        self.assertEqual(result.get_data('user'), {'userId': 1})
+        self.assertEqual(result.response_bytes, len(content))
+    
+    def test_business_error_is_not_ok(self):
+        result = BSSResponse.parse(ENDPOINT, b'{"code":"1001","message":"ICCID\\u4e0d\\u5b58\\u5728"}', 200)
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.error)
+        self.assertEqual((result.code, result.message), ('1001', 'ICCID不存在'))
+    
+    def test_invalid_json_is_parse_error(self):
+        for content in (b'<html>502 Bad Gateway</html>', b'[1, 2]', b''):
+            result = BSSResponse.parse(ENDPOINT, content, 502, 'trans-1')
+            self.assertEqual(result.error, PARSE_ERROR, content)
+            self.assertFalse(result.ok)
+            self.assertEqual((result.status_code, result.response_bytes), (502, len(content)))
+    
+    def test_get_data_defaults(self):
+        result = BSSResponse.parse(ENDPOINT, b'{"code":"0000","data":{"list":null}}', 200)
+        self.assertEqual(result.get_data('list', []), [])
+        self.assertEqual(BSSResponse.parse(ENDPOINT, b'{"code":"0000","data":"x"}').get_data('list', 1), 1)
+
+
+class SerializationTests(SimpleTestCase):
+    """缓存共享与错误案例诊断信息"""
+    
+    def test_dict_round_trip_drops_request_body(self):
+        result = BSSResponse.parse(ENDPOINT, b'{"code":"0000","data":{"user":{}}}', 200, 'trans-1', REQUEST_BODY)
+        value = result.to_dict()
+        self.assertNotIn('request_body', value)
+        restored = BSSResponse.from_dict(value, SOURCE_CACHE)
+        self.assertEqual(restored.to_dict(), value)
+        self.assertEqual(restored.source, SOURCE_CACHE)
+        self.assertIsNone(restored.request_body)
+    
+    def test_badcase_data_has_no_headers_or_signature(self):
+        result = BSSResponse.failure(ENDPOINT, REQUEST_ERROR, 'timeout', 'trans-1', request_body=REQUEST_BODY)
+        data = result.to_badcase_data()
+        self.assertEqual(data, {
+            'endpoint': ENDPOINT, 'trans_id': 'trans-1', 'message': 'timeout', 'error': REQUEST_ERROR,
+            'request_body': REQUEST_BODY,
+        })
+        for header in ('headers', 'AppId', 'Ciphertext', 'Timestamp', '_request_info'):
+            self.assertNotIn(header, data)
+    
+    def test_badcase_data_marks_non_live_source(self):
+        live = BSSResponse.parse(ENDPOINT, b'{"code":"1001"}', 200, source=SOURCE_LIVE)
+        replayed = BSSResponse.parse(ENDPOINT, b'{"code":"1001"}', 200, source=SOURCE_REPLAY)
+        self.assertNotIn('source', live.to_badcase_data())
+        self.assertEqual(replayed.to_badcase_data()['source'], SOURCE_REPLAY)
@@ -0,0 +1,79 @@
+"""
+本地BSS模拟服务测试
+"""
+import threading
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from services.api_clients import BSSAPIClient
+from services.bss_gateways import BSSGatewayPool
+from services.bss_stub import BSSStubServer, BSSDataGenerator, LatencyModel, USAGE_DATE_FORMAT
+
+
+class LatencyModelTests(SimpleTestCase):
+    """延迟分布规格"""
+    
+    def test_fixed_latency_in_seconds(self):
+        self.assertEqual(LatencyModel('fixed:50').sample(None), 0.05)
+    
+    def test_invalid_spec_rejected(self):
+        for spec in ('pareto:1', 'uniform:10', 'normal:a,b'):
+            with self.assertRaises(ValueError):
+                LatencyModel(spec)
+
+
+class BSSStubServerTests(SimpleTestCase):
+    """经BSSAPIClient访问模拟服务"""
+    
+    def start_server(self, **kwargs):
+        server = BSSStubServer(('127.0.0.1', 0), 'APP', 'SECRET', seed=1, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        
+        client = BSSAPIClient()
+        client.app_id, client.app_secret, client.timeout = 'APP', 'SECRET', 5
+        client.gateways = BSSGatewayPool([f'http://127.0.0.1:{server.server_address[1]}'])
+        return server, client
+    
+    def test_returns_deterministic_data(self):
+        server, client = self.start_server()
+        first = client.query_user_by_iccid('89860000000000000001')
+        second = client.query_user_by_iccid('89860000000000000001')
+        self.assertTrue(first.ok)
+        self.assertEqual(first.get_data('user'), second.get_data('user'))
+        self.assertEqual(first.get_data('user')['iccid'], '89860000000000000001')
+        subscriptions = client.query_subscriptions_by_iccid('89860000000000000001').get_data('list')
+        self.assertEqual(subscriptions, BSSDataGenerator().subscriptions('89860000000000000001'))
+        self.assertEqual(server.get_stats(), {
+            '/bossapi/v3/business/user/query': {'success': 2},
+            '/bossapi/v3/business/subscription/query': {'success': 1},
+        })
+    
+    def test_usage_filtered_by_begin_date(self):
+        _, client = self.start_server(generator=BSSDataGenerator(usage_days=10, max_subscriptions=1))
+        begin_date = (date.today() - timedelta(days=2)).strftime(USAGE_DATE_FORMAT)
+        usages = client.query_daily_usage_by_iccid('89860000000000000001', begin_date=begin_date).get_data('list')
+        self.assertEqual(len(usages), 3)
+        self.assertTrue(all(usage['usageDate'] >= begin_date for usage in usages))
+    
+    def test_rejects_bad_signature(self):
+        _, client = self.start_server()
+        client.app_secret = 'WRONG'
+        result = client.query_user_by_iccid('89860000000000000001')
+        self.assertEqual((result.status_code, result.code), (200, '1002'))
+    
+    def test_injects_server_errors(self):
+        server, client = self.start_server(error_rate=1.0)
+        result = client.query_user_by_iccid('89860000000000000001')
+        self.assertEqual(result.status_code, 503)
+        self.assertFalse(result.ok)
+        self.assertEqual(server.get_stats()['/bossapi/v3/business/user/query'], {'server_error': 1})
+    
+    def test_throttles_above_rate_limit(self):
+        server, client = self.start_server(rate_limit=1)
+        statuses = [client.query_user_by_iccid('89860000000000000001').status_code for _ in range(3)]
+        self.assertEqual(statuses[0], 200)
+        self.assertIn(429, statuses[1:])
@@ -0,0 +1,105 @@
+"""
+熔断器测试
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.circuit_breaker import BSSCircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+from services.tests.utils import requires_fakeredis, patch_redis
+
+
+@requires_fakeredis
+class CircuitBreakerTests(SimpleTestCase):
+    """closed/open/half_open状态转换（Lua脚本）"""
+    
+    def setUp(self):
+        patcher, self.redis = patch_redis('services.circuit_breaker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def breaker(self, **kwargs):
+        options = {'failure_ratio': 0.5, 'min_requests': 10, 'cooldown': 60, 'state_cache_ttl': 0,
+                   'success_flush_interval': 0}
+        options.update(kwargs)
+        return BSSCircuitBreaker(**options)
+    
+    def test_stays_closed_below_min_requests(self):
+        breaker = self.breaker()
+        for _ in range(9):
+            breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_CLOSED)
+        breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_OPEN)
+    
+    def test_stays_closed_below_failure_ratio(self):
+        breaker = self.breaker()
+        for _ in range(100):
+            breaker.record_success('user')
+        for _ in range(30):
+            breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_CLOSED)
+        self.assertEqual(self.redis.hgetall('bss:circuit:user:window'), {b'requests': b'130', b'failures': b'30'})
+    
+    def test_opens_at_failure_ratio(self):
+        breaker = self.breaker()
+        for _ in range(10):
+            breaker.record_success('user')
+        for _ in range(9):
+            breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_CLOSED)
+        breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_OPEN)
+        self.assertFalse(breaker.allow('user'))
+    
+    def test_successes_are_batched_in_process(self):
+        breaker = self.breaker(state_cache_ttl=60, success_flush_interval=60)
+        breaker.allow('user')
+        for _ in range(5):
+            breaker.record_success('user')
+        # 第一次成功写入，其余在进程内累计，随下一次失败写入
+        self.assertEqual(self.redis.hget('bss:circuit:user:window', 'requests'), b'1')
+        breaker.record_failure('user')
+        self.assertEqual(self.redis.hgetall('bss:circuit:user:window'), {b'requests': b'6', b'failures': b'1'})
+    
+    def test_half_open_probe_success_closes(self):
+        breaker = self.breaker(min_requests=1, cooldown=0)
+        breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_OPEN)
+        # 冷却结束后集群内只放行一个探测请求
+        self.assertTrue(breaker.allow('user'))
+        self.assertEqual(breaker.get_state('user'), STATE_HALF_OPEN)
+        self.assertFalse(breaker.allow('user'))
+        breaker.record_success('user')
+        self.assertEqual(breaker.get_state('user'), STATE_CLOSED)
+        self.assertFalse(self.redis.exists('bss:circuit:user:window'))
+    
+    def test_half_open_probe_failure_reopens(self):
+        breaker = self.breaker(min_requests=1, cooldown=0)
+        breaker.record_failure('user')
+        self.assertTrue(breaker.allow('user'))
+        breaker.record_failure('user')
+        self.assertEqual(breaker.get_state('user'), STATE_OPEN)
+    
+    def test_open_blocks_until_cooldown(self):
+        breaker = self.breaker(min_requests=1, cooldown=60)
+        breaker.record_failure('user')
+        self.assertFalse(breaker.allow('user'))
+        self.assertEqual(breaker.get_state('user'), STATE_OPEN)
+    
+    def test_api_types_are_independent(self):
+        breaker = self.breaker(min_requests=1)
+        breaker.record_failure('user')
+        self.assertFalse(breaker.allow('user'))
+        self.assertTrue(breaker.allow('subscription'))
+
+
+class CircuitBreakerRedisUnavailableTests(SimpleTestCase):
+    """Redis不可用时放行"""
+    
+    def test_allows_when_redis_fails(self):
+        breaker = BSSCircuitBreaker(state_cache_ttl=0)
+        with mock.patch('services.circuit_breaker.get_redis_connection', side_effect=ConnectionError('down')):
+            breaker.record_failure('user')
+            self.assertTrue(breaker.allow('user'))
+            self.assertEqual(breaker.get_state('user'), STATE_CLOSED)
@@ -0,0 +1,193 @@
+"""
+自适应并发限制器测试
+"""
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.concurrency_limiter import (
+    AdaptiveConcurrencyLimiter, REASON_GROW, REASON_LATENCY, REASON_ERROR,
+)
+
+
+class Clock:
+    """可手动推进的单调时钟"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+class LimiterTestCase(SimpleTestCase):
+    
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('services.concurrency_limiter.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def limiter(self, **kwargs):
+        options = {'initial_limit': 10, 'min_limit': 3, 'max_limit': 60, 'publish_interval': 1e9}
+        options.update(kwargs)
+        return AdaptiveConcurrencyLimiter(**options)
+    
+    def run_window(self, limiter, latency=0.05, failures=0, samples=20, in_flight=None, reserve=False):
+        """按给定并发跑满一个采样窗口"""
+        in_flight = limiter.capacity(reserve) if in_flight is None else in_flight
+        for _ in range(in_flight):
+            self.assertTrue(limiter.try_acquire(reserve))
+        self.clock.now += 1
+        for index in range(samples):
+            limiter.record(latency, index < failures)
+        for _ in range(in_flight):
+            limiter.release()
+    
+    def reasons(self, limiter):
+        return {entry['reason'] for entry in limiter.get_history()}
+
+
+class AdaptiveLimitTests(LimiterTestCase):
+    """上限的增长与收缩"""
+    
+    def test_grows_under_stable_latency(self):
+        limiter = self.limiter()
+        for _ in range(10):
+            self.run_window(limiter)
+        self.assertGreater(limiter.limit, 10)
+        self.assertEqual(self.reasons(limiter), {REASON_GROW})
+        self.assertGreater(limiter.get_stats()['grows'], 0)
+    
+    def test_does_not_grow_when_underused(self):
+        limiter = self.limiter()
+        for _ in range(10):
+            self.run_window(limiter, in_flight=2)
+        self.assertEqual(limiter.limit, 10)
+    
+    def test_never_exceeds_max_limit(self):
+        limiter = self.limiter(max_limit=12)
+        for _ in range(20):
+            self.run_window(limiter)
+        self.assertEqual(limiter.limit, 12)
+    
+    def test_shrinks_when_latency_rises(self):
+        limiter = self.limiter(initial_limit=20)
+        for _ in range(3):
+            self.run_window(limiter, latency=0.05)
+        grown = limiter.limit
+        for _ in range(10):
+            self.run_window(limiter, latency=1.0)
+        self.assertLess(limiter.limit, grown)
+        self.assertIn(REASON_LATENCY, self.reasons(limiter))
+    
+    def test_sustained_errors_back_off_to_min(self):
+        limiter = self.limiter(initial_limit=20)
+        for _ in range(15):
+            self.run_window(limiter, failures=8)
+        self.assertEqual(limiter.limit, 3)
+        self.assertIn(REASON_ERROR, self.reasons(limiter))
+        self.assertGreater(limiter.get_stats()['error_rate'], 0.15)
+    
+    def test_steady_low_error_rate_does_not_pin_limit(self):
+        limiter = self.limiter()
+        for _ in range(20):
+            self.run_window(limiter, failures=2)
+        self.assertGreater(limiter.limit, 10)
+        self.assertNotIn(REASON_ERROR, self.reasons(limiter))
+    
+    def test_single_bad_window_is_smoothed(self):
+        limiter = self.limiter()
+        self.run_window(limiter, failures=8)
+        self.assertEqual(limiter.get_stats()['error_decreases'], 0)
+    
+    def test_window_needs_min_samples(self):
+        limiter = self.limiter()
+        self.run_window(limiter, samples=19)
+        self.assertEqual(limiter.limit, 10)
+        self.assertIsNone(limiter.get_stats()['short_rtt'])
+
+
+class AcquireTests(LimiterTestCase):
+    """在途名额的获取与归还"""
+    
+    def test_try_acquire_respects_limit(self):
+        limiter = self.limiter(initial_limit=3)
+        self.assertEqual([limiter.try_acquire() for _ in range(4)], [True, True, True, False])
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual(limiter.in_flight, 3)
+    
+    def test_acquire_times_out(self):
+        limiter = self.limiter(initial_limit=3)
+        for _ in range(3):
+            limiter.try_acquire()
+        self.assertFalse(limiter.acquire(timeout=0.01))
+    
+    def test_release_wakes_waiter(self):
+        limiter = self.limiter(initial_limit=3)
+        for _ in range(3):
+            limiter.try_acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(limiter.acquire(timeout=5)))
+        waiter.start()
+        limiter.release()
+        waiter.join(5)
+        self.assertEqual(acquired, [True])
+    
+    def test_disabled_does_not_limit(self):
+        limiter = self.limiter(enabled=False)
+        self.assertTrue(all(limiter.try_acquire() for _ in range(100)))
+        self.assertEqual(limiter.limit, 60)
+        limiter.record(10, True)
+        self.assertEqual(limiter.get_stats()['samples'], 0)
+
+
+class LaneReserveTests(LimiterTestCase):
+    """为交互通道预留的名额"""
+    
+    def test_reserve_scales_with_limit(self):
+        for limit, bulk_capacity in ((3, 3), (12, 9), (40, 34)):
+            with self.subTest(limit=limit):
+                limiter = self.limiter(initial_limit=limit, max_reserve=6, reserve_ratio=0.25)
+                self.assertEqual(limiter.capacity(reserve=True), bulk_capacity)
+                self.assertEqual(limiter.capacity(), limit)
+    
+    def test_interactive_uses_reserved_slots(self):
+        limiter = self.limiter(initial_limit=12, max_reserve=6, reserve_ratio=0.25)
+        for _ in range(9):
+            self.assertTrue(limiter.try_acquire(reserve=True))
+        self.assertFalse(limiter.try_acquire(reserve=True))
+        self.assertEqual([limiter.try_acquire() for _ in range(4)], [True, True, True, False])
+    
+    def test_bulk_lane_grows_from_min_limit(self):
+        limiter = self.limiter(initial_limit=3, min_limit=3, max_reserve=6, reserve_ratio=0.25)
+        for _ in range(20):
+            self.run_window(limiter, reserve=True)
+        self.assertGreater(limiter.limit, 10)
+        self.assertGreater(limiter.capacity(reserve=True), 8)
+    
+    def test_reserved_slots_count_as_used_for_growth(self):
+        # 峰值7 + 预留6 >= 24 / 2，仍可增长；不预留时峰值不足上限一半，不再增长
+        for max_reserve, grows in ((6, True), (0, False)):
+            with self.subTest(max_reserve=max_reserve):
+                limiter = self.limiter(initial_limit=24, max_reserve=max_reserve, reserve_ratio=0.25)
+                for _ in range(3):
+                    self.run_window(limiter, in_flight=7, reserve=True)
+                self.assertEqual(limiter.limit > 24, grows)
+    
+    def test_invalid_reserve_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.limiter(reserve_ratio=0.8)
+        with self.assertRaises(ValueError):
+            self.limiter(reserve_ratio=-0.1)
+    
+    def test_iccid_window_uses_bulk_capacity(self):
+        from services.api_clients import APIClientManager
+        manager = APIClientManager(max_concurrent=5)
+        manager.concurrency_limiter = self.limiter(initial_limit=12, max_reserve=6, reserve_ratio=0.25)
+        # 批量可用9个名额，对应3个ICCID，再多一个用于探测
+        self.assertEqual(manager._iccid_window(), 4)
+        manager.concurrency_limiter = self.limiter(enabled=False)
+        self.assertEqual(manager._iccid_window(), 5)
@@ -0,0 +1,344 @@
+"""
+数据服务批量写入测试
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.ICC.models import ICC
+from apps.Subscription.models import Subscription
+from apps.Usage.models import Usage
+from services.bss_response import BSSResponse
+from services.data_service import DataService, payload_fingerprint
+
+ICCID = '89860000000000000001'
+OTHER_ICCID = '89860000000000000002'
+
+
+def user_payload(iccid=ICCID, **fields):
+    payload = {'iccid': iccid, 'userId': 1001, 'brand': 'CTC', 'msisdn': '8613800000001', 'lifeCycle': '1'}
+    payload.update(fields)
+    return payload
+
+
+def subscription_payload(subscription_id='S1', **fields):
+    payload = {'subscriptionId': subscription_id, 'userId': 1001, 'productId': 'P1', 'status': '1', 'brand': 'CTC'}
+    payload.update(fields)
+    return payload
+
+
+def usage_payload(usage_date='20250101', usage=100, subscription_id='S1', **fields):
+    payload = {'subscriptionId': subscription_id, 'usageDate': usage_date, 'productId': 'P1', 'visitMnc': '03',
+               'visitMcc': '460', 'usage': usage, 'usageType': 'dat', 'unit': 'Byte'}
+    payload.update(fields)
+    return payload
+
+
+def model_values(instance, exclude=('id', 'iccid', 'created_at', 'updated_at')):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields if field.attname not in exclude
+    }
+
+
+class BulkUpsertICCTests(TestCase):
+    """ICC批量upsert"""
+    
+    def setUp(self):
+        self.service = DataService()
+    
+    def test_creates_and_merges_duplicate_iccids(self):
+        written = self.service.bulk_upsert_iccs([
+            user_payload(brand='A'),
+            user_payload(OTHER_ICCID),
+            {'iccid': ICCID, 'msisdn': '8613800000009'},
+            {'brand': 'no-iccid'},
+        ])
+        self.assertEqual(written, {ICCID, OTHER_ICCID})
+        self.assertEqual(ICC.objects.count(), 2)
+        icc = ICC.objects.get(iccid=ICCID)
+        self.assertEqual((icc.brand, icc.msisdn, icc.userid), ('A', '8613800000009', 1001))
+    
+    def test_update_keeps_fields_missing_from_payload(self):
+        self.service.bulk_upsert_iccs([user_payload(imsi='460000000000001')])
+        self.service.bulk_upsert_iccs([{'iccid': ICCID, 'brand': 'B'}])
+        icc = ICC.objects.get(iccid=ICCID)
+        self.assertEqual((icc.brand, icc.imsi, icc.msisdn), ('B', '460000000000001', '8613800000001'))
+    
+    def test_rerun_is_idempotent(self):
+        payloads = [user_payload(), user_payload(OTHER_ICCID, brand='B')]
+        self.service.bulk_upsert_iccs(payloads)
+        before = {icc.iccid: model_values(icc) for icc in ICC.objects.all()}
+        self.service.bulk_upsert_iccs(payloads)
+        after = {icc.iccid: model_values(icc) for icc in ICC.objects.all()}
+        self.assertEqual(after, before)
+    
+    def test_matches_per_row_write(self):
+        self.service.bulk_upsert_iccs([user_payload(ICCID)])
+        self.service._create_or_update_icc(user_payload(OTHER_ICCID))
+        self.assertEqual(model_values(ICC.objects.get(iccid=ICCID)), model_values(ICC.objects.get(iccid=OTHER_ICCID)))
+        
+        self.service.bulk_upsert_iccs([{'iccid': ICCID, 'brand': 'B', 'lifeCycle': '2'}])
+        self.service._create_or_update_icc({'iccid': OTHER_ICCID, 'brand': 'B', 'lifeCycle': '2'})
+        self.assertEqual(model_values(ICC.objects.get(iccid=ICCID)), model_values(ICC.objects.get(iccid=OTHER_ICCID)))
+
+
+class BulkUpsertSubscriptionTests(TestCase):
+    """订阅批量upsert"""
+    
+    def setUp(self):
+        self.service = DataService()
+    
+    def test_creates_missing_icc_and_returns_pks(self):
+        pks = self.service.bulk_upsert_subscriptions([
+            (ICCID, subscription_payload('S1')),
+            (ICCID, subscription_payload('S2', productId='P2')),
+            (ICCID, {'productId': 'no-id'}),
+        ])
+        self.assertEqual(set(pks), {'S1', 'S2'})
+        self.assertEqual(pks['S2'], Subscription.objects.get(subscriptionId='S2').pk)
+        icc = ICC.objects.get(iccid=ICCID)
+        self.assertEqual(set(Subscription.objects.filter(icc=icc).values_list('subscriptionId', flat=True)), {'S1', 'S2'})
+    
+    def test_existing_subscription_keeps_owner_icc(self):
+        self.service.bulk_upsert_subscriptions([(ICCID, subscription_payload())])
+        pks = self.service.bulk_upsert_subscriptions([(OTHER_ICCID, subscription_payload(status='2'))])
+        subscription = Subscription.objects.get(subscriptionId='S1')
+        self.assertEqual(pks, {'S1': subscription.pk})
+        self.assertEqual((subscription.icc.iccid, subscription.status), (ICCID, '2'))
+    
+    def test_update_keeps_fields_missing_from_payload(self):
+        self.service.bulk_upsert_subscriptions([(ICCID, subscription_payload(expTime='20301231'))])
+        self.service.bulk_upsert_subscriptions([(ICCID, {'subscriptionId': 'S1', 'status': '3'})])
+        subscription = Subscription.objects.get(subscriptionId='S1')
+        self.assertEqual((subscription.status, subscription.expTime, subscription.productId), ('3', '20301231', 'P1'))
+    
+    def test_duplicates_merge_in_order_and_first_owner_wins(self):
+        self.service.bulk_upsert_subscriptions([
+            (ICCID, subscription_payload(status='1')),
+            (OTHER_ICCID, {'subscriptionId': 'S1', 'status': '2'}),
+        ])
+        subscription = Subscription.objects.get(subscriptionId='S1')
+        self.assertEqual((subscription.icc.iccid, subscription.status, subscription.productId), (ICCID, '2', 'P1'))
+    
+    def test_rerun_is_idempotent(self):
+        items = [(ICCID, subscription_payload('S1')), (OTHER_ICCID, subscription_payload('S2'))]
+        first = self.service.bulk_upsert_subscriptions(items)
+        before = {sub.subscriptionId: model_values(sub) for sub in Subscription.objects.all()}
+        self.assertEqual(self.service.bulk_upsert_subscriptions(items), first)
+        after = {sub.subscriptionId: model_values(sub) for sub in Subscription.objects.all()}
+        self.assertEqual(after, before)
+        self.assertEqual(ICC.objects.count(), 2)
+    
+    def test_matches_per_row_write(self):
+        self.service.bulk_upsert_subscriptions([(ICCID, subscription_payload('S1'))])
+        self.service._create_or_update_subscription(ICCID, subscription_payload('S2'))
+        exclude = ('id', 'subscriptionId', 'created_at', 'updated_at')
+        self.assertEqual(model_values(Subscription.objects.get(subscriptionId='S1'), exclude),
+                         model_values(Subscription.objects.get(subscriptionId='S2'), exclude))
+
+
+class BulkUpsertUsageTests(TestCase):
+    """用量批量upsert"""
+    
+    def setUp(self):
+        self.service = DataService()
+        self.service.bulk_upsert_iccs([user_payload(ICCID), user_payload(OTHER_ICCID)])
+        self.subscription_pks = self.service.bulk_upsert_subscriptions([(ICCID, subscription_payload('S1'))])
+    
+    def usages(self):
+        return sorted(Usage.objects.values_list('usageDate', 'subscriptionId', 'productId', 'visitMnc', 'usage'))
+    
+    def test_upsert_updates_on_unique_key(self):
+        written = self.service.bulk_upsert_usages(
+            {ICCID: [usage_payload('20250101', 100), usage_payload('20250102', 200)]}, self.subscription_pks
+        )
+        self.assertEqual(written, {ICCID})
+        # 重叠窗口内再次返回的日期按唯一约束更新
+        self.service.bulk_upsert_usages({ICCID: [usage_payload('20250102', 250)]}, self.subscription_pks)
+        self.assertEqual(self.usages(), [
+            ('20250101', 'S1', 'P1', '03', 100),
+            ('20250102', 'S1', 'P1', '03', 250),
+        ])
+    
+    def test_unique_key_is_not_updated(self):
+        with mock.patch.object(Usage.objects, 'bulk_create', wraps=Usage.objects.bulk_create) as bulk_create:
+            self.service.bulk_upsert_usages({ICCID: [usage_payload('20250101')]}, self.subscription_pks)
+        
+        kwargs = bulk_create.call_args.kwargs
+        if connection.features.supports_update_conflicts_with_target:
+            self.assertEqual(kwargs['unique_fields'], ['usageDate', 'subscription_id', 'productId', 'visitMnc'])
+        self.assertFalse({'usageDate', 'subscription_id', 'productId', 'visitMnc'} & set(kwargs['update_fields']))
+        self.assertIn('usage', kwargs['update_fields'])
+    
+    def test_rerun_is_idempotent(self):
+        usage_lists = {ICCID: [usage_payload('20250101'), usage_payload('20250101', 5, visitMnc='11')]}
+        self.service.bulk_upsert_usages(usage_lists, self.subscription_pks)
+        before = self.usages()
+        self.service.bulk_upsert_usages(usage_lists)
+        self.assertEqual(self.usages(), before)
+        self.assertEqual(len(before), 2)
+    
+    def test_advances_sync_mark_forward_only(self):
+        self.service.bulk_upsert_usages({ICCID: [usage_payload('20250105'), usage_payload('20250103')]})
+        self.assertEqual(ICC.objects.get(iccid=ICCID).usage_synced_date, '20250105')
+        self.service.bulk_upsert_usages({ICCID: [usage_payload('20250101')]})
+        self.assertEqual(ICC.objects.get(iccid=ICCID).usage_synced_date, '20250105')
+    
+    def test_leaves_unsupported_iccids_to_per_row_write(self):
+        written = self.service.bulk_upsert_usages({
+            ICCID: [usage_payload(), usage_payload(visitMnc=None)],
+            OTHER_ICCID: [usage_payload(subscription_id='S-unknown')],
+            '89860000000000000099': [usage_payload()],
+        })
+        self.assertEqual(written, set())
+        self.assertEqual(Usage.objects.count(), 0)
+        self.assertIsNone(ICC.objects.get(iccid=ICCID).usage_synced_date)
+    
+    def test_fills_unknown_subscription_product(self):
+        self.service.bulk_upsert_subscriptions([(ICCID, {'subscriptionId': 'S2', 'productId': 'unknown'})])
+        self.service.bulk_upsert_usages({ICCID: [usage_payload(subscription_id='S2', productId='P9')]})
+        subscription = Subscription.objects.get(subscriptionId='S2')
+        self.assertEqual(subscription.productId, 'P9')
+        self.assertIsNone(subscription.payload_hash)
+    
+    def test_matches_per_row_write(self):
+        self.service.bulk_upsert_usages({ICCID: [usage_payload('20250101', 100)]})
+        self.service._create_or_update_usage(ICCID, usage_payload('20250101', 300))
+        self.assertEqual(self.usages(), [('20250101', 'S1', 'P1', '03', 300)])
+        self.service.bulk_upsert_usages({ICCID: [usage_payload('20250101', 400)]})
+        self.assertEqual(self.usages(), [('20250101', 'S1', 'P1', '03', 400)])
+
+
+class UsageSyncMarkTests(TestCase):
+    """用量同步水位与增量拉取"""
+    
+    def setUp(self):
+        self.service = DataService()
+        self.service.bulk_upsert_iccs([user_payload(ICCID), user_payload(OTHER_ICCID)])
+        self.service.bulk_upsert_subscriptions([(ICCID, subscription_payload('S1')), (ICCID, subscription_payload('S2'))])
+    
+    def mark(self, iccid=ICCID):
+        return ICC.objects.get(iccid=iccid).usage_synced_date
+    
+    def write_per_row(self, usages):
+        """按逐个写入路径处理一次用量响应"""
+        result = BSSResponse('usage', 200, code='0000', data={'list': usages})
+        return self.service._process_usage_info(None, ICCID, result)
+    
+    def test_mark_only_moves_forward(self):
+        self.service._advance_usage_marks({ICCID: [usage_payload('20250105')]})
+        self.service._advance_usage_marks({ICCID: [usage_payload('20250101')]})
+        self.assertEqual(self.mark(), '20250105')
+        self.service._advance_usage_marks({ICCID: [usage_payload('20250107')]})
+        self.assertEqual(self.mark(), '20250107')
+    
+    def test_failed_row_keeps_mark(self):
+        self.write_per_row([usage_payload('20250101')])
+        self.assertEqual(self.mark(), '20250101')
+        self.write_per_row([usage_payload('20250105'), usage_payload('20250106', subscription_id=None)])
+        self.assertEqual(self.mark(), '20250101')
+    
+    def test_icc_without_mark_fetches_full_history(self):
+        self.service._advance_usage_marks({ICCID: [usage_payload('20250110')]})
+        params = self.service.get_usage_params([ICCID, OTHER_ICCID])
+        self.assertEqual(params, {ICCID: {'begin_date': '20250107'}})
+    
+    @override_settings(BSS_USAGE_INCREMENTAL_ENABLED=False)
+    def test_incremental_disabled_fetches_full_history(self):
+        self.service._advance_usage_marks({ICCID: [usage_payload('20250110')]})
+        self.assertEqual(self.service.get_usage_params([ICCID]), {})
+    
+    def test_overlap_window_upserts(self):
+        self.write_per_row([usage_payload(f'2025010{day}', day) for day in range(1, 6)])
+        begin_date = self.service.get_usage_params([ICCID])[ICCID]['begin_date']
+        self.assertEqual(begin_date, '20250102')
+        # 重叠窗口内的日期再次返回（用量有修正），逐个写入与批量写入都按唯一约束更新
+        self.assertEqual(self.write_per_row([usage_payload(f'2025010{day}', day * 10) for day in range(2, 7)]),
+                         (True, '成功'))
+        self.service.bulk_upsert_usages({ICCID: [usage_payload(f'2025010{day}', day * 100) for day in range(3, 8)]})
+        usages = dict(Usage.objects.filter(subscriptionId='S1').values_list('usageDate', 'usage'))
+        self.assertEqual(usages, {
+            '20250101': 1, '20250102': 20, '20250103': 300, '20250104': 400,
+            '20250105': 500, '20250106': 600, '20250107': 700,
+        })
+        self.assertEqual(self.mark(), '20250107')
+    
+    def test_mark_waits_for_lagging_subscription(self):
+        self.service.bulk_upsert_usages({ICCID: [
+            usage_payload('20250105', subscription_id='S1'),
+            usage_payload('20250102', subscription_id='S2'),
+            usage_payload('20250103', subscription_id='S2'),
+        ]})
+        self.assertEqual(self.mark(), '20250103')
+        self.assertEqual(self.service.get_usage_params([ICCID]), {ICCID: {'begin_date': '20241231'}})
+    
+    @override_settings(BSS_USAGE_MAX_LAG_DAYS=30)
+    def test_stale_subscription_does_not_hold_mark(self):
+        self.service._advance_usage_marks({ICCID: [
+            usage_payload('20250301', subscription_id='S1'),
+            usage_payload('20250101', subscription_id='S2'),
+        ]})
+        self.assertEqual(self.mark(), '20250301')
+
+
+class PayloadFingerprintTests(TestCase):
+    """按BSS数据指纹跳过无变化的写入"""
+    
+    def setUp(self):
+        self.service = DataService()
+    
+    def test_fingerprint_ignores_key_order(self):
+        self.assertEqual(payload_fingerprint({'a': 1, 'b': '2'}), payload_fingerprint({'b': '2', 'a': 1}))
+        self.assertNotEqual(payload_fingerprint({'a': 1}), payload_fingerprint({'a': 2}))
+    
+    def test_bulk_rerun_skips_unchanged_rows(self):
+        self.service.bulk_upsert_iccs([user_payload(ICCID), user_payload(OTHER_ICCID)])
+        old = timezone.now() - timedelta(days=1)
+        ICC.objects.update(updated_at=old)
+        self.service.reset_write_stats()
+        self.service.bulk_upsert_iccs([user_payload(ICCID), user_payload(OTHER_ICCID)])
+        self.assertEqual(set(ICC.objects.values_list('updated_at', flat=True)), {old})
+        stats = self.service.get_write_stats()['icc']
+        self.assertEqual((stats['created'], stats['updated'], stats['skipped'], stats['skip_ratio']), (0, 0, 2, 1.0))
+    
+    def test_bulk_update_writes_only_changed_fields(self):
+        self.service.bulk_upsert_iccs([user_payload()])
+        row = {'iccid': ICCID, 'userid': 1001, 'brand': 'B', 'msisdn': '8613800000001', 'lifeCycle': '1'}
+        items, pks = self.service._plan_upsert(ICC, 'iccid', [row], 'icc')
+        (_, update_fields), = items
+        self.assertEqual(update_fields, ['brand', 'payload_hash'])
+        self.assertEqual(pks, {ICCID: ICC.objects.get(iccid=ICCID).pk})
+    
+    def test_missing_fingerprint_is_backfilled_without_field_updates(self):
+        self.service.bulk_upsert_iccs([user_payload()])
+        ICC.objects.update(payload_hash=None)
+        self.service.reset_write_stats()
+        self.service.bulk_upsert_iccs([user_payload()])
+        self.assertIsNotNone(ICC.objects.get(iccid=ICCID).payload_hash)
+        self.assertEqual(self.service.get_write_stats()['icc']['skipped'], 1)
+    
+    def test_per_row_rerun_skips_update(self):
+        self.service._create_or_update_icc(user_payload())
+        with CaptureQueriesContext(connection) as queries:
+            self.service._create_or_update_icc(user_payload())
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.service._create_or_update_icc(user_payload(brand='B'))
+        update, = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertIn(connection.ops.quote_name('brand'), update)
+        self.assertNotIn(connection.ops.quote_name('msisdn'), update)
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'B')
+    
+    def test_per_row_subscription_rerun_skips_update(self):
+        self.service._create_or_update_subscription(ICCID, subscription_payload())
+        self.service.reset_write_stats()
+        self.service._create_or_update_subscription(ICCID, subscription_payload())
+        self.service._create_or_update_subscription(ICCID, subscription_payload(status='2'))
+        stats = self.service.get_write_stats()['subscription']
+        self.assertEqual((stats['updated'], stats['skipped']), (1, 1))
@@ -0,0 +1,173 @@
+"""
+BSS请求对冲测试
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase
+
+from services.api_clients import BSSAPIClient, USER_QUERY_ENDPOINT
+from services.bss_gateways import BSSGatewayPool
+from services.hedging import BSSHedgingPolicy, HedgeRace, LEG_PRIMARY, LEG_HEDGE
+
+
+class HedgeDelayTests(SimpleTestCase):
+    """对冲延迟"""
+    
+    def test_no_hedge_until_min_samples(self):
+        policy = BSSHedgingPolicy(enabled=True, min_samples=5)
+        for _ in range(4):
+            policy.observe('/user', 0.2)
+        self.assertIsNone(policy.hedge_delay('/user'))
+        policy.observe('/user', 0.2)
+        self.assertEqual(policy.hedge_delay('/user'), 0.2)
+    
+    def test_delay_is_percentile_of_latencies(self):
+        policy = BSSHedgingPolicy(enabled=True, percentile=90, min_samples=10, min_delay=0)
+        # 分位数每20个新样本重新计算一次
+        for latency in range(1, 22):
+            policy.observe('/user', latency / 100)
+        self.assertEqual(policy.hedge_delay('/user'), 0.19)
+        self.assertIsNone(policy.hedge_delay('/usage'))
+    
+    def test_delay_not_below_min_delay(self):
+        policy = BSSHedgingPolicy(enabled=True, min_samples=1, min_delay=0.05)
+        policy.observe('/user', 0.001)
+        self.assertEqual(policy.hedge_delay('/user'), 0.05)
+    
+    def test_disabled_never_hedges(self):
+        policy = BSSHedgingPolicy(enabled=False, min_samples=1)
+        policy.observe('/user', 0.2)
+        self.assertIsNone(policy.hedge_delay('/user'))
+        self.assertEqual(policy.get_stats()['requests'], 0)
+
+
+class HedgeBudgetTests(SimpleTestCase):
+    """对冲预算"""
+    
+    def test_hedges_capped_at_max_ratio(self):
+        policy = BSSHedgingPolicy(enabled=True, max_ratio=0.25, burst=10, min_samples=1)
+        granted = 0
+        for _ in range(100):
+            policy.hedge_delay('/user')
+            granted += policy.try_acquire()
+        self.assertEqual(granted, 25)
+        stats = policy.get_stats()
+        self.assertEqual((stats['requests'], stats['hedged'], stats['budget_denied']), (100, 25, 75))
+        self.assertEqual(stats['hedge_ratio'], 0.25)
+    
+    def test_budget_accumulates_up_to_burst(self):
+        policy = BSSHedgingPolicy(enabled=True, max_ratio=0.5, burst=2, min_samples=1)
+        for _ in range(20):
+            policy.hedge_delay('/user')
+        self.assertEqual([policy.try_acquire() for _ in range(3)], [True, True, False])
+
+
+class HedgeRaceTests(SimpleTestCase):
+    """对冲竞速"""
+    
+    def test_first_answered_wins_and_aborts_other(self):
+        race = HedgeRace()
+        aborted = []
+        self.assertTrue(race.start_hedge())
+        race.attach(LEG_PRIMARY, lambda: aborted.append(LEG_PRIMARY))
+        self.assertTrue(race.finish(LEG_HEDGE, 'hedge', answered=True))
+        self.assertEqual(aborted, [LEG_PRIMARY])
+        self.assertTrue(race.is_aborted(LEG_PRIMARY))
+        self.assertFalse(race.finish(LEG_PRIMARY, 'primary', answered=True))
+        self.assertEqual(race.wait(), ('hedge', LEG_HEDGE))
+    
+    def test_unanswered_waits_for_other_leg(self):
+        race = HedgeRace()
+        race.start_hedge()
+        self.assertFalse(race.finish(LEG_PRIMARY, 'timeout', answered=False))
+        self.assertFalse(race.done)
+        self.assertTrue(race.finish(LEG_HEDGE, 'hedge', answered=True))
+        self.assertEqual(race.wait(), ('hedge', LEG_HEDGE))
+    
+    def test_both_unanswered_returns_last(self):
+        race = HedgeRace()
+        race.start_hedge()
+        race.finish(LEG_HEDGE, 'refused', answered=False)
+        race.finish(LEG_PRIMARY, 'timeout', answered=False)
+        self.assertEqual(race.wait(), ('timeout', LEG_PRIMARY))
+    
+    def test_no_hedge_after_primary_finished(self):
+        race = HedgeRace()
+        race.finish(LEG_PRIMARY, 'primary', answered=True)
+        self.assertFalse(race.start_hedge())
+    
+    def test_attach_after_abort_closes_immediately(self):
+        race = HedgeRace()
+        race.start_hedge()
+        race.finish(LEG_PRIMARY, 'primary', answered=True)
+        aborted = []
+        race.attach(LEG_HEDGE, lambda: aborted.append(LEG_HEDGE))
+        self.assertEqual(aborted, [LEG_HEDGE])
+
+
+class SlowFirstHandler(BaseHTTPRequestHandler):
+    """第一个请求延迟slow_seconds秒返回，之后的请求立即返回"""
+    
+    counter = None
+    slow_seconds = 3
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if next(self.counter) == 0:
+            time.sleep(self.slow_seconds)
+        body = json.dumps({'code': '0000', 'message': 'ok', 'data': {'user': {'iccid': '8986'}}}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class HedgedClientTests(SimpleTestCase):
+    """BSSAPIClient对冲请求"""
+    
+    def setUp(self):
+        self.counter = itertools.count()
+        handler = type('Handler', (SlowFirstHandler,), {'counter': self.counter})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        
+        self.bss_client = BSSAPIClient()
+        self.bss_client.timeout = 10
+        self.bss_client.gateways = BSSGatewayPool([f'http://127.0.0.1:{server.server_address[1]}'])
+        self.bss_client.hedging = BSSHedgingPolicy(enabled=True, min_samples=1, min_delay=0.1, max_ratio=1, burst=1)
+        self.bss_client.hedging.observe(USER_QUERY_ENDPOINT, 0.1)
+    
+    def test_hedge_answer_wins_and_primary_is_aborted(self):
+        started = time.monotonic()
+        result = self.bss_client.query_user_by_iccid('8986')
+        elapsed = time.monotonic() - started
+        
+        self.assertTrue(result.ok)
+        self.assertLess(elapsed, SlowFirstHandler.slow_seconds)
+        stats = self.bss_client.hedging.get_stats()
+        self.assertEqual((stats['hedged'], stats['hedge_wins']), (1, 1))
+        # 被中止的原请求不计为网关失败，也不切换网关重发
+        gateway_stats, = self.bss_client.gateways.get_stats().values()
+        self.assertEqual((gateway_stats['requests'], gateway_stats['errors'], gateway_stats['in_flight']), (2, 0, 0))
+    
+    def test_fast_primary_sends_no_hedge(self):
+        next(self.counter)
+        self.assertTrue(self.bss_client.query_user_by_iccid('8986').ok)
+        time.sleep(0.2)
+        self.assertEqual(self.bss_client.hedging.get_stats()['hedged'], 0)
+        gateway_stats, = self.bss_client.gateways.get_stats().values()
+        self.assertEqual(gateway_stats['requests'], 1)
@@ -0,0 +1,200 @@
+"""
+身份映射、工作单元及process_iccid_data写入流程测试
+"""
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+
+from apps.document.models import Document
+from apps.ICC.models import ICC
+from services.api_clients import LANE_BULK, LANE_INTERACTIVE
+from services.bss_response import BSSResponse
+from services.data_service import DataService
+from services.identity_map import IdentityMap, document_scope, get_identity_map
+from services.tests.test_data_service import ICCID, OTHER_ICCID, user_payload
+
+OK = (True, "成功")
+
+
+class IdentityMapTests(TestCase):
+    """缓存、淘汰与待写对象"""
+    
+    def setUp(self):
+        DataService().bulk_upsert_iccs([user_payload(ICCID), user_payload(OTHER_ICCID)])
+        self.icc = ICC.objects.get(iccid=ICCID)
+        self.other = ICC.objects.get(iccid=OTHER_ICCID)
+    
+    def test_returns_cached_instance(self):
+        identity_map = IdentityMap()
+        identity_map.add(self.icc, 'iccid')
+        self.assertIs(identity_map.get(ICC, 'iccid', ICCID), self.icc)
+        self.assertIsNone(identity_map.get(ICC, 'iccid', OTHER_ICCID))
+        stats = identity_map.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+    
+    def test_evicts_least_recently_used(self):
+        identity_map = IdentityMap(max_size=1)
+        identity_map.add(self.icc, 'iccid')
+        identity_map.add(self.other, 'iccid')
+        self.assertIsNone(identity_map.get(ICC, 'iccid', ICCID))
+        self.assertIs(identity_map.get(ICC, 'iccid', OTHER_ICCID), self.other)
+        self.assertEqual(identity_map.get_stats()['evictions'], 1)
+    
+    def test_commit_defers_write_until_flush(self):
+        identity_map = IdentityMap()
+        identity_map.begin()
+        self.icc.brand = 'CMCC'
+        identity_map.mark_dirty(self.icc, ['brand'])
+        identity_map.commit()
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CTC')
+        
+        self.assertEqual(identity_map.flush(), 1)
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CMCC')
+        self.assertEqual(identity_map.flush(), 0)
+    
+    def test_rollback_drops_pending_fields_and_evicts_instances(self):
+        identity_map = IdentityMap()
+        identity_map.add(self.icc, 'iccid')
+        identity_map.begin()
+        identity_map.add(self.other, 'iccid')
+        self.icc.brand = 'CMCC'
+        identity_map.mark_dirty(self.icc, ['brand'])
+        identity_map.rollback()
+        
+        self.assertEqual(identity_map.flush(), 0)
+        self.assertIsNone(identity_map.get(ICC, 'iccid', ICCID))
+        self.assertIsNone(identity_map.get(ICC, 'iccid', OTHER_ICCID))
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CTC')
+    
+    def test_rollback_keeps_fields_committed_earlier(self):
+        identity_map = IdentityMap()
+        identity_map.begin()
+        self.icc.brand = 'CMCC'
+        identity_map.mark_dirty(self.icc, ['brand'])
+        identity_map.commit()
+        identity_map.begin()
+        self.other.brand = 'CUCC'
+        identity_map.mark_dirty(self.other, ['brand'])
+        identity_map.rollback()
+        
+        self.assertEqual(identity_map.flush(), 1)
+        self.assertEqual(
+            dict(ICC.objects.values_list('iccid', 'brand')), {ICCID: 'CMCC', OTHER_ICCID: 'CTC'}
+        )
+    
+    def test_flush_groups_by_field_set(self):
+        identity_map = IdentityMap()
+        self.icc.brand, self.other.msisdn = 'CMCC', '8613800000009'
+        identity_map.mark_dirty(self.icc, ['brand'])
+        identity_map.mark_dirty(self.other, ['msisdn'])
+        with mock.patch.object(ICC.objects, 'bulk_update', wraps=ICC.objects.bulk_update) as bulk_update:
+            self.assertEqual(identity_map.flush(), 2)
+        self.assertEqual(sorted(call.args[1] for call in bulk_update.call_args_list), [['brand'], ['msisdn']])
+    
+    def test_scope_is_reset_on_exit(self):
+        with document_scope() as identity_map:
+            self.assertIs(get_identity_map(), identity_map)
+        self.assertIsNone(get_identity_map())
+
+
+class ProcessICCIDUnitOfWorkTests(TestCase):
+    """process_iccid_data的工作单元"""
+    
+    def setUp(self):
+        self.service = DataService()
+        self.service.bulk_upsert_iccs([user_payload(ICCID)])
+        self.document = Document.objects.create(filename='cdr.csv', file_path='/tmp/cdr.csv', file_size=1)
+        self.results = {
+            'user': BSSResponse('queryUser', 200, 'trans', '0000', 'ok', {'user': user_payload(brand='CMCC')}),
+            'subscription': BSSResponse('querySubscription', 200, 'trans', '0000', 'ok', {'list': []}),
+            'usage': BSSResponse('queryUsage', 200, 'trans', '0000', 'ok', {'list': []}),
+        }
+        patcher = mock.patch.object(self.service, '_process_subscription_info', return_value=OK)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_committed_iccid_is_written_at_flush(self):
+        with document_scope() as identity_map:
+            with mock.patch.object(self.service, '_process_usage_info', return_value=OK):
+                success, _ = self.service.process_iccid_data(self.document.id, ICCID, self.results)
+            self.assertTrue(success)
+            # 字段更新在批末合并写入
+            self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CTC')
+            self.assertEqual(identity_map.get(ICC, 'iccid', ICCID).brand, 'CMCC')
+            self.assertEqual(identity_map.flush(), 1)
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CMCC')
+    
+    def test_rolled_back_iccid_discards_dirty_fields(self):
+        with document_scope() as identity_map:
+            with mock.patch.object(self.service, '_process_usage_info', side_effect=RuntimeError('db error')):
+                success, message = self.service.process_iccid_data(self.document.id, ICCID, self.results)
+            self.assertFalse(success)
+            self.assertIn('db error', message)
+            # 回滚的ICCID不写入，内存中已修改的实例被淘汰，下次重新从数据库读取
+            self.assertEqual(identity_map.flush(), 0)
+            self.assertIsNone(identity_map.get(ICC, 'iccid', ICCID))
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CTC')
+    
+    def test_outside_document_scope_saves_immediately(self):
+        with mock.patch.object(self.service, '_process_usage_info', return_value=OK):
+            self.service.process_iccid_data(self.document.id, ICCID, self.results)
+        self.assertEqual(ICC.objects.get(iccid=ICCID).brand, 'CMCC')
+
+
+class ProcessICCIDFetchTests(TestCase):
+    """process_iccid_data在写入事务外获取缺少的响应"""
+    
+    def setUp(self):
+        self.service = DataService()
+        self.service.api_client = mock.Mock()
+        self.document = Document.objects.create(filename='cdr.csv', file_path='/tmp/cdr.csv', file_size=1)
+        self.user = BSSResponse('queryUser', 200, 'trans', '0000', 'ok', {'user': user_payload()})
+    
+    def fetch(self, iccid, usage_params, force_refresh, lane, api_types):
+        self.calls.append('fetch')
+        return {api_type: self.user for api_type in api_types}
+    
+    def test_fetches_only_missing_types_before_transaction(self):
+        self.calls = []
+        self.service.api_client.query_iccid.side_effect = self.fetch
+        atomic = transaction.atomic
+        
+        def record_atomic(*args, **kwargs):
+            self.calls.append('atomic')
+            return atomic(*args, **kwargs)
+        
+        with mock.patch('services.data_service.transaction.atomic', side_effect=record_atomic), \
+                mock.patch.object(self.service, '_process_subscription_info', return_value=OK), \
+                mock.patch.object(self.service, '_process_usage_info', return_value=OK):
+            self.service.process_iccid_data(
+                self.document.id, ICCID, {'user': self.user, 'subscription': self.user, 'usage': self.user}
+            )
+            self.assertNotIn('fetch', self.calls)
+            
+            self.calls.clear()
+            success, _ = self.service.process_iccid_data(
+                self.document.id, ICCID, {'user': self.user}, usage_params={'begin_date': '20250101'}
+            )
+        
+        # 获取阶段在写入事务开始前完成
+        self.assertTrue(success)
+        self.assertEqual(self.calls[:2], ['fetch', 'atomic'])
+        self.assertEqual(self.calls.count('fetch'), 1)
+        self.service.api_client.query_iccid.assert_called_once_with(
+            ICCID, {'begin_date': '20250101'}, False, LANE_BULK, ['subscription', 'usage']
+        )
+    
+    def test_missing_usage_uses_sync_mark(self):
+        self.calls = []
+        self.service.api_client.query_iccid.side_effect = self.fetch
+        with mock.patch.object(self.service, 'get_usage_params', return_value={ICCID: {'begin_date': '20250301'}}), \
+                mock.patch.object(self.service, '_process_subscription_info', return_value=OK), \
+                mock.patch.object(self.service, '_process_usage_info', return_value=OK):
+            self.service.process_iccid_data(
+                self.document.id, ICCID, {'user': self.user, 'subscription': self.user}, lane=LANE_INTERACTIVE
+            )
+        
+        self.service.api_client.query_iccid.assert_called_once_with(
+            ICCID, {'begin_date': '20250301'}, False, LANE_INTERACTIVE, ['usage']
+        )
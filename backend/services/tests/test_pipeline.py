@@ -0,0 +1,88 @@
+"""
+文档处理流水线测试
+"""
+import threading
+
+from django.test import SimpleTestCase
+
+from services.pipeline import DocumentPipeline
+
+
+class DocumentPipelineTests(SimpleTestCase):
+    """获取、转换、写入三阶段"""
+    
+    def setUp(self):
+        self.written = []
+        self.batches = []
+        self.write_threads = set()
+    
+    def write(self, batch):
+        self.write_threads.add(threading.get_ident())
+        self.batches.append(len(batch))
+        self.written.extend(batch)
+    
+    def test_writes_all_results_in_batches_on_caller_thread(self):
+        pipeline = DocumentPipeline(transform_workers=3, queue_size=4, write_batch_size=10)
+        pipeline.run(range(25), lambda item: item * 2, self.write)
+        self.assertEqual(sorted(self.written), [item * 2 for item in range(25)])
+        self.assertEqual(self.batches, [10, 10, 5])
+        self.assertEqual(self.write_threads, {threading.get_ident()})
+        stats = pipeline.get_stats()
+        self.assertEqual((stats['fetch']['items'], stats['transform']['items'], stats['write']['items']), (25, 25, 25))
+        self.assertLessEqual(stats['queues']['fetched']['max_depth'], 4)
+    
+    def test_transform_error_is_raised_after_writing_transformed_results(self):
+        transformed = threading.Event()
+        
+        def transform(item):
+            if item == 5:
+                # 先让之前的结果进入写入队列
+                transformed.wait(2)
+                raise ValueError('bad item')
+            if item == 4:
+                transformed.set()
+            return item
+        
+        pipeline = DocumentPipeline(transform_workers=1, write_batch_size=100)
+        with self.assertRaisesMessage(ValueError, 'bad item'):
+            pipeline.run(range(100), transform, self.write)
+        self.assertEqual(self.written, [0, 1, 2, 3, 4])
+    
+    def test_source_error_stops_fetch_and_is_raised(self):
+        def source():
+            yield from range(3)
+            raise RuntimeError('circuit open')
+        
+        pipeline = DocumentPipeline(transform_workers=2)
+        with self.assertRaisesMessage(RuntimeError, 'circuit open'):
+            pipeline.run(source(), lambda item: item, self.write)
+        self.assertEqual(sorted(self.written), [0, 1, 2])
+    
+    def test_write_error_stops_pipeline_and_closes_source(self):
+        closed = threading.Event()
+        
+        def source():
+            try:
+                for item in range(10000):
+                    yield item
+            finally:
+                closed.set()
+        
+        def write(batch):
+            raise IOError('db down')
+        
+        pipeline = DocumentPipeline(transform_workers=2, queue_size=10, write_batch_size=5)
+        with self.assertRaisesMessage(IOError, 'db down'):
+            pipeline.run(source(), lambda item: item, write)
+        self.assertTrue(closed.is_set())
+        self.assertLess(pipeline.get_stats()['fetch']['items'], 10000)
+    
+    def test_first_error_wins(self):
+        def transform(item):
+            raise KeyError(item)
+        
+        pipeline = DocumentPipeline(transform_workers=1)
+        with self.assertRaises(KeyError) as raised:
+            pipeline.run(range(5), transform, self.write)
+        self.assertEqual(raised.exception.args, (0,))
+        self.assertEqual(self.written, [])
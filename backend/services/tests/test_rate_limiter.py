@@ -0,0 +1,98 @@
+"""
+集群令牌桶限流器测试
+"""
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.rate_limiter import BSSRateLimiter
+from services.tests.utils import requires_fakeredis, patch_redis
+
+
+@requires_fakeredis
+class TokenBucketTests(SimpleTestCase):
+    """令牌桶与自适应速率系数（Lua脚本）"""
+    
+    def setUp(self):
+        patcher, self.redis = patch_redis('services.rate_limiter')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def limiter(self, rate=10, burst=3, **kwargs):
+        return BSSRateLimiter(limits={'user': {'rate': rate, 'burst': burst}}, **kwargs)
+    
+    def factor(self):
+        return float(self.redis.hget('bss:ratelimit:user', 'factor') or 1)
+    
+    def test_burst_then_wait(self):
+        limiter = self.limiter(rate=1, burst=3)
+        self.assertEqual([limiter._try_acquire('user') for _ in range(3)], [0, 0, 0])
+        wait = limiter._try_acquire('user')
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1.0)
+        self.assertFalse(limiter.acquire('user', timeout=0))
+    
+    def test_tokens_refill_over_time(self):
+        limiter = self.limiter(rate=100, burst=1)
+        self.assertEqual(limiter._try_acquire('user'), 0)
+        self.assertGreater(limiter._try_acquire('user'), 0)
+        time.sleep(0.03)
+        self.assertEqual(limiter._try_acquire('user'), 0)
+        self.assertTrue(limiter.acquire('user', timeout=1))
+    
+    def test_unlimited_api_type_skips_redis(self):
+        limiter = self.limiter()
+        with mock.patch.object(limiter, '_get_scripts') as scripts:
+            self.assertTrue(limiter.acquire('usage'))
+            limiter.record('usage', True, 0.1)
+        scripts.assert_not_called()
+    
+    def test_failure_decreases_factor_with_interval(self):
+        limiter = self.limiter(decrease_ratio=0.5, decrease_interval=60)
+        limiter.record('user', True, 0.1)
+        self.assertAlmostEqual(self.factor(), 0.5)
+        # 降速间隔内其他失败不再降速
+        limiter.record('user', True, 0.1)
+        limiter.record('user', False, 10)
+        self.assertAlmostEqual(self.factor(), 0.5)
+    
+    def test_factor_not_below_min(self):
+        limiter = self.limiter(decrease_ratio=0.1, min_factor=0.2, decrease_interval=0)
+        for _ in range(3):
+            limiter.record('user', True, 0.1)
+        self.assertAlmostEqual(self.factor(), 0.2)
+    
+    def test_successes_increase_factor_back_to_one(self):
+        limiter = self.limiter(decrease_ratio=0.5, increase_step=0.25, increase_every=3)
+        limiter.record('user', True, 0.1)
+        for _ in range(5):
+            limiter.record('user', False, 0.1)
+        self.assertAlmostEqual(self.factor(), 0.75)
+        for _ in range(9):
+            limiter.record('user', False, 0.1)
+        self.assertAlmostEqual(self.factor(), 1.0)
+    
+    def test_factor_slows_refill(self):
+        limiter = self.limiter(rate=10, burst=1, decrease_ratio=0.5)
+        limiter.record('user', True, 0.1)
+        self.assertEqual(limiter._try_acquire('user'), 0)
+        # 速率减半后补充一个令牌需要约200毫秒
+        self.assertGreater(limiter._try_acquire('user'), 0.15)
+    
+    def test_status(self):
+        limiter = self.limiter(rate=5, burst=2)
+        limiter._try_acquire('user')
+        status = limiter.get_status()['user']
+        self.assertEqual((status['rate'], status['burst'], status['factor']), (5, 2, 1.0))
+        self.assertAlmostEqual(status['tokens'], 1, places=1)
+
+
+class RateLimiterRedisUnavailableTests(SimpleTestCase):
+    """Redis不可用时放行"""
+    
+    def test_acquire_allows_when_redis_fails(self):
+        limiter = BSSRateLimiter(limits={'user': {'rate': 1, 'burst': 1}})
+        with mock.patch('services.rate_limiter.get_redis_connection', side_effect=ConnectionError('down')):
+            self.assertTrue(limiter.acquire('user', timeout=0))
+            limiter.record('user', True, 0.1)
@@ -0,0 +1,93 @@
+"""
+重试策略测试
+"""
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from services.bss_response import BSSResponse, REQUEST_ERROR, PARSE_ERROR, UNKNOWN_ERROR
+from services.retry_policy import (
+    RetryPolicy, RetryScheduler, RESULT_SUCCESS, RESULT_RETRYABLE, RESULT_PERMANENT,
+)
+
+
+def response(status_code=200, code=None, error=None):
+    return BSSResponse('queryUser', status_code=status_code, code=code, error=error)
+
+
+class RetryPolicyClassifyTests(SimpleTestCase):
+    """响应分类"""
+    
+    def setUp(self):
+        self.policy = RetryPolicy(retryable_codes=['1001'])
+    
+    def test_success(self):
+        self.assertEqual(self.policy.classify(response(code='0000')), RESULT_SUCCESS)
+    
+    def test_timeout_or_connection_error_is_retryable(self):
+        self.assertEqual(self.policy.classify(response(None, error=REQUEST_ERROR)), RESULT_RETRYABLE)
+    
+    def test_retryable_http_status(self):
+        for status_code in (500, 502, 503, 429):
+            with self.subTest(status_code=status_code):
+                self.assertEqual(self.policy.classify(response(status_code, error=REQUEST_ERROR)), RESULT_RETRYABLE)
+                self.assertEqual(self.policy.classify(response(status_code, code='9999')), RESULT_RETRYABLE)
+    
+    def test_client_error_is_permanent_even_if_unparsable(self):
+        for error in (REQUEST_ERROR, PARSE_ERROR, None):
+            with self.subTest(error=error):
+                self.assertEqual(self.policy.classify(response(404, error=error)), RESULT_PERMANENT)
+    
+    def test_parse_error_without_client_error_is_retryable(self):
+        self.assertEqual(self.policy.classify(response(200, error=PARSE_ERROR)), RESULT_RETRYABLE)
+        self.assertEqual(self.policy.classify(response(None, error=PARSE_ERROR)), RESULT_RETRYABLE)
+    
+    def test_unknown_error_is_permanent(self):
+        self.assertEqual(self.policy.classify(response(None, error=UNKNOWN_ERROR)), RESULT_PERMANENT)
+    
+    def test_business_codes(self):
+        self.assertEqual(self.policy.classify(response(code='1001')), RESULT_RETRYABLE)
+        self.assertEqual(self.policy.classify(response(code='2001')), RESULT_PERMANENT)
+
+
+class RetryPolicyBackoffTests(SimpleTestCase):
+    """重试次数与退避间隔"""
+    
+    def test_should_retry_stops_at_max_retries(self):
+        policy = RetryPolicy(max_retries=2)
+        failed = response(503, error=REQUEST_ERROR)
+        self.assertTrue(policy.should_retry(failed, 0))
+        self.assertTrue(policy.should_retry(failed, 1))
+        self.assertFalse(policy.should_retry(failed, 2))
+        self.assertFalse(policy.should_retry(response(400, error=REQUEST_ERROR), 0))
+    
+    def test_delay_grows_exponentially_up_to_max_delay(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5, multiplier=2)
+        with mock.patch('services.retry_policy.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([policy.compute_delay(attempt) for attempt in range(5)], [1, 2, 4, 5, 5])
+    
+    def test_delay_uses_full_jitter(self):
+        policy = RetryPolicy(base_delay=1, max_delay=30, multiplier=2)
+        for _ in range(100):
+            self.assertTrue(0 <= policy.compute_delay(3) <= 8)
+
+
+class RetrySchedulerTests(SimpleTestCase):
+    """延迟重试调度"""
+    
+    def test_callbacks_run_in_due_order(self):
+        scheduler = RetryScheduler()
+        order = []
+        done = threading.Event()
+        scheduler.schedule(0.1, lambda: (order.append('late'), done.set()))
+        scheduler.schedule(0.01, lambda: order.append('early'))
+        self.assertTrue(done.wait(2))
+        self.assertEqual(order, ['early', 'late'])
+    
+    def test_failing_callback_does_not_stop_scheduler(self):
+        scheduler = RetryScheduler()
+        done = threading.Event()
+        scheduler.schedule(0, lambda: 1 / 0)
+        scheduler.schedule(0.01, done.set)
+        self.assertTrue(done.wait(2))
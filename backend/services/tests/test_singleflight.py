@@ -0,0 +1,116 @@
+"""
+BSS请求合并测试
+"""
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from services.bss_response import BSSResponse, SOURCE_SHARED
+from services.singleflight import BSSSingleFlight
+from services.tests.utils import requires_fakeredis, patch_redis
+
+
+class LocalJoinTests(SimpleTestCase):
+    """进程内合并"""
+    
+    def test_followers_share_leader_future(self):
+        singleflight = BSSSingleFlight()
+        future, leader = singleflight.join('user:8986')
+        shared, follower_leader = singleflight.join('user:8986')
+        self.assertTrue(leader)
+        self.assertFalse(follower_leader)
+        self.assertIs(shared, future)
+        self.assertEqual(singleflight.get_stats()['local_shared'], 1)
+    
+    def test_done_query_leaves_inflight(self):
+        singleflight = BSSSingleFlight()
+        future, _ = singleflight.join('user:8986')
+        future.set_result('done')
+        next_future, leader = singleflight.join('user:8986')
+        self.assertTrue(leader)
+        self.assertIsNot(next_future, future)
+    
+    def test_disabled_never_shares(self):
+        singleflight = BSSSingleFlight(enabled=False)
+        first, _ = singleflight.join('user:8986')
+        second, leader = singleflight.join('user:8986')
+        self.assertTrue(leader)
+        self.assertIsNot(first, second)
+        self.assertEqual(singleflight.acquire('user:8986'), (None, None))
+    
+    def test_lease_only_for_first_attempt_of_shared_types(self):
+        singleflight = BSSSingleFlight()
+        self.assertTrue(singleflight.shares_remotely('user'))
+        self.assertTrue(singleflight.shares_remotely('subscription'))
+        self.assertFalse(singleflight.shares_remotely('usage'))
+        self.assertFalse(singleflight.shares_remotely('user', attempt=1))
+        self.assertFalse(BSSSingleFlight(enabled=False).shares_remotely('user'))
+    
+    def test_poll_backs_off_within_max_wait(self):
+        singleflight = BSSSingleFlight(lease_timeout=30, max_wait=1000, poll_interval=0.05, max_poll_interval=0.4)
+        delays = singleflight._poll_delays()
+        self.assertEqual([round(next(delays), 2) for _ in range(6)], [0.05, 0.1, 0.2, 0.4, 0.4, 0.4])
+    
+    def test_key_includes_params(self):
+        make_key = BSSSingleFlight.make_key
+        self.assertEqual(make_key('user', '8986'), 'user:8986')
+        self.assertEqual(make_key('usage', '8986', {'b': '1', 'a': '2'}), make_key('usage', '8986', {'a': '2', 'b': '1'}))
+        self.assertNotEqual(make_key('usage', '8986', {'a': '1'}), make_key('usage', '8986', {'a': '2'}))
+
+
+@requires_fakeredis
+class RemoteLeaseTests(SimpleTestCase):
+    """跨worker租约与结果发布"""
+    
+    def setUp(self):
+        patcher, self.redis = patch_redis('services.singleflight')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.singleflight = BSSSingleFlight(lease_timeout=5, max_wait=2, poll_interval=0.01)
+    
+    def test_waiter_receives_published_result(self):
+        _, token = self.singleflight.acquire('user:8986')
+        self.assertIsNotNone(token)
+        received = []
+        waiter = threading.Thread(target=lambda: received.append(self.singleflight.acquire('user:8986')))
+        waiter.start()
+        time.sleep(0.05)
+        self.singleflight.publish('user:8986', token, BSSResponse('queryUser', 200, 'trans-1', '0000', 'ok', {'user': 1}))
+        waiter.join(2)
+        (result, waiter_token), = received
+        self.assertIsNone(waiter_token)
+        self.assertEqual(result.source, SOURCE_SHARED)
+        self.assertEqual((result.trans_id, result.get_data('user')), ('trans-1', 1))
+        self.assertFalse(self.redis.exists('bss:singleflight:lease:user:8986'))
+    
+    def test_failed_leader_releases_lease_to_waiter(self):
+        _, token = self.singleflight.acquire('user:8986')
+        self.singleflight.publish('user:8986', token, None)
+        result, next_token = self.singleflight.acquire('user:8986')
+        self.assertIsNone(result)
+        self.assertIsNotNone(next_token)
+    
+    def test_only_owner_releases_lease(self):
+        _, token = self.singleflight.acquire('user:8986')
+        self.singleflight.publish('user:8986', 'other-token', None)
+        self.assertEqual(self.redis.get('bss:singleflight:lease:user:8986').decode(), token)
+    
+    def test_wait_is_capped_at_max_wait(self):
+        singleflight = BSSSingleFlight(lease_timeout=30, max_wait=0.1, poll_interval=0.01)
+        singleflight.acquire('user:8986')
+        started = time.monotonic()
+        self.assertEqual(singleflight.acquire('user:8986'), (None, None))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(singleflight.get_stats()['wait_timeouts'], 1)
+    
+    def test_max_wait_never_exceeds_lease(self):
+        self.assertEqual(BSSSingleFlight(lease_timeout=3, max_wait=10).max_wait, 3)
+    
+    def test_async_acquire_returns_published_result(self):
+        _, token = self.singleflight.acquire('user:8986')
+        self.singleflight.publish('user:8986', token, BSSResponse('queryUser', 200, 't', '0000', 'ok', {}))
+        result, waiter_token = asyncio.run(self.singleflight.acquire_async('user:8986'))
+        self.assertEqual(result.source, SOURCE_SHARED)
+        self.assertIsNone(waiter_token)
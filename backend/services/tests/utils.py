@@ -0,0 +1,25 @@
+"""
+测试辅助：以fakeredis代替django_redis连接，未安装fakeredis[lua]时跳过依赖Redis脚本的测试
+"""
+import unittest
+from unittest import mock
+
+try:
+    import fakeredis
+    fakeredis.FakeRedis().eval('return 1', 0)
+    HAS_FAKEREDIS = True
+except Exception:  # 未安装fakeredis或缺少Lua支持（lupa）
+    HAS_FAKEREDIS = False
+
+requires_fakeredis = unittest.skipUnless(HAS_FAKEREDIS, '需要安装 fakeredis[lua]')
+
+
+def patch_redis(module: str):
+    """
+    将模块中的get_redis_connection替换为返回同一个fakeredis实例
+    
+    Returns:
+        (patcher, redis)
+    """
+    redis = fakeredis.FakeRedis()
+    return mock.patch(f'{module}.get_redis_connection', return_value=redis), redis
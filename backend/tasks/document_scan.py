@@ -1,11 +1,15 @@
 """
 文档扫描和处理任务
 """
+import asyncio
 import logging
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 
 from apps.document.models import Document
+from services.api_clients import LANE_BULK, LANE_INTERACTIVE
+from services.circuit_breaker import BSSUnavailableError
 from services.document_handler import document_handler
 
 logger = logging.getLogger(__name__)
@@ -61,12 +65,13 @@ def scan_and_process_documents(self):
 
 
 @shared_task(bind=True, max_retries=2)
-def process_document(self, document_id: int):
+def process_document(self, document_id: int, lane: str = LANE_BULK):
     """
     处理单个文档
     
     Args:
         document_id: 文档ID
+        lane: BSS请求通道（管理员重试的文档使用交互通道）
     """
     try:
         logger.info(f"开始处理文档: {document_id}")
@@ -77,8 +82,11 @@ def process_document(self, document_id: int):
         # 标记为处理中
         document.mark_as_processing()
         
-        # 处理文档
-        success = document_handler.process_document(document_id)
+        # 处理文档（开启异步模式时批量文档在事件循环内并发请求BSS，异步查询只走批量通道）
+        if getattr(settings, 'BSS_API_ASYNC_ENABLED', False) and lane == LANE_BULK:
+            success = asyncio.run(document_handler.process_document_async(document_id))
+        else:
+            success = document_handler.process_document(document_id, lane)
         
         if success:
             logger.info(f"文档处理成功: {document.filename}")
@@ -90,6 +98,16 @@ def process_document(self, document_id: int):
     except Document.DoesNotExist:
         logger.error(f"文档记录不存在: {document_id}")
         return f"文档记录不存在: {document_id}"
+    except BSSUnavailableError as e:
+        # BSS熔断：文档已暂停，冷却后重新排队（不计入普通失败重试次数）
+        max_requeues = getattr(settings, 'BSS_CIRCUIT_MAX_REQUEUES', 20)
+        if self.request.retries >= max_requeues:
+            # 重新排队次数用尽：标记失败，由管理员在BSS恢复后重试
+            logger.error(f"BSS持续不可用，文档 {document_id} 已重新排队 {max_requeues} 次，标记为失败")
+            document_handler.fail_document(document_id, f"BSS持续不可用，重新排队{max_requeues}次后放弃: {str(e)}")
+            return f"文档处理失败: BSS持续不可用 {document_id}"
+        logger.warning(f"BSS不可用，文档 {document_id} 将在 {e.retry_after} 秒后重新排队")
+        raise self.retry(countdown=e.retry_after, exc=e, max_retries=max_requeues)
     except Exception as e:
         logger.error(f"处理文档任务失败: {str(e)}")
         # 重试任务
@@ -123,8 +141,12 @@ def retry_failed_document(self, document_id: int):
         document.failed_iccid_count = 0
         document.save()
         
-        # 重新处理文档
-        process_document.delay(document_id)
+        # 重新处理文档：进入交互队列，BSS请求使用交互通道的预留名额，不排在批量导入之后
+        process_document.apply_async(
+            args=(document_id,),
+            kwargs={'lane': LANE_INTERACTIVE},
+            queue=getattr(settings, 'BSS_INTERACTIVE_QUEUE', 'interactive') or None
+        )
         
         logger.info(f"文档已加入重试队列: {document.filename}")
         return f"文档已加入重试队列: {document.filename}"
@@ -147,6 +169,7 @@ def retry_badcase(self, badcase_id: int):
     """
     try:
         from apps.document.models import BadCase
+        from services.badcase_recorder import badcase_recorder
         from services.data_service import data_service
         
         logger.info(f"重试错误案例: {badcase_id}")
@@ -161,11 +184,15 @@ def retry_badcase(self, badcase_id: int):
         # 增加重试次数
         badcase.increment_retry()
         
-        # 重新处理该ICCID
+        # 重新处理该ICCID（跳过响应缓存，避免重放缓存中的旧数据；使用交互通道的预留名额，不排在批量导入之后）
         success, error_msg = data_service.process_iccid_data(
             badcase.document.id, 
-            badcase.iccid
+            badcase.iccid,
+            force_refresh=True,
+            lane=LANE_INTERACTIVE
         )
+        # 重试结果立即写入，不等待缓冲到期
+        badcase_recorder.flush()
         
         if success:
             logger.info(f"错误案例重试成功: {badcase.iccid}")